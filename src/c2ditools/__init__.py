@@ -11,5 +11,6 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-from . import archives
-from . import scene
+from .tools import lazy_submodules
+
+__getattr__ = lazy_submodules(__name__, ("archives", "scene", "benchmarks", "api"))
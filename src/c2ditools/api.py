@@ -0,0 +1,183 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import io
+import mmap
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+from xml.etree import ElementTree
+
+from .scene.scene_dec import convert_scene_xml, read_string_table
+from .scene.scene_enc import convert_xml_scene, get_sidecar_count_for_size
+from .scene.scene_index import open_scene_buffer, scan_nodes, decode_payload
+from .scene.scene_json import convert_scene_json, convert_json_scene
+from .scene.scene_swap import swap_scene
+from .scene.scene_types import SceneHeader, SceneNode, get_type_layout
+from .utils import Endianness, StreamSlice
+
+if TYPE_CHECKING:
+    # archive_utils needs PyCryptodome
+    from .archives.archive_reader import ArchiveReader
+    from .archives.archive_utils import ArchiveMemberType
+
+SceneInputType = bytes | bytearray | memoryview | BinaryIO
+
+
+def _as_stream(data: SceneInputType) -> BinaryIO:
+    return io.BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+
+
+def _write_or_return(write_func, output_stream: Optional[BinaryIO]) -> Optional[bytes]:
+    if output_stream is not None:
+        write_func(output_stream)
+        return None
+    buffer = io.BytesIO()
+    write_func(buffer)
+    return buffer.getvalue()
+
+
+def get_scene_endianness(data: SceneInputType) -> Endianness:
+    input_stream = _as_stream(data)
+    start_pos = input_stream.tell()
+    endianness = SceneHeader.from_file(input_stream).endianness
+    input_stream.seek(start_pos)
+    return endianness
+
+
+def decode_scene(data: SceneInputType, textures: Optional[Dict[str, bytes]] = None,
+                 strict: bool = True) -> ElementTree.Element:
+    """Converts a scene to the xml scene_dec writes. If textures is given the texture data gets stored in it instead
+    of the xml. Textures with the same name are stored as name_1.dds, name_2.dds and so on."""
+    def store_texture(parent_element: ElementTree.Element, element: ElementTree.Element,
+                      dds_data: StreamSlice) -> bool:
+        if parent_element.tag == "Texture" and element.tag == "Data":
+            name = parent_element.find('./Name').text
+            filename = f"{name}.dds"
+            # textures can share a name, the later ones get a suffix so none gets overwritten
+            suffix = 1
+            while filename in textures:
+                filename = f"{name}_{suffix}.dds"
+                suffix += 1
+            textures[filename] = b"".join(dds_data)
+            element.set("filepath", filename)
+            return True
+        return False
+
+    return convert_scene_xml(_as_stream(data), store_texture if textures is not None else None, strict)
+
+
+def encode_scene(root: ElementTree.Element | str, endianness: Endianness,
+                 textures: Optional[Mapping[str, bytes]] = None,
+                 output_stream: Optional[BinaryIO] = None) -> Optional[bytes]:
+    """Converts xml like scene_enc does. Files referenced by filepath attributes are taken from textures.
+    Returns the scene if no output_stream is given."""
+    if isinstance(root, str):
+        root = ElementTree.fromstring(root)
+
+    # checking before writing anything like scene_enc does
+    sidecar_counts = {}
+    for element in root.iter():
+        if filepath := element.get("filepath"):
+            if textures is None or filepath not in textures:
+                raise ValueError(f"This xml requires the file {filepath} which is not in textures.")
+            sidecar_counts[element] = get_sidecar_count_for_size(element, filepath, len(textures[filepath]))
+
+    def read_texture(_: ElementTree.Element, element: ElementTree.Element) -> Tuple[int, Iterable[bytes]] | None:
+        if element in sidecar_counts:
+            return sidecar_counts[element], (textures[element.get("filepath")],)
+        return None
+
+    return _write_or_return(lambda stream: convert_xml_scene(root, stream, endianness, read_texture),
+                            output_stream)
+
+
+class SceneEvent:
+    __slots__ = "level", "name", "type_name", "value", "offset"
+
+    def __init__(self, level: int, name: str, type_name: Optional[str], value: Any, offset: int):
+        self.level = level
+        self.name = name
+        self.type_name = type_name  # None for nodes without a value
+        self.value = value
+        self.offset = offset
+
+    def __repr__(self) -> str:
+        return f"SceneEvent({self.level}, {self.name!r}, {self.type_name!r}, {self.value!r}, {hex(self.offset)})"
+
+
+def iter_scene_events(data: SceneInputType) -> Iterator[Tuple[str, SceneEvent]]:
+    """Yields ("start", node) and ("end", node) for every node like ElementTree.iterparse without building a tree.
+    The values are python values like scene_query returns them. A stream is read from its current position to its end
+    and the offsets are relative to that position."""
+    input_stream = _as_stream(data)
+    scene_start = input_stream.tell()
+    header = SceneHeader.from_file(input_stream)
+    string_table = read_string_table(input_stream, header.string_table_size)
+    tree_start = input_stream.tell() + SceneNode.get_size()  # skipping root node
+
+    # the buffer always starts at the beginning of the file
+    buffer = data if isinstance(data, (bytes, bytearray, memoryview)) else open_scene_buffer(input_stream)
+    open_nodes: List[SceneEvent] = []
+    try:
+        for offset, scene_node in scan_nodes(buffer, tree_start, len(buffer), header.endianness):
+            while open_nodes and open_nodes[-1].level >= scene_node.level:
+                yield "end", open_nodes.pop()
+            layout = get_type_layout(scene_node.type_int, offset - scene_start)
+            event = SceneEvent(scene_node.level, string_table[scene_node.str_index], layout.name,
+                               decode_payload(buffer, offset + SceneNode.get_size(), layout, header.endianness,
+                                              string_table), offset - scene_start)
+            open_nodes.append(event)
+            yield "start", event
+        while open_nodes:
+            yield "end", open_nodes.pop()
+    finally:
+        if isinstance(buffer, mmap.mmap):
+            buffer.close()
+
+
+def scene_to_json(data: SceneInputType) -> Tuple[dict, bytes]:
+    """Converts a scene like scene_dec --format json. Returns the json document and the content of the .bin file."""
+    sidecar_stream = io.BytesIO()
+    document = convert_scene_json(_as_stream(data), sidecar_stream)
+    return document, sidecar_stream.getvalue()
+
+
+def json_to_scene(document: dict, sidecar: bytes, endianness: Optional[Endianness] = None,
+                  output_stream: Optional[BinaryIO] = None) -> Optional[bytes]:
+    """Converts a document created by scene_to_json back. Returns the scene if no output_stream is given."""
+    return _write_or_return(lambda stream: convert_json_scene(document, sidecar, stream, endianness), output_stream)
+
+
+def swap_scene_endianness(data: SceneInputType, output_stream: Optional[BinaryIO] = None) -> Optional[bytes]:
+    """Converts a scene between pc (little endian) and console (big endian)."""
+    return _write_or_return(lambda stream: swap_scene(_as_stream(data), stream), output_stream)
+
+
+def pack_why(members: Iterable["ArchiveMemberType"], output_stream: Optional[BinaryIO] = None) -> Optional[bytes]:
+    """Packs an archive like why does. members are (name, bytes or binary stream) pairs."""
+    from .archives import why
+    return _write_or_return(lambda stream: why.write_archive(members, stream), output_stream)
+
+
+def pack_whyjustwhy(members: Iterable["ArchiveMemberType"],
+                    output_stream: Optional[BinaryIO] = None) -> Optional[bytes]:
+    """Packs an encrypted archive like whyjustwhy does. members are (name, bytes or binary stream) pairs."""
+    # imported here so PyCryptodome and mmh3 are only needed for this
+    from .archives import whyjustwhy
+    return _write_or_return(lambda stream: whyjustwhy.write_archive(members, stream), output_stream)
+
+
+def open_archive(archive_path: str) -> "ArchiveReader":
+    """Opens a zip, why or whyjustwhy archive. Its members can be passed to the scene functions without extracting
+    them."""
+    from .archives.archive_reader import ArchiveReader
+    return ArchiveReader(archive_path)
@@ -11,4 +11,6 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-from . import why, whyjustwhy
+from ..tools import lazy_submodules
+
+__getattr__ = lazy_submodules(__name__, ("why", "whyjustwhy", "archive_reader"))
@@ -0,0 +1,295 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import fnmatch
+import io
+import mmap
+import os
+import posixpath
+import struct
+import zipfile
+import zlib
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple
+
+from Crypto.Cipher import AES
+
+from .archive_utils import ZipDirEntry, ZipEndLocator, ZipFileRecord, ENC_KEY
+
+FORMAT_ZIP = "zip"
+FORMAT_WHY = "why"  # funky zip with the directory in front
+FORMAT_DI3 = "di3"  # encrypted like whyjustwhy
+
+_END_LOCATOR_SIZE = 22
+_RECORD_SIZE = 30
+_ENCRYPTED_SIZE = 0x200  # only the start of every record is encrypted
+_INFLATE_STEP = 0x10000
+
+
+def _decrypt(data: bytes, keystream_offset: int = 0) -> bytes:
+    cipher = AES.new(ENC_KEY, AES.MODE_CTR, nonce=b"")
+    if keystream_offset:
+        cipher.decrypt(b"\x00" * keystream_offset)
+    return cipher.decrypt(data)
+
+
+def get_safe_member_path(name: str, out_folder: str) -> Optional[str]:
+    """Returns where a member gets stored inside of out_folder or None if its name would leave out_folder, which
+    archives downloaded from somewhere could use to overwrite any file."""
+    normalized = posixpath.normpath(name.replace("\\", "/"))
+    if normalized.startswith("/") or normalized == ".." or normalized.startswith("../") or normalized == "." \
+            or os.path.splitdrive(normalized)[0] or os.path.isabs(normalized):
+        return None
+    out_folder = os.path.abspath(out_folder)
+    out_path = os.path.abspath(os.path.join(out_folder, *normalized.split("/")))
+    if os.path.commonpath((out_folder, out_path)) != out_folder:
+        return None
+    return out_path
+
+
+class MemoryStream(io.RawIOBase):
+    """A seekable read only stream over a buffer like a mmap that doesn't copy the buffer."""
+
+    def __init__(self, buffer: memoryview):
+        super().__init__()
+        self._buffer = buffer
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        size = max(min(len(target), len(self._buffer) - self._pos), 0)
+        target[:size] = self._buffer[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def readall(self) -> bytes:
+        data = bytes(self._buffer[self._pos:])
+        self._pos = len(self._buffer)
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: len(self._buffer)}[whence]
+        if base + offset < 0:
+            raise ValueError("Negative seek position.")
+        self._pos = base + offset
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._buffer.release()
+        super().close()
+
+
+class InflatingStream(io.RawIOBase):
+    """A seekable stream that decompresses a deflated member while it is read. Seeking backwards starts over."""
+
+    def __init__(self, chunks: Sequence[bytes | memoryview], size: int):
+        super().__init__()
+        self._chunks = chunks
+        self._size = size
+        self._restart()
+
+    def _restart(self):
+        self._decompressor = zlib.decompressobj(-15)
+        self._inputs = (chunk[offset:offset + _INFLATE_STEP] for chunk in self._chunks
+                        for offset in range(0, len(chunk), _INFLATE_STEP))
+        self._pos = 0
+
+    def _inflate(self, size: int) -> bytes:
+        parts = []
+        while size > 0 and not self._decompressor.eof:
+            data = self._decompressor.unconsumed_tail or next(self._inputs, b"")
+            if not data:
+                raise ValueError("The compressed data ends too early.")
+            part = self._decompressor.decompress(data, size)
+            parts.append(part)
+            size -= len(part)
+        data = b"".join(parts)
+        self._pos += len(data)
+        return data
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        data = self._inflate(min(len(target), self._size - self._pos))
+        target[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        target = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self._size}[whence] + offset
+        if target < 0:
+            raise ValueError("Negative seek position.")
+        if target < self._pos:
+            self._restart()
+        while self._pos < min(target, self._size):
+            self._inflate(min(target, self._size) - self._pos)
+        self._pos = max(self._pos, target)  # past the end like files
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self):
+        self._chunks = ()
+        self._inputs = iter(())
+        super().close()
+
+
+class ArchiveEntry:
+    def __init__(self, name: str, compress_type: int, crc32: int, compress_size: int, file_size: int,
+                 header_offset: int):
+        self.name = name
+        self.compress_type = compress_type
+        self.crc32 = crc32
+        self.compress_size = compress_size
+        self.file_size = file_size
+        self.header_offset = header_offset
+
+
+class ArchiveReader:
+    """Reads members of normal zips, zips created by why and encrypted Disney Infinity 3.0 zips without extracting
+    them. The archive gets mapped into memory, members are only decompressed and decrypted while they are read."""
+
+    def __init__(self, archive_path: str):
+        self.archive_path = archive_path
+        with open(archive_path, "rb") as archive_file:
+            try:
+                self._mmap = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                raise ValueError(f"{archive_path} is not an archive.")
+        try:
+            self.format, self.entries = self._read_directory()
+        except Exception:
+            self._mmap.close()
+            raise
+
+    def _read_directory(self) -> Tuple[str, Dict[str, ArchiveEntry]]:
+        data = self._mmap
+        if _decrypt(data[:4]) == b"PK\xff\xff":
+            archive_format = FORMAT_DI3
+            end_locator = ZipEndLocator.from_file(io.BytesIO(_decrypt(data[-_END_LOCATOR_SIZE:])), 0)
+            # all directory entries are encrypted as one, starting after the end locator
+            directory = _decrypt(data[end_locator.directory_offset:
+                                      end_locator.directory_offset + end_locator.directory_size], _END_LOCATOR_SIZE)
+        else:
+            archive_format = FORMAT_WHY if data[:4] == b"PK\x05\x06" else FORMAT_ZIP
+            end_offset = data.rfind(b"PK\x05\x06", max(len(data) - _END_LOCATOR_SIZE - 0xFFFF, 0))
+            if end_offset == -1:
+                raise ValueError(f"{self.archive_path} is not an archive.")
+            end_locator = ZipEndLocator.from_file(io.BytesIO(data[end_offset:]), 0)
+            directory = data[end_locator.directory_offset:end_locator.directory_offset + end_locator.directory_size]
+        if end_locator.directory_offset == 0xFFFFFFFF or end_locator.total_entries == 0xFFFF:
+            raise ValueError("Zip64 archives aren't supported.")
+
+        entries = {}
+        directory_stream = io.BytesIO(directory)
+        for _ in range(end_locator.total_entries):
+            dir_entry = ZipDirEntry.from_file(directory_stream)
+            if dir_entry.signature != 0x02014B50:
+                raise ValueError(f"Invalid directory entry in {self.archive_path}.")
+            entries[dir_entry.file_name] = ArchiveEntry(dir_entry.file_name, dir_entry.compression, dir_entry.crc32,
+                                                        dir_entry.compressed_size, dir_entry.uncompressed_size,
+                                                        dir_entry.header_offset)
+        return archive_format, entries
+
+    def namelist(self) -> List[str]:
+        return list(self.entries)
+
+    def glob(self, pattern: str) -> List[str]:
+        """Returns the names of all members matching the pattern like *.oct or levels/*."""
+        return [name for name in self.entries if fnmatch.fnmatchcase(name, pattern)]
+
+    def _get_data_chunks(self, entry: ArchiveEntry) -> List[bytes | memoryview]:
+        data = self._mmap
+        header_offset = entry.header_offset
+        header = data[header_offset:header_offset + _RECORD_SIZE]
+        encrypted = self.format == FORMAT_DI3
+        if encrypted:
+            header = _decrypt(header)
+        if header[:4] != b"PK\x03\x04":
+            raise ValueError(f"Invalid record of {entry.name}.")
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        data_start = header_offset + _RECORD_SIZE + name_length + extra_length
+        data_end = data_start + entry.compress_size
+        if data_end > len(data):
+            raise ValueError(f"{entry.name} ends after the archive.")
+        if not encrypted or entry.name.endswith("dct"):  # whyjustwhy doesn't encrypt dct files
+            return [memoryview(data)[data_start:data_end]]
+
+        # the cipher starts at the record and continues with the data
+        encrypted_end = min(data_start + _ENCRYPTED_SIZE, data_end)
+        decrypted = _decrypt(data[header_offset:encrypted_end])
+        return [decrypted[data_start - header_offset:], memoryview(data)[encrypted_end:data_end]]
+
+    def open(self, name: str) -> BinaryIO:
+        """Opens a member as a seekable binary stream."""
+        entry = self.entries.get(name)
+        if entry is None:
+            raise KeyError(f"{name} is not in {self.archive_path}.")
+        chunks = self._get_data_chunks(entry)
+        match entry.compress_type:
+            case zipfile.ZIP_STORED:
+                if len(chunks) == 1:
+                    return io.BufferedReader(MemoryStream(chunks[0]))
+                return io.BytesIO(b"".join(chunks))
+            case zipfile.ZIP_DEFLATED:
+                return io.BufferedReader(InflatingStream(chunks, entry.file_size), _INFLATE_STEP)
+        raise ValueError(f"{entry.name} uses the unsupported compression {entry.compress_type}.")
+
+    def read(self, name: str) -> bytes:
+        with self.open(name) as member_stream:
+            data = member_stream.read()
+        if zlib.crc32(data) != self.entries[name].crc32:
+            raise ValueError(f"The crc of {name} doesn't match.")
+        return data
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # a member is still open, the mmap gets closed once it is gone
+
+    def __enter__(self) -> "ArchiveReader":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# path -> (modification time, size, reader) so processes reading many members only parse the directory once
+_open_readers: Dict[str, Tuple[int, int, ArchiveReader]] = {}
+
+
+def open_cached(archive_path: str) -> ArchiveReader:
+    """Returns an ArchiveReader that is kept open for the whole process as long as the archive doesn't change."""
+    stat_result = os.stat(archive_path)
+    archive_path = os.path.abspath(archive_path)
+    cached = _open_readers.get(archive_path)
+    if cached is not None and cached[:2] == (stat_result.st_mtime_ns, stat_result.st_size):
+        return cached[2]
+    if cached is not None:
+        cached[2].close()
+    reader = ArchiveReader(archive_path)
+    _open_readers[archive_path] = stat_result.st_mtime_ns, stat_result.st_size, reader
+    return reader
@@ -12,15 +12,30 @@
 #   limitations under the License.
 
 import struct
-from typing import BinaryIO, Sequence, Tuple, Dict
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Sequence, Tuple, Dict, Iterable, Iterator, Optional, List
 from Crypto.Cipher._mode_ctr import CtrMode
 from Crypto.Cipher import AES
+import fnmatch
 import hashlib
+import json
 import os
+import time
 import zipfile
+import zlib
+
+from ..utils import PhaseTimer, get_peak_rss, no_phase
 
 MD5_HEADER = struct.pack("7B", 75, 70, 19, 0, 77, 68, 53)  # from an original file
 ENC_KEY = b"\x68\x1B\xBE\xEA\x63\x16\x01\x88\xF9\xB7\x94\x51\x04\xA5\x14\x99"
+# archives smaller than this are built in memory
+SPOOL_SIZE = 0x4000000
+# how much data the prefetch threads may read ahead. bigger files only get announced to the os
+PREFETCH_MEMORY = 0x4000000
+
+# name inside the archive (or a ZipInfo to set the timestamp), data as bytes or a binary stream
+ArchiveMemberType = Tuple[str | zipfile.ZipInfo, bytes | BinaryIO]
 
 
 class ZipEndLocator:
@@ -175,7 +190,7 @@ class ZipFileRecord:
 
     def to_bytes(self) -> bytes:
         return struct.pack(self._STRUCT_STR, self._MAGIC, self.ver, self.flag, self.method, self.mod_time,
-                           self.mod_date, self.crc32, self.comp_size, self.uncomp_size, len(self.name),
+                           self.mod_date, self.crc32, self.comp_size, self.uncomp_size, len(self.name.encode("utf-8")),
                            len(self.extra)) + self.name.encode("utf-8") + self.extra
 
     def to_bytes_enc(self) -> Tuple[bytes, CtrMode]:
@@ -192,13 +207,360 @@ def hash_md5(path: str) -> bytes:
     return MD5_HEADER + md5_hash.digest()
 
 
-def create_md5_zip(zip_path: str, root_folder: str) -> Dict[str, bytes]:
+def _matches(internal_path: str, patterns: Sequence[str]) -> bool:
+    return any(fnmatch.fnmatchcase(internal_path, pattern) for pattern in patterns)
+
+
+def scan_folder(root_folder: str, include: Sequence[str] = (),
+                exclude: Sequence[str] = ()) -> List[Tuple[str, str, int]]:
+    """Returns (internal path, path, size) of every file in root_folder sorted by the internal path. Internal paths use
+    "/" and are matched against the glob patterns, excluded folders aren't scanned at all."""
+    files = []
+    folders = [(root_folder, "")]
+    while folders:
+        folder, prefix = folders.pop()
+        with os.scandir(folder) as dir_entries:
+            for dir_entry in dir_entries:
+                internal_path = prefix + dir_entry.name
+                if _matches(internal_path, exclude):
+                    continue
+                if dir_entry.is_dir(follow_symlinks=False):
+                    folders.append((dir_entry.path, internal_path + "/"))
+                elif dir_entry.is_file() and (not include or _matches(internal_path, include)):
+                    files.append((internal_path, dir_entry.path, dir_entry.stat().st_size))
+    files.sort()
+    return files
+
+
+def _prefetch_file(internal_path: str, file_path: str, read_size: int) -> Tuple[zipfile.ZipInfo, Optional[bytes]]:
+    zip_info = zipfile.ZipInfo.from_file(file_path, internal_path)
+    if read_size:
+        with open(file_path, "rb") as file:
+            return zip_info, file.read()
+    if hasattr(os, "posix_fadvise"):
+        file_descriptor = os.open(file_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(file_descriptor, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(file_descriptor)
+    return zip_info, None
+
+
+def _iter_prefetched(files: List[Tuple[str, str, int]], threads: int,
+                     max_memory: int) -> Iterator[Tuple[zipfile.ZipInfo, Optional[bytes], str]]:
+    executor = ThreadPoolExecutor(threads)
+    pending = deque()
+    pending_size = 0
+    next_index = 0
+    try:
+        while pending or next_index < len(files):
+            while next_index < len(files) and len(pending) < threads * 2:
+                internal_path, file_path, size = files[next_index]
+                # files that don't fit next to a few others are read when they are needed
+                read_size = size if size <= max_memory // 4 else 0
+                if pending and pending_size + read_size > max_memory:
+                    break
+                pending.append((executor.submit(_prefetch_file, internal_path, file_path, read_size), read_size,
+                                file_path))
+                pending_size += read_size
+                next_index += 1
+            future, read_size, file_path = pending.popleft()
+            pending_size -= read_size
+            yield *future.result(), file_path
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def iter_folder_members(root_folder: str, include: Sequence[str] = (), exclude: Sequence[str] = (),
+                        prefetch: int = 0, prefetch_memory: int = PREFETCH_MEMORY) -> Iterator[ArchiveMemberType]:
+    """Yields every file in root_folder that matches the glob patterns as an archive member sorted by name. A file
+    gets closed when the next one is requested. With prefetch threads the next files are read while the current one
+    gets compressed."""
+    return iter_file_members(scan_folder(root_folder, include, exclude), prefetch, prefetch_memory)
+
+
+def iter_file_members(files: List[Tuple[str, str, int]], prefetch: int = 0,
+                      prefetch_memory: int = PREFETCH_MEMORY) -> Iterator[ArchiveMemberType]:
+    """Like iter_folder_members but for files returned by scan_folder."""
+    if prefetch:
+        members = _iter_prefetched(files, prefetch, prefetch_memory)
+    else:
+        members = ((zipfile.ZipInfo.from_file(file_path, internal_path), None, file_path)
+                   for internal_path, file_path, _ in files)
+    for zip_info, data, file_path in members:
+        if data is not None:
+            yield zip_info, data
+            continue
+        with open(file_path, "rb") as file:
+            yield zip_info, file
+
+
+class PackedMember:
+    """A compressed archive member. It can be written into any amount of archives without compressing it again."""
+
+    def __init__(self, zip_info: zipfile.ZipInfo, compressed_data: bytes, md5_field: bytes):
+        self.zip_info = zip_info  # with crc, sizes and date
+        self.compressed_data = compressed_data
+        self.md5_field = md5_field
+
+    @property
+    def name(self) -> str:
+        return self.zip_info.filename
+
+    def copy_as(self, name: str | zipfile.ZipInfo) -> "PackedMember":
+        """Returns a member with the same content under another name."""
+        zip_info = name if isinstance(name, zipfile.ZipInfo) else zipfile.ZipInfo(name.replace("\\", "/"))
+        zip_info.compress_type = self.zip_info.compress_type
+        zip_info.CRC = self.zip_info.CRC
+        zip_info.file_size = self.zip_info.file_size
+        zip_info.compress_size = self.zip_info.compress_size
+        return PackedMember(zip_info, self.compressed_data, self.md5_field)
+
+
+def pack_member(name: str | zipfile.ZipInfo, data: bytes | BinaryIO) -> PackedMember:
+    """Compresses data like zipfile does and hashes it in the same pass."""
+    zip_info = name if isinstance(name, zipfile.ZipInfo) else zipfile.ZipInfo(name.replace("\\", "/"))
+    zip_info.compress_type = zipfile.ZIP_DEFLATED
+    chunks = (data,) if isinstance(data, (bytes, bytearray, memoryview)) else iter(lambda: data.read(0x100000), b"")
+
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    md5_hash = hashlib.md5()
+    crc32 = 0
+    size = 0
+    compressed_chunks = []
+    for chunk in chunks:
+        md5_hash.update(chunk)
+        crc32 = zlib.crc32(chunk, crc32)
+        size += len(chunk)
+        compressed_chunks.append(compressor.compress(chunk))
+    compressed_chunks.append(compressor.flush())
+
+    zip_info.CRC = crc32
+    zip_info.file_size = size
+    compressed_data = b"".join(compressed_chunks)
+    zip_info.compress_size = len(compressed_data)
+    # the tools can't handle the zip64 records zipfile would add
+    if size * 1.05 > zipfile.ZIP64_LIMIT or zip_info.compress_size > zipfile.ZIP64_LIMIT:
+        raise ValueError(f"{zip_info.filename} is too big to be packed.")
+    return PackedMember(zip_info, compressed_data, MD5_HEADER + md5_hash.digest())
+
+
+class ArchiveMetrics(PhaseTimer):
+    """Collects the time spent in every stage of packing an archive and the sizes of the files."""
+
+    def __init__(self):
+        super().__init__()
+        self.files = 0
+        self.input_size = 0
+        self.compressed_size = 0
+        self.output_size = 0
+        self.seconds = 0.0
+        self.duplicates = 0
+        self.duplicate_size = 0
+
+    def add_member(self, packed_member: PackedMember):
+        self.files += 1
+        self.input_size += packed_member.zip_info.file_size
+        self.compressed_size += packed_member.zip_info.compress_size
+
+    def add_duplicate(self, packed_member: PackedMember):
+        self.add_member(packed_member)
+        self.duplicates += 1
+        self.duplicate_size += packed_member.zip_info.file_size
+
+    def get_saved_compress_seconds(self) -> float:
+        """Estimates how long compressing the duplicates would have taken."""
+        compress_phase = self.phases.get("compress")
+        if not compress_phase or not compress_phase["bytes"]:
+            return 0.0
+        return self.duplicate_size * compress_phase["seconds"] / compress_phase["bytes"]
+
+    def get_find_duplicates_seconds(self) -> float:
+        find_phase = self.phases.get("find_duplicates")
+        return find_phase["seconds"] if find_phase else 0.0
+
+    def get_saved_seconds(self) -> float:
+        """The compressing time saved minus the time spent hashing to find the duplicates. Negative if finding them
+        took longer."""
+        return self.get_saved_compress_seconds() - self.get_find_duplicates_seconds()
+
+    def to_dict(self) -> dict:
+        seconds = max(self.seconds, 1e-9)
+        return {
+            "files": self.files,
+            "input_size": self.input_size,
+            "compressed_size": self.compressed_size,
+            "output_size": self.output_size,
+            "seconds": self.seconds,
+            "files_per_s": self.files / seconds,
+            "mb_per_s": self.input_size / 0x100000 / seconds,
+            "compression_ratio": self.compressed_size / self.input_size if self.input_size else None,
+            "duplicates": self.duplicates,
+            "duplicate_size": self.duplicate_size,
+            "saved_compress_seconds": self.get_saved_compress_seconds(),
+            "find_duplicates_seconds": self.get_find_duplicates_seconds(),
+            "saved_seconds": self.get_saved_seconds(),
+            "peak_rss": get_peak_rss(),
+            "phases": self.phases,
+        }
+
+    def format_report(self) -> str:
+        metrics = self.to_dict()
+        peak_rss = f"{metrics['peak_rss'] / 0x100000:.1f} MiB" if metrics["peak_rss"] is not None else "unknown"
+        ratio = f"{metrics['compression_ratio']:.3f}" if metrics["compression_ratio"] is not None else "-"
+        return "\n".join((
+            f"Packed {self.files} files ({self.input_size / 0x100000:.2f} MiB -> {self.output_size / 0x100000:.2f} "
+            f"MiB) in {self.seconds:.3f}s",
+            f"{metrics['files_per_s']:.1f} files/s, {metrics['mb_per_s']:.2f} MB/s, compression ratio {ratio}, "
+            f"peak rss {peak_rss}",
+            f"Packed {self.duplicates} duplicates ({self.duplicate_size / 0x100000:.2f} MiB) without compressing "
+            f"them again, saved about {metrics['saved_seconds']:.3f}s net ({metrics['saved_compress_seconds']:.3f}s "
+            f"compressing - {metrics['find_duplicates_seconds']:.3f}s finding them)",
+            "",
+            super().format_report(),
+        ))
+
+    def output(self, destination: str):
+        """Prints the report if destination is "-", otherwise writes it as json."""
+        if destination == "-":
+            print(self.format_report())
+            return
+        with open(destination, "w", encoding="utf-8") as json_file:
+            json.dump(self.to_dict(), json_file, indent=2)
+
+
+def pack_members(members: Iterable[ArchiveMemberType],
+                 metrics: Optional[ArchiveMetrics] = None) -> Iterator[PackedMember]:
+    """Compresses the members one after another while they get written."""
+    for name, data in members:
+        if metrics is None:
+            yield pack_member(name, data)
+            continue
+        start_time = time.perf_counter()
+        packed_member = pack_member(name, data)
+        # includes reading the file and hashing it
+        metrics.add("compress", time.perf_counter() - start_time, packed_member.zip_info.file_size)
+        metrics.add_member(packed_member)
+        yield packed_member
+
+
+def find_duplicates(files: List[Tuple[str, str, int]],
+                    timer: Optional[PhaseTimer] = None) -> Dict[str, str]:
+    """Returns path -> path of the first file with the same content for files returned by scan_folder. Only files
+    with the same size get hashed."""
+    phase = timer.phase if timer is not None else no_phase
+    sizes = Counter(size for _, _, size in files)
+    originals = {}
+    duplicates = {}
+    for _, file_path, size in files:
+        if sizes[size] < 2:
+            continue
+        with phase("find_duplicates", size):
+            sha256_hash = hashlib.sha256()
+            with open(file_path, "rb") as file:
+                for chunk in iter(lambda: file.read(0x100000), b""):
+                    sha256_hash.update(chunk)
+        original_path = originals.setdefault((size, sha256_hash.digest()), file_path)
+        if original_path != file_path:
+            duplicates[file_path] = original_path
+    return duplicates
+
+
+def pack_folder(root_folder: str, include: Sequence[str] = (), exclude: Sequence[str] = (), prefetch: int = 0,
+                deduplicate: bool = True, metrics: Optional[ArchiveMetrics] = None) -> Iterator[PackedMember]:
+    """Packs every file of root_folder like iter_folder_members and pack_members do. Files with the same content are
+    only read and compressed once."""
+    files = scan_folder(root_folder, include, exclude)
+    duplicates = find_duplicates(files, metrics) if deduplicate else {}
+    # how many duplicates still need the packed member of an original
+    remaining = Counter(duplicates.values())
+    originals: Dict[str, PackedMember] = {}
+    packed_members = pack_members(iter_file_members([file for file in files if file[1] not in duplicates],
+                                                    prefetch), metrics)
+    for internal_path, file_path, _ in files:
+        original_path = duplicates.get(file_path)
+        if original_path is None:
+            packed_member = next(packed_members)
+            if remaining[file_path]:
+                originals[file_path] = packed_member
+            yield packed_member
+            continue
+
+        packed_member = originals[original_path].copy_as(zipfile.ZipInfo.from_file(file_path, internal_path))
+        remaining[original_path] -= 1
+        if not remaining[original_path]:
+            del originals[original_path]
+        if metrics is not None:
+            metrics.add_duplicate(packed_member)
+        yield packed_member
+
+
+def write_packed_zip(zip_stream: BinaryIO, packed_members: Iterable[PackedMember],
+                     timer: Optional[PhaseTimer] = None) -> Dict[str, bytes]:
+    """Writes a normal zip starting at the current position of zip_stream the same way zipfile would and returns
+    the md5 extra fields."""
+    phase = timer.phase if timer is not None else no_phase
     md5_hashes = {}
-    with zipfile.ZipFile(zip_path, "w") as zip_file:
-        for folder_name, _, filenames in os.walk(root_folder):
-            for filename in filenames:
-                file_path = os.path.join(folder_name, filename)
-                internal_path = os.path.relpath(file_path, root_folder).replace("\\", "/")
-                md5_hashes[internal_path] = hash_md5(file_path)
-                zip_file.write(file_path, internal_path, zipfile.ZIP_DEFLATED)
+    dir_entries = []
+    offset = 0
+    for packed_member in packed_members:
+        zip_info = packed_member.zip_info
+        file_time = zip_info.date_time[3] << 11 | zip_info.date_time[4] << 5 | zip_info.date_time[5] // 2
+        file_date = (zip_info.date_time[0] - 1980) << 9 | zip_info.date_time[1] << 5 | zip_info.date_time[2]
+        # utf-8 flag
+        flags = 0 if zip_info.filename.isascii() else 0x800
+
+        zip_file_record = ZipFileRecord(zip_info.extract_version, flags, zip_info.compress_type, file_time, file_date,
+                                        zip_info.CRC, zip_info.compress_size, zip_info.file_size, zip_info.filename,
+                                        b"")
+        dir_entries.append(ZipDirEntry(0x02014B50, zip_info.create_system << 8 | zip_info.create_version,
+                                       zip_info.extract_version, flags, zip_info.compress_type, file_time, file_date,
+                                       zip_info.CRC, zip_info.compress_size, zip_info.file_size, 0, 0,
+                                       zip_info.external_attr or 0o600 << 16, offset, zip_info.filename, b"", ""))
+        with phase("temp_zip", zip_info.compress_size):
+            offset += zip_stream.write(zip_file_record.to_bytes())
+            offset += zip_stream.write(packed_member.compressed_data)
+        md5_hashes[zip_info.filename] = packed_member.md5_field
+
+    directory_offset = offset
+    with phase("temp_zip"):
+        for dir_entry in dir_entries:
+            offset += zip_stream.write(dir_entry.to_bytes())
+        zip_stream.write(ZipEndLocator(0x06054B50, 0, 0, len(dir_entries), len(dir_entries),
+                                       offset - directory_offset, directory_offset, "").to_bytes())
     return md5_hashes
+
+
+def write_md5_zip(zip_stream: BinaryIO, members: Iterable[ArchiveMemberType],
+                  metrics: Optional[ArchiveMetrics] = None) -> Dict[str, bytes]:
+    """Writes a normal zip to zip_stream and returns the md5 extra fields. Every member is only read once."""
+    return write_packed_zip(zip_stream, pack_members(members, metrics), metrics)
+
+
+def create_md5_zip(zip_path: str, root_folder: str, metrics: Optional[ArchiveMetrics] = None) -> Dict[str, bytes]:
+    with open(zip_path, "wb") as zip_file:
+        return write_md5_zip(zip_file, iter_folder_members(root_folder), metrics)
+
+
+def add_input_args(arg_parser):
+    arg_parser.add_argument("--include", action="append", default=[], metavar="GLOB",
+                            help="Only pack files whose path inside the archive matches this pattern like *.dds. "
+                                 "Can be used multiple times.")
+    arg_parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                            help="Don't pack files or folders whose path inside the archive matches this pattern. "
+                                 "Can be used multiple times.")
+    arg_parser.add_argument("--prefetch", type=int, default=0, metavar="THREADS",
+                            help="Read the next files with this amount of threads while the current one gets "
+                                 "compressed. Helps with slow disks and network shares.")
+    arg_parser.add_argument("--no-dedup", dest="deduplicate", action="store_false",
+                            help="Compress files with the same content again instead of reusing the first one.")
+
+
+def add_metrics_args(arg_parser):
+    arg_parser.add_argument("--metrics", nargs="?", const="-", metavar="JSON_FILE",
+                            help="Measure the time of every stage, the throughput and the compression ratio. "
+                                 "Prints a report or writes it to JSON_FILE.")
+
+
+def metrics_from_args(parsed_args) -> Optional[ArchiveMetrics]:
+    return ArchiveMetrics() if parsed_args.metrics is not None else None
@@ -16,12 +16,14 @@
 #
 
 import os
-import shutil
 import tempfile
-from typing import BinaryIO, Sequence
+import time
+from typing import BinaryIO, Iterable, Optional, Sequence
 
 from ..utils import chunk_iter
-from .archive_utils import ZipDirEntry, ZipEndLocator, create_md5_zip
+from .archive_utils import ZipDirEntry, ZipEndLocator, ArchiveMemberType, ArchiveMetrics, PackedMember, \
+    SPOOL_SIZE, pack_folder, pack_members, write_packed_zip, add_input_args, add_metrics_args, \
+    metrics_from_args
 
 
 def update_and_write_dir_entries(file_from: BinaryIO, file_to: BinaryIO, from_loc: int, to_loc: int,
@@ -35,47 +37,65 @@ def update_and_write_dir_entries(file_from: BinaryIO, file_to: BinaryIO, from_lo
         file_to.write(zip_dir_entry.to_bytes())
 
 
-def main(in_folder: str, out_file: str):
-    tmp_dir = tempfile.mkdtemp()
-    try:
-        # Build normal archive and generate md5 hashes
-        tmp_zip_path = os.path.join(tmp_dir, "archive.zip")
-        md5_hashes = create_md5_zip(tmp_zip_path, in_folder)
-
-        # Build "funky" archive
-        with open(tmp_zip_path, "rb") as tmp_file, open(out_file, "wb") as final_file:
-            # need to add comment support here
-            zip_end_locator_offset = os.path.getsize(tmp_zip_path) - 22
-            zip_end_locator = ZipEndLocator.from_file(tmp_file, zip_end_locator_offset)
-
-            # calculate amount to add to the offsets
-            size_of_md5_fields = zip_end_locator.total_entries * 23  # md5 bytes + header
-            add_offset = (os.path.getsize(tmp_zip_path) - zip_end_locator.directory_offset) + size_of_md5_fields
-
-            # writing 1st end locators
-            tmp_file_directory_offset = zip_end_locator.directory_offset
-            zip_end_locator.directory_offset += add_offset
-            zip_end_locator.directory_size += size_of_md5_fields
-            final_file.write(zip_end_locator.to_bytes())
+def write_archive(members: Iterable[ArchiveMemberType], output_stream: BinaryIO,
+                  metrics: Optional[ArchiveMetrics] = None):
+    """Packs members into output_stream. output_stream doesn't need to be seekable."""
+    write_packed_archive(pack_members(members, metrics), output_stream, metrics)
 
-            # writing 1st dir entries
-            update_and_write_dir_entries(tmp_file, final_file, tmp_file_directory_offset, zip_end_locator_offset,
-                                         md5_hashes, add_offset)
 
-            # writing file records
-            tmp_file.seek(0)  # maybe make that not 0
-            for chunk in chunk_iter(tmp_file, tmp_file_directory_offset):
-                final_file.write(chunk)
-
-            # write 2nd dir entries
-            update_and_write_dir_entries(tmp_file, final_file, tmp_file_directory_offset, zip_end_locator_offset,
-                                         md5_hashes, add_offset)
-
-            # write 2nd end locator
-            final_file.write(zip_end_locator.to_bytes())
+def write_packed_archive(packed_members: Iterable[PackedMember], output_stream: BinaryIO,
+                         metrics: Optional[ArchiveMetrics] = None):
+    """Like write_archive but with members that are already compressed."""
+    with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as tmp_file:
+        # Build normal archive and generate md5 hashes
+        md5_hashes = write_packed_zip(tmp_file, packed_members, metrics)
+        tmp_file.seek(0, os.SEEK_END)
+        tmp_size = tmp_file.tell()
+        rewrite_start_time = time.perf_counter()
 
-    finally:
-        shutil.rmtree(tmp_dir)
+        # Build "funky" archive
+        # need to add comment support here
+        zip_end_locator_offset = tmp_size - 22
+        zip_end_locator = ZipEndLocator.from_file(tmp_file, zip_end_locator_offset)
+
+        # calculate amount to add to the offsets
+        size_of_md5_fields = zip_end_locator.total_entries * 23  # md5 bytes + header
+        add_offset = (tmp_size - zip_end_locator.directory_offset) + size_of_md5_fields
+
+        # writing 1st end locators
+        tmp_file_directory_offset = zip_end_locator.directory_offset
+        zip_end_locator.directory_offset += add_offset
+        zip_end_locator.directory_size += size_of_md5_fields
+        output_stream.write(zip_end_locator.to_bytes())
+
+        # writing 1st dir entries
+        update_and_write_dir_entries(tmp_file, output_stream, tmp_file_directory_offset, zip_end_locator_offset,
+                                     md5_hashes, add_offset)
+
+        # writing file records
+        tmp_file.seek(0)  # maybe make that not 0
+        for chunk in chunk_iter(tmp_file, tmp_file_directory_offset):
+            output_stream.write(chunk)
+
+        # write 2nd dir entries
+        update_and_write_dir_entries(tmp_file, output_stream, tmp_file_directory_offset, zip_end_locator_offset,
+                                     md5_hashes, add_offset)
+
+        # write 2nd end locator
+        output_stream.write(zip_end_locator.to_bytes())
+        if metrics is not None:
+            metrics.add("rewrite", time.perf_counter() - rewrite_start_time, tmp_size)
+
+
+def main(in_folder: str, out_file: str, metrics: Optional[ArchiveMetrics] = None, include: Sequence[str] = (),
+         exclude: Sequence[str] = (), prefetch: int = 0, deduplicate: bool = True):
+    start_time = time.perf_counter()
+    with open(out_file, "wb") as final_file:
+        write_packed_archive(pack_folder(in_folder, include, exclude, prefetch, deduplicate, metrics), final_file,
+                             metrics)
+        if metrics is not None:
+            metrics.output_size = final_file.tell()
+            metrics.seconds = time.perf_counter() - start_time
 
 
 def run_from_args(args: Sequence[str]):
@@ -87,9 +107,19 @@ def run_from_args(args: Sequence[str]):
     )
     _arg_parser.add_argument("in_folder", help="The files of this folder will get packed.")
     _arg_parser.add_argument("out_file", help="The destination of the file that will be generated.")
+    add_input_args(_arg_parser)
+    add_metrics_args(_arg_parser)
     _args = _arg_parser.parse_args(args)
 
     assert os.path.isdir(_args.in_folder), "folder is not valid"
     assert not os.path.isdir(_args.out_file), "file destination is not valid"
+    assert _args.prefetch >= 0, "amount of prefetch threads is not valid"
+
+    if _args.metrics and _args.metrics != "-":
+        assert not os.path.isdir(_args.metrics), "metrics file destination is not valid"
 
-    main(_args.in_folder, _args.out_file)
+    metrics = metrics_from_args(_args)
+    main(_args.in_folder, _args.out_file, metrics, _args.include, _args.exclude, _args.prefetch,
+         _args.deduplicate)
+    if metrics is not None:
+        metrics.output(_args.metrics)
@@ -13,13 +13,15 @@
 
 import itertools
 import os
-import shutil
 import tempfile
+import time
 from Crypto.Cipher import AES
 
-from .archive_utils import ZipEndLocator, ZipDirEntry, ZipFileRecord, EncFileHeader, EncFileEntry, create_md5_zip, ENC_KEY
-from ..utils import chunk_iter
-from typing import BinaryIO, Sequence
+from .archive_utils import ZipEndLocator, ZipDirEntry, ZipFileRecord, EncFileHeader, EncFileEntry, ENC_KEY, \
+    ArchiveMemberType, ArchiveMetrics, PackedMember, SPOOL_SIZE, pack_folder, pack_members, \
+    write_packed_zip, add_input_args, add_metrics_args, metrics_from_args
+from ..utils import chunk_iter, no_phase
+from typing import BinaryIO, Iterable, Optional, Sequence
 
 try:
     import mmh3 as mmh3
@@ -42,67 +44,92 @@ def update_and_write_dir_entries(file_from: BinaryIO, file_to: BinaryIO, from_lo
         # file_to.write(zip_dir_entry.to_bytes())
 
 
-def main(in_folder: str, out_file: str):
-    tmp_dir = tempfile.mkdtemp()
-    try:
+def write_archive(members: Iterable[ArchiveMemberType], output_stream: BinaryIO,
+                  metrics: Optional[ArchiveMetrics] = None):
+    """Packs and encrypts members into output_stream. output_stream doesn't need to be seekable."""
+    write_packed_archive(pack_members(members, metrics), output_stream, metrics)
+
+
+def write_packed_archive(packed_members: Iterable[PackedMember], output_stream: BinaryIO,
+                         metrics: Optional[ArchiveMetrics] = None):
+    """Like write_archive but with members that are already compressed."""
+    phase = metrics.phase if metrics is not None else no_phase
+    with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as tmp_file:
         # Build normal archive and generate md5 hashes
-        tmp_zip_path = os.path.join(tmp_dir, "archive.zip")
-        md5_hashes = create_md5_zip(tmp_zip_path, in_folder)
+        md5_hashes = write_packed_zip(tmp_file, packed_members, metrics)
+        tmp_file.seek(0, os.SEEK_END)
+        tmp_size = tmp_file.tell()
 
         # Build "funky" archive
-        with open(tmp_zip_path, "rb") as tmp_file, open(out_file, "wb") as final_file:
-            # need to add comment support here
-            zip_end_locator_offset = os.path.getsize(tmp_zip_path) - 22
-            zip_end_locator = ZipEndLocator.from_file(tmp_file, zip_end_locator_offset)
-
-            # generate encrypted file entries
-            size_enc_header = zip_end_locator.total_entries * EncFileEntry.get_size() + EncFileHeader.get_size_without_str()
-
-            # generating enc file entries
-            zip_dir_entries = []
-            enc_file_entries = []
-            tmp_file.seek(zip_end_locator.directory_offset)
-            while tmp_file.tell() < zip_end_locator_offset:
-                zip_dir_entry = ZipDirEntry.from_file(tmp_file)
-                zip_dir_entries.append(zip_dir_entry)
-                # thanks jiro 😉
-                enc_file_entry = EncFileEntry(mmh3.hash(zip_dir_entry.file_name) & 0xFFFFFFFF,  # because pymmh3
-                                              zip_dir_entry.header_offset + size_enc_header)
-                enc_file_entries.append(enc_file_entry)
-
-            # writing enc file header
-            final_file.write(EncFileHeader(enc_file_entries).to_bytes_enc())
-            # final_file.write(EncFileHeader(enc_file_entries).to_bytes())
-
-            # reading and writing zip file records
-            tmp_file.seek(0)
-            for next_offset in itertools.chain(
-                    (enc_file_entry.header_offset for enc_file_entry in zip_dir_entries[1:]),
-                    (zip_end_locator.directory_offset,)):
-                cipher = AES.new(ENC_KEY, AES.MODE_CTR, nonce=b"")
-                zip_file_record = ZipFileRecord.from_file(tmp_file)
-                final_file.write(cipher.encrypt(zip_file_record.to_bytes()))
-                # only first 0x200 bytes are encrypted while dct files are not encrypted at all
-                if not zip_file_record.name.endswith("dct"):
-                    for chunk in chunk_iter(tmp_file, min(next_offset, 0x200 + tmp_file.tell())):
-                        final_file.write(cipher.encrypt(chunk))
+        # need to add comment support here
+        zip_end_locator_offset = tmp_size - 22
+        zip_end_locator = ZipEndLocator.from_file(tmp_file, zip_end_locator_offset)
+
+        # generate encrypted file entries
+        size_enc_header = zip_end_locator.total_entries * EncFileEntry.get_size() + EncFileHeader.get_size_without_str()
+
+        # generating enc file entries
+        rewrite_start_time = time.perf_counter()
+        zip_dir_entries = []
+        enc_file_entries = []
+        tmp_file.seek(zip_end_locator.directory_offset)
+        while tmp_file.tell() < zip_end_locator_offset:
+            zip_dir_entry = ZipDirEntry.from_file(tmp_file)
+            zip_dir_entries.append(zip_dir_entry)
+            # thanks jiro 😉
+            enc_file_entry = EncFileEntry(mmh3.hash(zip_dir_entry.file_name) & 0xFFFFFFFF,  # because pymmh3
+                                          zip_dir_entry.header_offset + size_enc_header)
+            enc_file_entries.append(enc_file_entry)
+
+        if metrics is not None:
+            metrics.add("rewrite", time.perf_counter() - rewrite_start_time)
+
+        # writing enc file header
+        with phase("encrypt", size_enc_header):
+            output_stream.write(EncFileHeader(enc_file_entries).to_bytes_enc())
+        # output_stream.write(EncFileHeader(enc_file_entries).to_bytes())
+
+        # reading and writing zip file records
+        tmp_file.seek(0)
+        for next_offset in itertools.chain(
+                (enc_file_entry.header_offset for enc_file_entry in zip_dir_entries[1:]),
+                (zip_end_locator.directory_offset,) if zip_dir_entries else ()):
+            cipher = AES.new(ENC_KEY, AES.MODE_CTR, nonce=b"")
+            zip_file_record = ZipFileRecord.from_file(tmp_file)
+            # only first 0x200 bytes are encrypted while dct files are not encrypted at all
+            encrypted_end = tmp_file.tell() if zip_file_record.name.endswith("dct") \
+                else min(next_offset, 0x200 + tmp_file.tell())
+            with phase("encrypt", encrypted_end - tmp_file.tell()):
+                output_stream.write(cipher.encrypt(zip_file_record.to_bytes()))
+                for chunk in chunk_iter(tmp_file, encrypted_end):
+                    output_stream.write(cipher.encrypt(chunk))
+            with phase("copy", next_offset - tmp_file.tell()):
                 for chunk in chunk_iter(tmp_file, next_offset):
-                    final_file.write(chunk)
+                    output_stream.write(chunk)
 
-            # reading and writing dir entries
-            update_and_write_dir_entries(tmp_file, final_file, zip_end_locator.directory_offset, zip_end_locator_offset,
-                                         md5_hashes, size_enc_header)
+        # reading and writing dir entries
+        with phase("encrypt", zip_end_locator_offset - zip_end_locator.directory_offset):
+            update_and_write_dir_entries(tmp_file, output_stream, zip_end_locator.directory_offset,
+                                         zip_end_locator_offset, md5_hashes, size_enc_header)
+
+        # write end locator
+        cipher = AES.new(ENC_KEY, AES.MODE_CTR, nonce=b"")
+        size_of_md5_fields = zip_end_locator.total_entries * 23  # md5 bytes + header
+        zip_end_locator.directory_offset += size_enc_header
+        zip_end_locator.directory_size += size_of_md5_fields
+        output_stream.write(cipher.encrypt(zip_end_locator.to_bytes()))
+        # output_stream.write(zip_end_locator.to_bytes())
 
-            # write end locator
-            cipher = AES.new(ENC_KEY, AES.MODE_CTR, nonce=b"")
-            size_of_md5_fields = zip_end_locator.total_entries * 23  # md5 bytes + header
-            zip_end_locator.directory_offset += size_enc_header
-            zip_end_locator.directory_size += size_of_md5_fields
-            final_file.write(cipher.encrypt(zip_end_locator.to_bytes()))
-            # final_file.write(zip_end_locator.to_bytes())
 
-    finally:
-        shutil.rmtree(tmp_dir)
+def main(in_folder: str, out_file: str, metrics: Optional[ArchiveMetrics] = None, include: Sequence[str] = (),
+         exclude: Sequence[str] = (), prefetch: int = 0, deduplicate: bool = True):
+    start_time = time.perf_counter()
+    with open(out_file, "wb") as final_file:
+        write_packed_archive(pack_folder(in_folder, include, exclude, prefetch, deduplicate, metrics), final_file,
+                             metrics)
+        if metrics is not None:
+            metrics.output_size = final_file.tell()
+            metrics.seconds = time.perf_counter() - start_time
 
 
 def run_from_args(args: Sequence[str]):
@@ -114,9 +141,19 @@ def run_from_args(args: Sequence[str]):
     )
     _arg_parser.add_argument("in_folder", help="The files of this folder will get packed.")
     _arg_parser.add_argument("out_file", help="The destination of the file that will be generated.")
+    add_input_args(_arg_parser)
+    add_metrics_args(_arg_parser)
     _args = _arg_parser.parse_args(args)
 
     assert os.path.isdir(_args.in_folder), "folder is not valid"
     assert not os.path.isdir(_args.out_file), "file destination is not valid"
+    assert _args.prefetch >= 0, "amount of prefetch threads is not valid"
+
+    if _args.metrics and _args.metrics != "-":
+        assert not os.path.isdir(_args.metrics), "metrics file destination is not valid"
 
-    main(_args.in_folder, _args.out_file)
+    metrics = metrics_from_args(_args)
+    main(_args.in_folder, _args.out_file, metrics, _args.include, _args.exclude, _args.prefetch,
+         _args.deduplicate)
+    if metrics is not None:
+        metrics.output(_args.metrics)
@@ -0,0 +1,126 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import importlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from .archive_gen import AssetGenParams, generate_assets, add_gen_args, params_from_args
+from .scene_bench import load_history, find_regressions
+from ..archives.archive_utils import ArchiveMetrics
+
+PACKERS = ("why", "whyjustwhy")
+
+
+def _pack(packer: str, in_folder: str, out_file: str, prefetch: int) -> dict:
+    metrics = ArchiveMetrics()
+    importlib.import_module(f"c2ditools.archives.{packer}").main(in_folder, out_file, metrics, prefetch=prefetch)
+    return metrics.to_dict()
+
+
+def pack_in_process(packer: str, in_folder: str, out_file: str, prefetch: int = 0) -> dict:
+    """Packs in_folder in a fresh process so the peak rss only belongs to this run and returns the metrics."""
+    with ProcessPoolExecutor(1) as executor:
+        return executor.submit(_pack, packer, in_folder, out_file, prefetch).result()
+
+
+def run_benchmark(params: AssetGenParams, repeat: int = 3, packers: Sequence[str] = PACKERS,
+                  prefetch: int = 0) -> Dict[str, dict]:
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        in_folder = os.path.join(tmp_dir, "assets")
+        generate_assets(in_folder, params)
+        out_file = os.path.join(tmp_dir, "bench.zip")
+
+        results = {}
+        for packer in packers:
+            runs = [pack_in_process(packer, in_folder, out_file, prefetch) for _ in range(repeat)]
+            # the fastest run is the one with the least noise
+            result = min(runs, key=lambda run: run["seconds"])
+            result["peak_rss"] = max((run["peak_rss"] for run in runs if run["peak_rss"] is not None), default=None)
+            results[packer] = result
+        return results
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def main(params: AssetGenParams, repeat: int = 3, packers: Sequence[str] = PACKERS, prefetch: int = 0,
+         history_path: Optional[str] = None, label: str = "", threshold: float = 0.1) -> List[str]:
+    results = run_benchmark(params, repeat, packers, prefetch)
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "label": label,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {**params.to_dict(), "prefetch": prefetch},
+        "results": results,
+    }
+
+    for name, result in results.items():
+        peak_rss = f"{result['peak_rss'] / 0x100000:.1f} MiB" if result["peak_rss"] is not None else "unknown"
+        print(f"{name}: {result['seconds']:.4f}s, {result['files_per_s']:.1f} files/s, {result['mb_per_s']:.2f} MB/s, "
+              f"compression ratio {result['compression_ratio']:.3f}, peak rss {peak_rss}")
+        print("  " + ", ".join(f"{phase_name} {phase['seconds']:.4f}s"
+                               for phase_name, phase in result["phases"].items()))
+
+    regressions = []
+    if history_path is not None:
+        # only runs with the same parameters can be compared
+        previous_entries = [previous for previous in load_history(history_path)
+                            if previous["params"] == entry["params"]]
+        if previous_entries:
+            regressions = find_regressions(previous_entries[-1], entry, threshold)
+            for regression in regressions:
+                print(f"Regression: {regression}")
+        with open(history_path, "a", encoding="utf-8") as history_file:
+            history_file.write(json.dumps(entry) + "\n")
+    return regressions
+
+
+def run_from_args(args: Sequence[str]):
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        prog="archive_bench(.py) Written by TKFRvision",
+        description="A program to benchmark why and whyjustwhy on synthetic asset folders."
+    )
+    add_gen_args(arg_parser)
+    arg_parser.add_argument("--packer", dest="packers", action="append", choices=PACKERS,
+                            help="A packer to benchmark. Can be used multiple times. Defaults to all of them.")
+    arg_parser.add_argument("--prefetch", type=int, default=0, metavar="THREADS",
+                            help="The amount of prefetch threads the packers use.")
+    arg_parser.add_argument("-r", dest="repeat", type=int, default=3, help="How often every packer gets run.")
+    arg_parser.add_argument("--history", dest="history_file",
+                            help="A json lines file the results get appended to. The results are compared to the "
+                                 "last run with the same parameters.")
+    arg_parser.add_argument("--label", default="", help="A label to store with the results like a commit hash.")
+    arg_parser.add_argument("--threshold", type=float, default=0.1,
+                            help="How much slower a packer can get before it counts as a regression.")
+    arg_parser.add_argument("--fail-on-regression", dest="fail_on_regression", action="store_true",
+                            help="Exit with an error code if there is a regression.")
+    parsed_args = arg_parser.parse_args(args)
+
+    if parsed_args.history_file:
+        assert not os.path.isdir(parsed_args.history_file), "History file destination is invalid."
+
+    regressions = main(params_from_args(parsed_args), parsed_args.repeat, parsed_args.packers or PACKERS,
+                       parsed_args.prefetch, parsed_args.history_file, parsed_args.label, parsed_args.threshold)
+    if regressions and parsed_args.fail_on_regression:
+        sys.exit(1)
@@ -0,0 +1,136 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import math
+import os
+import random
+from typing import Sequence
+
+# extensions of the generated files, dct files aren't encrypted by whyjustwhy
+_EXTENSIONS = (".oct", ".bent", ".dds", ".lua", ".dct")
+DISTRIBUTIONS = ("lognormal", "uniform", "fixed")
+
+
+class AssetGenParams:
+    def __init__(self, file_count: int = 200, min_size: int = 0x400, max_size: int = 0x100000,
+                 distribution: str = "lognormal", compressible: float = 0.5, dct_share: float = 0.1,
+                 folder_count: int = 8, seed: int = 0):
+        self.file_count = file_count
+        self.min_size = min_size
+        self.max_size = max_size
+        self.distribution = distribution
+        self.compressible = compressible  # share of files with text like content, the rest is random
+        self.dct_share = dct_share
+        self.folder_count = folder_count
+        self.seed = seed
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+class _AssetGenerator:
+    def __init__(self, params: AssetGenParams):
+        self.params = params
+        self.random = random.Random(params.seed)
+        self.words = [self.random.randbytes(self.random.randint(2, 10)).hex().encode("ascii") for _ in range(512)]
+
+    def _get_size(self) -> int:
+        min_size, max_size = self.params.min_size, max(self.params.max_size, self.params.min_size)
+        match self.params.distribution:
+            case "fixed":
+                return max_size
+            case "uniform":
+                return self.random.randint(min_size, max_size)
+            case "lognormal":
+                # most files are small, a few are close to max_size
+                log_min, log_max = math.log(max(min_size, 1)), math.log(max(max_size, 1))
+                size = self.random.lognormvariate((log_min + log_max) / 2, (log_max - log_min) / 6)
+                return min(max(int(size), min_size), max_size)
+        raise ValueError(f"Unknown distribution {self.params.distribution}.")
+
+    def _get_data(self, size: int, compressible: bool) -> bytes:
+        if not compressible:
+            return self.random.randbytes(size)
+        data = bytearray()
+        while len(data) < size:
+            data += b" ".join(self.random.choices(self.words, k=1024)) + b"\n"
+        return bytes(data[:size])
+
+    def _get_extension(self) -> str:
+        if self.random.random() < self.params.dct_share:
+            return ".dct"
+        return self.random.choice(_EXTENSIONS[:-1])
+
+    def write(self, out_folder: str) -> int:
+        total_size = 0
+        for file_index in range(self.params.file_count):
+            folder = os.path.join(out_folder, f"folder{file_index % max(self.params.folder_count, 1)}")
+            os.makedirs(folder, exist_ok=True)
+            extension = self._get_extension()
+            # dct files are text
+            compressible = extension == ".dct" or self.random.random() < self.params.compressible
+            data = self._get_data(self._get_size(), compressible)
+            with open(os.path.join(folder, f"file{file_index}{extension}"), "wb") as asset_file:
+                total_size += asset_file.write(data)
+        return total_size
+
+
+def generate_assets(out_folder: str, params: AssetGenParams) -> int:
+    """Writes random files to out_folder and returns their total size."""
+    return _AssetGenerator(params).write(out_folder)
+
+
+def main(out_folder: str, params: AssetGenParams):
+    total_size = generate_assets(out_folder, params)
+    print(f"Generated {params.file_count} files ({total_size / 0x100000:.2f} MiB).")
+
+
+def add_gen_args(arg_parser):
+    defaults = AssetGenParams()
+    arg_parser.add_argument("--files", dest="file_count", type=int, default=defaults.file_count,
+                            help="The amount of files.")
+    arg_parser.add_argument("--min-size", dest="min_size", type=int, default=defaults.min_size,
+                            help="The minimum size of a file in bytes.")
+    arg_parser.add_argument("--max-size", dest="max_size", type=int, default=defaults.max_size,
+                            help="The maximum size of a file in bytes.")
+    arg_parser.add_argument("--distribution", choices=DISTRIBUTIONS, default=defaults.distribution,
+                            help="How the sizes of the files are distributed.")
+    arg_parser.add_argument("--compressible", type=float, default=defaults.compressible,
+                            help="The share of files with text that compresses well. The rest is random data.")
+    arg_parser.add_argument("--dct", dest="dct_share", type=float, default=defaults.dct_share,
+                            help="The share of .dct files, which whyjustwhy doesn't encrypt.")
+    arg_parser.add_argument("--folders", dest="folder_count", type=int, default=defaults.folder_count,
+                            help="The amount of sub folders the files are spread over.")
+    arg_parser.add_argument("--seed", type=int, default=defaults.seed, help="The seed for the random data.")
+
+
+def params_from_args(parsed_args) -> AssetGenParams:
+    return AssetGenParams(parsed_args.file_count, parsed_args.min_size, parsed_args.max_size,
+                          parsed_args.distribution, parsed_args.compressible, parsed_args.dct_share,
+                          parsed_args.folder_count, parsed_args.seed)
+
+
+def run_from_args(args: Sequence[str]):
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        prog="archive_gen(.py) Written by TKFRvision",
+        description="A program to generate synthetic asset folders for benchmarks of why and whyjustwhy."
+    )
+    arg_parser.add_argument("out_folder", help="The folder to generate the files in.")
+    add_gen_args(arg_parser)
+    parsed_args = arg_parser.parse_args(args)
+
+    assert not os.path.isfile(parsed_args.out_folder), "Output folder destination is invalid."
+
+    main(parsed_args.out_folder, params_from_args(parsed_args))
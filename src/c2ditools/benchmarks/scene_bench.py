@@ -0,0 +1,152 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .scene_gen import SceneGenParams, generate_scene, add_gen_args, params_from_args
+from ..scene import scene_dec, scene_enc
+from ..utils import get_peak_rss
+
+
+def _measure(func: Callable, args: tuple) -> Tuple[float, Optional[int]]:
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(*args)
+    return time.perf_counter() - start_time, get_peak_rss()
+
+
+def measure_in_process(func: Callable, args: tuple) -> Tuple[float, Optional[int]]:
+    """Runs func(*args) in a fresh process so the peak rss only belongs to this run."""
+    with ProcessPoolExecutor(1) as executor:
+        return executor.submit(_measure, func, args).result()
+
+
+def run_benchmark(params: SceneGenParams, repeat: int = 3) -> Dict[str, dict]:
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        scene_path = os.path.join(tmp_dir, "bench.oct")
+        with open(scene_path, "wb") as scene_file:
+            node_count = generate_scene(scene_file, params)
+        xml_path = os.path.join(tmp_dir, "bench.xml")
+        texture_folder = os.path.join(tmp_dir, "textures")
+        out_path = os.path.join(tmp_dir, "bench_enc.oct")
+
+        results = {}
+        for name, func, args, size_path in (
+                ("scene_dec", scene_dec.main, (scene_path, xml_path, texture_folder), scene_path),
+                ("scene_enc", scene_enc.main, (xml_path, out_path, params.endianness, texture_folder), out_path)):
+            runs = [measure_in_process(func, args) for _ in range(repeat)]
+            # the fastest run is the one with the least noise
+            seconds = min(run_seconds for run_seconds, _ in runs)
+            peak_rss = max((run_rss for _, run_rss in runs if run_rss is not None), default=None)
+            size = os.path.getsize(size_path)
+            results[name] = {
+                "seconds": seconds,
+                "mb_per_s": size / 0x100000 / seconds,
+                "nodes_per_s": node_count / seconds,
+                "peak_rss": peak_rss,
+                "size": size,
+                "nodes": node_count,
+            }
+        return results
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def load_history(history_path: str) -> List[dict]:
+    if not os.path.isfile(history_path):
+        return []
+    with open(history_path, "r", encoding="utf-8") as history_file:
+        return [json.loads(line) for line in history_file if line.strip()]
+
+
+def find_regressions(previous: dict, current: dict, threshold: float) -> List[str]:
+    regressions = []
+    for name, result in current["results"].items():
+        previous_result = previous["results"].get(name)
+        if previous_result is None:
+            continue
+        slowdown = result["seconds"] / previous_result["seconds"] - 1
+        if slowdown > threshold:
+            regressions.append(f"{name} got {slowdown:.1%} slower "
+                               f"({previous_result['seconds']:.4f}s -> {result['seconds']:.4f}s)")
+    return regressions
+
+
+def main(params: SceneGenParams, repeat: int = 3, history_path: Optional[str] = None, label: str = "",
+         threshold: float = 0.1) -> List[str]:
+    results = run_benchmark(params, repeat)
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "label": label,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params.to_dict(),
+        "results": results,
+    }
+
+    for name, result in results.items():
+        peak_rss = f"{result['peak_rss'] / 0x100000:.1f} MiB" if result["peak_rss"] is not None else "unknown"
+        print(f"{name}: {result['seconds']:.4f}s, {result['mb_per_s']:.2f} MB/s, "
+              f"{result['nodes_per_s']:.0f} nodes/s, peak rss {peak_rss}")
+
+    regressions = []
+    if history_path is not None:
+        # only runs with the same parameters can be compared
+        previous_entries = [previous for previous in load_history(history_path)
+                            if previous["params"] == entry["params"]]
+        if previous_entries:
+            regressions = find_regressions(previous_entries[-1], entry, threshold)
+            for regression in regressions:
+                print(f"Regression: {regression}")
+        with open(history_path, "a", encoding="utf-8") as history_file:
+            history_file.write(json.dumps(entry) + "\n")
+    return regressions
+
+
+def run_from_args(args: Sequence[str]):
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        prog="scene_bench(.py) Written by TKFRvision",
+        description="A program to benchmark scene_dec and scene_enc on synthetic scene files."
+    )
+    add_gen_args(arg_parser)
+    arg_parser.add_argument("-r", dest="repeat", type=int, default=3, help="How often every tool gets run.")
+    arg_parser.add_argument("--history", dest="history_file",
+                            help="A json lines file the results get appended to. The results are compared to the "
+                                 "last run with the same parameters.")
+    arg_parser.add_argument("--label", default="", help="A label to store with the results like a commit hash.")
+    arg_parser.add_argument("--threshold", type=float, default=0.1,
+                            help="How much slower a tool can get before it counts as a regression.")
+    arg_parser.add_argument("--fail-on-regression", dest="fail_on_regression", action="store_true",
+                            help="Exit with an error code if there is a regression.")
+    parsed_args = arg_parser.parse_args(args)
+
+    if parsed_args.history_file:
+        assert not os.path.isdir(parsed_args.history_file), "History file destination is invalid."
+
+    regressions = main(params_from_args(parsed_args), parsed_args.repeat, parsed_args.history_file,
+                       parsed_args.label, parsed_args.threshold)
+    if regressions and parsed_args.fail_on_regression:
+        sys.exit(1)
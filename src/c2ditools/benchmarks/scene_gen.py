@@ -0,0 +1,184 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import random
+import struct
+from typing import BinaryIO, Sequence
+
+from ..scene.scene_types import SceneHeader, SceneNode, TypeLayout, TYPE_LAYOUTS, TYPE_IDS
+from ..utils import get_str_endianness, Endianness
+
+# every type except the ones only used for textures
+_NODE_TYPES = tuple(type_int for type_int in TYPE_LAYOUTS if type_int != TYPE_IDS["uint24_uint8_bin"])
+
+
+class SceneGenParams:
+    def __init__(self, depth: int = 3, fan_out: int = 6, string_count: int = 256, array_length: int = 32,
+                 blob_count: int = 4, blob_size: int = 0x40000, endianness: Endianness = "little", seed: int = 0):
+        self.depth = depth
+        self.fan_out = fan_out
+        self.string_count = string_count
+        self.array_length = array_length
+        self.blob_count = blob_count
+        self.blob_size = blob_size
+        self.endianness = endianness
+        self.seed = seed
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+class _SceneGenerator:
+    def __init__(self, params: SceneGenParams):
+        self.params = params
+        self.random = random.Random(params.seed)
+        self.str_endianness = get_str_endianness(params.endianness)
+        # names are valid xml tags so the files survive a trip through scene_dec and scene_enc
+        half_count = max(params.string_count // 2, 1)
+        self.names = [f"Node{index}" for index in range(half_count)]
+        self.values = [f"value{index}" for index in range(max(params.string_count - half_count, 1))]
+        self.string_table = [""] + self.names + ["Texture", "Name", "Data"] + self.values + [""]
+        self.node_count = 0
+
+    def _get_name_index(self) -> int:
+        return 1 + self.random.randrange(len(self.names))
+
+    def _get_value_index(self) -> int:
+        return len(self.names) + 4 + self.random.randrange(len(self.values))
+
+    def _pack_value(self, kind: str) -> bytes:
+        endianness = self.params.endianness
+        match kind:
+            case "string":
+                return self._get_value_index().to_bytes(2, endianness, signed=False)
+            case "float":
+                return struct.pack(self.str_endianness + "f", self.random.uniform(-1000, 1000))
+            case "int8":
+                return self.random.randint(-128, 127).to_bytes(1, endianness, signed=True)
+            case "uint8":
+                return self.random.randrange(0x100).to_bytes(1, endianness, signed=False)
+            case "uint16":
+                return self.random.randrange(0x10000).to_bytes(2, endianness, signed=False)
+            case "int24":
+                # scene_enc writes int24 lists unsigned, so no negative values
+                return self.random.randrange(0x800000).to_bytes(3, endianness, signed=False)
+            case "uint24":
+                return self.random.randrange(0x1000000).to_bytes(3, endianness, signed=False)
+            case "uint32":
+                return self.random.randrange(0x100000000).to_bytes(4, endianness, signed=False)
+        raise ValueError(f"Unknown field kind {kind}.")
+
+    def _pack_payload(self, layout: TypeLayout) -> bytes:
+        payload = b"".join(self._pack_value(field) for field in layout.fields)
+        if layout.count_size:
+            count = min(self.random.randint(1, max(self.params.array_length, 1)) if self.params.array_length else 0,
+                        layout.max_count)
+            payload += count.to_bytes(layout.count_size, self.params.endianness, signed=False)
+            if layout.element == "uint8":
+                payload += self.random.randbytes(count)
+            else:
+                payload += b"".join(self._pack_value(layout.element) for _ in range(count))
+        return payload
+
+    def _write_node(self, output_stream: BinaryIO, level: int, type_int: int, str_index: int, payload: bytes):
+        output_stream.write(SceneNode(level, type_int, str_index).to_bytes(self.params.endianness))
+        output_stream.write(payload)
+        self.node_count += 1
+
+    def _write_texture(self, output_stream: BinaryIO, level: int, texture_index: int):
+        endianness = self.params.endianness
+        self._write_node(output_stream, level, TYPE_IDS[None], self.string_table.index("Texture"), b"")
+        # every texture needs its own name so scene_dec doesn't overwrite them
+        name_index = len(self.names) + 4 + texture_index % len(self.values)
+        self._write_node(output_stream, level + 1, TYPE_IDS["reference_string"], self.string_table.index("Name"),
+                         name_index.to_bytes(2, endianness, signed=False))
+        blob_size = min(self.params.blob_size, 0xFFFFFF)
+        self._write_node(output_stream, level + 1, TYPE_IDS["uint24_uint8_bin"], self.string_table.index("Data"),
+                         blob_size.to_bytes(3, endianness, signed=False) + self.random.randbytes(blob_size))
+
+    def _write_tree(self, output_stream: BinaryIO, level: int):
+        for _ in range(self.params.fan_out):
+            type_int = self.random.choice(_NODE_TYPES)
+            self._write_node(output_stream, level, type_int, self._get_name_index(),
+                             self._pack_payload(TYPE_LAYOUTS[type_int]))
+            if level < self.params.depth:
+                self._write_tree(output_stream, level + 1)
+
+    def write(self, output_stream: BinaryIO) -> int:
+        output_stream.write(b"\x00" * SceneHeader.get_size())
+        string_table_size = output_stream.write(b"\x00".join(cur_string.encode("utf-8")
+                                                             for cur_string in self.string_table))
+        tree_start = output_stream.tell()
+        output_stream.write(SceneNode(0, 1, 0).to_bytes(self.params.endianness))
+
+        self._write_tree(output_stream, 1)
+        # value strings are unique per texture so there can't be more textures than values
+        for texture_index in range(min(self.params.blob_count, len(self.values))):
+            self._write_texture(output_stream, 1, texture_index)
+
+        tree_size = output_stream.tell() - tree_start
+        output_stream.seek(0)
+        output_stream.write(SceneHeader(string_table_size, tree_size, self.params.endianness).to_bytes())
+        output_stream.seek(0, os.SEEK_END)
+        return self.node_count
+
+
+def generate_scene(output_stream: BinaryIO, params: SceneGenParams) -> int:
+    """Writes a random but valid scene file and returns the amount of nodes in it."""
+    return _SceneGenerator(params).write(output_stream)
+
+
+def main(out_file: str, params: SceneGenParams):
+    with open(out_file, "wb") as scene_file:
+        node_count = generate_scene(scene_file, params)
+    print(f"Generated {node_count} nodes ({os.path.getsize(out_file) / 0x100000:.2f} MiB).")
+
+
+def add_gen_args(arg_parser):
+    defaults = SceneGenParams()
+    arg_parser.add_argument("--depth", type=int, default=defaults.depth, help="The depth of the node tree.")
+    arg_parser.add_argument("--fan-out", dest="fan_out", type=int, default=defaults.fan_out,
+                            help="The amount of children every node has.")
+    arg_parser.add_argument("--strings", dest="string_count", type=int, default=defaults.string_count,
+                            help="The size of the string table.")
+    arg_parser.add_argument("--array-length", dest="array_length", type=int, default=defaults.array_length,
+                            help="The maximum length of arrays.")
+    arg_parser.add_argument("--blobs", dest="blob_count", type=int, default=defaults.blob_count,
+                            help="The amount of textures.")
+    arg_parser.add_argument("--blob-size", dest="blob_size", type=int, default=defaults.blob_size,
+                            help="The size of every texture in bytes.")
+    arg_parser.add_argument("-c", dest="endianness", action="store_const", const="big", default="little",
+                            help="Generate a console (big endian) scene file.")
+    arg_parser.add_argument("--seed", type=int, default=defaults.seed, help="The seed for the random values.")
+
+
+def params_from_args(parsed_args) -> SceneGenParams:
+    return SceneGenParams(parsed_args.depth, parsed_args.fan_out, parsed_args.string_count, parsed_args.array_length,
+                          parsed_args.blob_count, parsed_args.blob_size, parsed_args.endianness, parsed_args.seed)
+
+
+def run_from_args(args: Sequence[str]):
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        prog="scene_gen(.py) Written by TKFRvision",
+        description="A program to generate synthetic scene files for benchmarks and tests."
+    )
+    arg_parser.add_argument("out_file", help="The scene file to generate.")
+    add_gen_args(arg_parser)
+    parsed_args = arg_parser.parse_args(args)
+
+    assert not os.path.isdir(parsed_args.out_file), "Output file destination is invalid."
+
+    main(parsed_args.out_file, params_from_args(parsed_args))
@@ -0,0 +1,409 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+import uuid
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from xml.etree import ElementTree
+
+from .api import encode_scene, json_to_scene
+from .archives.archive_utils import MD5_HEADER, PackedMember, pack_member, scan_folder
+from .scene import scene_json
+from .scene.scene_cache import SceneCache
+from .scene.scene_enc import get_sidecar_path
+from .utils import Endianness
+
+_STATE_VERSION = 2
+KIND_ASSET = "asset"
+KIND_XML = "xml"
+KIND_JSON = "json"
+# crc and size of the uncompressed data, followed by the md5 field and the compressed data
+_STORED_MEMBER = struct.Struct("<IQ")
+_MD5_FIELD_SIZE = len(MD5_HEADER) + 16
+
+
+class BuildInput:
+    """A member of the archive and the files it is made of."""
+
+    def __init__(self, name: str, path: str, kind: str, texture_folder: Optional[str] = None,
+                 dependencies: Sequence[str] = ()):
+        self.name = name
+        self.path = path
+        self.kind = kind
+        self.texture_folder = texture_folder
+        self.dependencies = dependencies
+
+
+class Manifest:
+    """The json file that describes a project. Relative paths are relative to the manifest.
+
+    {"output": "build/Cars2.zip", "encrypted": false, "endianness": "little", "state": "build/Cars2.zip.state.json",
+     "members": "build/Cars2.zip.members",
+     "scenes": [{"src": "scenes", "textures": "textures", "dest": "", "include": [], "exclude": []}],
+     "assets": [{"src": "assets", "dest": "", "include": [], "exclude": ["*.psd"]}]}"""
+
+    def __init__(self, manifest_path: str):
+        with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+            document = json.load(manifest_file)
+        if not isinstance(document, dict) or not isinstance(document.get("output"), str):
+            raise ValueError("The manifest needs an output.")
+        base_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+        def resolve(path: Optional[str]) -> Optional[str]:
+            return os.path.join(base_dir, path) if path is not None else None
+
+        self.output = resolve(document["output"])
+        self.state = resolve(document.get("state", document["output"] + ".state.json"))
+        # the packed members of the last build so unchanged files aren't encoded and compressed again
+        self.members = resolve(document.get("members", document["output"] + ".members"))
+        self.encrypted = bool(document.get("encrypted", False))
+        self.endianness: Optional[Endianness] = document.get("endianness")
+        if self.endianness not in (None, "little", "big"):
+            raise ValueError(f"Unknown endianness {self.endianness}.")
+        self.scenes = [self._read_source(source, resolve, True) for source in document.get("scenes", ())]
+        self.assets = [self._read_source(source, resolve, False) for source in document.get("assets", ())]
+
+    @staticmethod
+    def _read_source(source: dict, resolve, with_textures: bool) -> dict:
+        if not isinstance(source, dict) or not isinstance(source.get("src"), str):
+            raise ValueError("Every source in the manifest needs a src folder.")
+        if not os.path.isdir(resolve(source["src"])):
+            raise ValueError(f"The folder {source['src']} was not found.")
+        dest = source.get("dest", "").strip("/")
+        return {
+            "src": resolve(source["src"]),
+            "textures": resolve(source.get("textures")) if with_textures else None,
+            "dest": dest + "/" if dest else "",
+            "include": source.get("include", ()),
+            "exclude": source.get("exclude", ()),
+        }
+
+    def collect_inputs(self) -> Dict[str, BuildInput]:
+        build_inputs = {}
+        # the archive and the state can be inside of a source folder
+        skip = {os.path.abspath(path) for path in (self.output, self.output + ".tmp", self.state, self.state + ".tmp")}
+        members_prefix = os.path.abspath(self.members) + os.sep
+
+        def add(build_input: BuildInput):
+            path = os.path.abspath(build_input.path)
+            if path in skip or path.startswith(members_prefix):
+                return
+            if build_input.name in build_inputs:
+                raise ValueError(f"{build_input.name} is in the archive more than once.")
+            build_inputs[build_input.name] = build_input
+
+        for source in self.scenes:
+            for internal_path, path, _ in scan_folder(source["src"], source["include"], source["exclude"]):
+                lower_path = internal_path.lower()
+                if lower_path.endswith(".xml"):
+                    # the same layout scene_dec --batch and scene_enc --batch use
+                    texture_folder = os.path.join(source["textures"], internal_path[:-4]) \
+                        if source["textures"] is not None else None
+                    add(BuildInput(source["dest"] + internal_path[:-4], path, KIND_XML, texture_folder))
+                elif lower_path.endswith(".json"):
+                    add(BuildInput(source["dest"] + internal_path[:-5], path, KIND_JSON,
+                                   dependencies=[scene_json.get_sidecar_path(path)]))
+        for source in self.assets:
+            for internal_path, path, _ in scan_folder(source["src"], source["include"], source["exclude"]):
+                add(BuildInput(source["dest"] + internal_path, path, KIND_ASSET))
+        return build_inputs
+
+
+class BuildState:
+    """Remembers the hashes of the inputs and of the last archive so unchanged files aren't hashed and unchanged
+    projects aren't packed again."""
+
+    def __init__(self, state_path: str):
+        self.state_path = state_path
+        self.files: Dict[str, list] = {}
+        # xml path -> hash of the xml, filepath attributes in it
+        self.references: Dict[str, list] = {}
+        self.archive_key: Optional[str] = None
+        try:
+            with open(state_path, "r", encoding="utf-8") as state_file:
+                document = json.load(state_file)
+            if document.get("version") == _STATE_VERSION:
+                self.files = document["files"]
+                self.references = document["references"]
+                self.archive_key = document["archive_key"]
+        except (OSError, ValueError, KeyError):
+            pass  # building everything again is always fine
+        self._used_files: Dict[str, list] = {}
+        self._used_references: Dict[str, list] = {}
+
+    def hash_file(self, path: str) -> str:
+        stat_result = os.stat(path)
+        entry = self.files.get(path)
+        if entry is None or entry[0] != stat_result.st_mtime_ns or entry[1] != stat_result.st_size:
+            sha256_hash = hashlib.sha256()
+            with open(path, "rb") as file:
+                for chunk in iter(lambda: file.read(0x100000), b""):
+                    sha256_hash.update(chunk)
+            entry = [stat_result.st_mtime_ns, stat_result.st_size, sha256_hash.hexdigest()]
+        self._used_files[path] = entry
+        return entry[2]
+
+    def get_references(self, xml_path: str) -> List[str]:
+        """Returns the filepath attributes of a xml file. The xml is only parsed again if it changed."""
+        xml_hash = self.hash_file(xml_path)
+        entry = self.references.get(xml_path)
+        if entry is None or entry[0] != xml_hash:
+            entry = [xml_hash, [element.get("filepath") for element in ElementTree.parse(xml_path).iter()
+                                if element.get("filepath")]]
+        self._used_references[xml_path] = entry
+        return entry[1]
+
+    def save(self, archive_key: str):
+        self.archive_key = archive_key
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as state_file:
+            json.dump({"version": _STATE_VERSION, "archive_key": archive_key, "files": self._used_files,
+                       "references": self._used_references}, state_file)
+        os.replace(tmp_path, self.state_path)
+
+
+def get_member_key(build_input: BuildInput, state: BuildState, endianness: Optional[Endianness]) -> str:
+    sha256_hash = hashlib.sha256(f"{build_input.kind}\x00{endianness}\x00".encode("utf-8"))
+    sha256_hash.update(bytes.fromhex(state.hash_file(build_input.path)))
+    if build_input.kind == KIND_XML:
+        # like scene_enc --cache the key covers every file the xml references, even outside of its texture folder
+        for filepath in state.get_references(build_input.path):
+            sidecar_path = get_sidecar_path(filepath, build_input.texture_folder)
+            sha256_hash.update(b"\x00" + filepath.encode("utf-8") + bytes.fromhex(state.hash_file(sidecar_path)))
+    for dependency in sorted(build_input.dependencies):
+        relative_path = os.path.relpath(dependency, build_input.texture_folder or os.path.dirname(build_input.path))
+        sha256_hash.update(b"\x00" + relative_path.encode("utf-8") + bytes.fromhex(state.hash_file(dependency)))
+    return sha256_hash.hexdigest()
+
+
+def get_archive_key(member_keys: Dict[str, str], encrypted: bool) -> str:
+    sha256_hash = hashlib.sha256(f"{_STATE_VERSION}\x00{encrypted}".encode("utf-8"))
+    for name in sorted(member_keys):
+        sha256_hash.update(f"\x00{name}\x00{member_keys[name]}".encode("utf-8"))
+    return sha256_hash.hexdigest()
+
+
+def encode_scene_file(build_input: BuildInput, endianness: Optional[Endianness]) -> bytes:
+    """Encodes a xml or json file like scene_enc does but in memory."""
+    if build_input.kind == KIND_JSON:
+        with open(build_input.path, "r", encoding="utf-8") as json_file:
+            document = json.load(json_file)
+        with open(build_input.dependencies[0], "rb") as sidecar_file:
+            return json_to_scene(document, sidecar_file.read(), endianness)
+
+    root = ElementTree.parse(build_input.path).getroot()
+    textures = {}
+    for element in root.iter():
+        if filepath := element.get("filepath"):
+            with open(get_sidecar_path(filepath, build_input.texture_folder), "rb") as texture_file:
+                textures[filepath] = texture_file.read()
+    return encode_scene(root, endianness or "little", textures)
+
+
+def load_stored_member(members_dir: str, member_key: str, name: str) -> Optional[PackedMember]:
+    try:
+        with open(os.path.join(members_dir, member_key), "rb") as member_file:
+            stored_data = member_file.read()
+    except FileNotFoundError:
+        return None
+    crc32, file_size = _STORED_MEMBER.unpack_from(stored_data)
+    data_start = _STORED_MEMBER.size + _MD5_FIELD_SIZE
+    zip_info = zipfile.ZipInfo(name)
+    zip_info.compress_type = zipfile.ZIP_DEFLATED
+    zip_info.CRC = crc32
+    zip_info.file_size = file_size
+    zip_info.compress_size = len(stored_data) - data_start
+    return PackedMember(zip_info, stored_data[data_start:], stored_data[_STORED_MEMBER.size:data_start])
+
+
+def store_member(members_dir: str, member_key: str, packed_member: PackedMember):
+    os.makedirs(members_dir, exist_ok=True)
+    tmp_path = os.path.join(members_dir, f"{member_key}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as member_file:
+        member_file.write(_STORED_MEMBER.pack(packed_member.zip_info.CRC, packed_member.zip_info.file_size))
+        member_file.write(packed_member.md5_field)
+        member_file.write(packed_member.compressed_data)
+    os.replace(tmp_path, os.path.join(members_dir, member_key))
+
+
+def prune_stored_members(members_dir: str, member_keys: Iterable[str]):
+    """Removes the members that aren't part of the current build."""
+    if not os.path.isdir(members_dir):
+        return
+    member_keys = set(member_keys)
+    for filename in os.listdir(members_dir):
+        if filename not in member_keys:
+            os.remove(os.path.join(members_dir, filename))
+
+
+# packed member or None if it failed, where it came from (one of the stats), error
+BuildResultType = Tuple[Optional[PackedMember], Optional[str], Optional[str]]
+
+
+def _build_member(build_input: BuildInput, member_key: str, endianness: Optional[Endianness],
+                  cache_dir: Optional[str], members_dir: str) -> BuildResultType:
+    try:
+        packed_member = load_stored_member(members_dir, member_key, build_input.name)
+        if packed_member is not None:
+            return packed_member, "unchanged", None
+        if build_input.kind == KIND_ASSET:
+            with open(build_input.path, "rb") as asset_file:
+                packed_member, source = pack_member(build_input.name, asset_file), "packed"
+        elif cache_dir is None:
+            packed_member, source = pack_member(build_input.name, encode_scene_file(build_input, endianness)), "encoded"
+        else:
+            data, hit = SceneCache(cache_dir).load(member_key, lambda: encode_scene_file(build_input, endianness))
+            packed_member, source = pack_member(build_input.name, data), "cached" if hit else "encoded"
+        store_member(members_dir, member_key, packed_member)
+        return packed_member, source, None
+    except Exception as exception:
+        return None, None, f"{type(exception).__name__}: {exception}"
+
+
+def iter_built_members(executor: ProcessPoolExecutor, build_inputs: Sequence[BuildInput], member_keys: Dict[str, str],
+                       endianness: Optional[Endianness], cache_dir: Optional[str], members_dir: str, window: int,
+                       stats: Dict[str, int]) -> Iterator[PackedMember]:
+    """Builds the members in parallel and yields them in order. Only window members are in memory at once. Inputs
+    with the same key as an earlier one reuse its packed member."""
+    # how many inputs still need the packed member of a key
+    remaining = Counter(member_keys[build_input.name] for build_input in build_inputs)
+    originals: Dict[str, Optional[PackedMember]] = {}
+    submitted = set()
+    pending = deque()
+    next_index = 0
+    while pending or next_index < len(build_inputs):
+        while next_index < len(build_inputs) and len(pending) < window:
+            build_input = build_inputs[next_index]
+            member_key = member_keys[build_input.name]
+            future = None
+            if member_key not in submitted:
+                submitted.add(member_key)
+                future = executor.submit(_build_member, build_input, member_key, endianness, cache_dir, members_dir)
+            pending.append((build_input, future))
+            next_index += 1
+
+        build_input, future = pending.popleft()
+        member_key = member_keys[build_input.name]
+        remaining[member_key] -= 1
+        if future is None:
+            original = originals[member_key]
+            if not remaining[member_key]:
+                del originals[member_key]
+            if original is None:
+                print(f"FAILED {build_input.name}: Same content as a file that failed.")
+                stats["failed"] += 1
+                continue
+            stats["duplicates"] += 1
+            yield original.copy_as(build_input.name)
+            continue
+
+        packed_member, source, error = future.result()
+        if remaining[member_key]:
+            originals[member_key] = packed_member
+        if packed_member is None:
+            print(f"FAILED {build_input.name}: {error}")
+            stats["failed"] += 1
+            continue
+        stats[source] += 1
+        yield packed_member
+
+
+def main(manifest_path: str, workers: Optional[int] = None, cache: Optional[SceneCache] = None,
+         force: bool = False) -> bool:
+    start_time = time.perf_counter()
+    manifest = Manifest(manifest_path)
+    build_inputs = manifest.collect_inputs()
+    state = BuildState(manifest.state)
+    member_keys = {}
+    failed_count = 0
+    for name, build_input in build_inputs.items():
+        try:
+            member_keys[name] = get_member_key(build_input, state, manifest.endianness)
+        except Exception as exception:
+            # for example a json file without its .bin file or a xml referencing a missing texture
+            print(f"FAILED {name}: {type(exception).__name__}: {exception}")
+            failed_count += 1
+    if failed_count:
+        print(f"{failed_count} files failed, {manifest.output} was not changed.")
+        return False
+    archive_key = get_archive_key(member_keys, manifest.encrypted)
+    if not force and archive_key == state.archive_key and os.path.isfile(manifest.output):
+        print(f"{manifest.output} is up to date.")
+        return True
+
+    if manifest.encrypted:
+        from .archives.whyjustwhy import write_packed_archive
+    else:
+        from .archives.why import write_packed_archive
+    os.makedirs(os.path.dirname(manifest.output), exist_ok=True)
+
+    stats = {"unchanged": 0, "encoded": 0, "cached": 0, "packed": 0, "duplicates": 0, "failed": 0}
+    tmp_path = manifest.output + ".tmp"
+    try:
+        with ProcessPoolExecutor(workers) as executor:
+            with open(tmp_path, "wb") as archive_file:
+                write_packed_archive(iter_built_members(
+                    executor, [build_inputs[name] for name in sorted(build_inputs)], member_keys, manifest.endianness,
+                    cache.cache_dir if cache is not None else None, manifest.members,
+                    (workers or os.cpu_count() or 1) * 4, stats),
+                    archive_file)
+    except BaseException:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if stats["failed"]:
+        # never replace a working archive with an incomplete one
+        os.remove(tmp_path)
+        print(f"{stats['failed']} files failed, {manifest.output} was not changed.")
+        return False
+
+    os.replace(tmp_path, manifest.output)
+    state.save(archive_key)
+    prune_stored_members(manifest.members, member_keys.values())
+    if cache is not None and cache.max_size is not None:
+        cache.evict(cache.max_size)
+    print(f"Packed {len(build_inputs)} files into {manifest.output} in {time.perf_counter() - start_time:.2f}s "
+          f"({stats['unchanged']} unchanged files reused, {stats['encoded']} scenes encoded, {stats['cached']} from "
+          f"the cache, {stats['packed']} assets packed, {stats['duplicates']} duplicates packed once).")
+    return True
+
+
+def run_from_args(args: Sequence[str]):
+    import argparse
+    from .scene.scene_cache import add_cache_args, cache_from_args
+
+    arg_parser = argparse.ArgumentParser(
+        prog="build(.py) Written by TKFRvision",
+        description="A program to build an archive from xml files and assets described by a manifest without writing "
+                    "the scene files to the disk."
+    )
+
+    arg_parser.add_argument("manifest", help="The json file describing the project.")
+    arg_parser.add_argument("-j", dest="jobs", type=int, help="Amount of processes to use.")
+    arg_parser.add_argument("-f", dest="force", action="store_true",
+                            help="Build the archive even if nothing changed since the last build.")
+    add_cache_args(arg_parser)
+    parsed_args = arg_parser.parse_args(args)
+
+    assert os.path.isfile(parsed_args.manifest), "Manifest not found."
+
+    if not main(parsed_args.manifest, parsed_args.jobs, cache_from_args(parsed_args), parsed_args.force):
+        sys.exit(1)
@@ -0,0 +1,181 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import contextlib
+import importlib
+import io
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from typing import Optional, Sequence, TextIO
+
+from .tools import TOOL_MODULES, get_tool
+
+
+def _preload_tools():
+    # importing everything once per worker is the whole point of keeping them warm
+    for name, module_name in TOOL_MODULES.items():
+        if name in ("daemon", "watch"):
+            continue
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            pass  # the job will report it
+
+
+def run_job(job: dict) -> dict:
+    """Runs a tool like the cli would and returns its exit code and output instead of exiting."""
+    response = {"id": job.get("id"), "exit_code": 0, "error": None, "output": "", "seconds": 0.0}
+    output = io.StringIO()
+    previous_cwd = os.getcwd()
+    start_time = time.perf_counter()
+    try:
+        tool = job.get("tool")
+        if tool not in TOOL_MODULES or tool in ("daemon", "watch"):
+            raise ValueError(f"Unknown tool {tool}.")
+        args = job.get("args", [])
+        if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+            raise ValueError("args has to be a list of strings.")
+        if job.get("cwd"):
+            os.chdir(job["cwd"])
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            get_tool(tool)(args)
+    except SystemExit as system_exit:
+        # argparse and the tools exit with sys.exit
+        if isinstance(system_exit.code, int) or system_exit.code is None:
+            response["exit_code"] = system_exit.code or 0
+        else:
+            response["exit_code"] = 1
+            response["error"] = str(system_exit.code)
+    except AssertionError as assertion_error:
+        response["exit_code"] = 1
+        response["error"] = str(assertion_error) or "AssertionError"
+    except Exception as exception:
+        response["exit_code"] = 1
+        response["error"] = f"{type(exception).__name__}: {exception}"
+    finally:
+        os.chdir(previous_cwd)
+    response["output"] = output.getvalue()
+    response["seconds"] = time.perf_counter() - start_time
+    return response
+
+
+def _get_response(future: Future, job_id) -> dict:
+    try:
+        return future.result()
+    except Exception as exception:  # e.g. a worker that crashed
+        return {"id": job_id, "exit_code": 1, "error": f"{type(exception).__name__}: {exception}", "output": "",
+                "seconds": 0.0}
+
+
+def serve_stream(executor: ProcessPoolExecutor, input_stream: TextIO, output_stream: TextIO,
+                 max_pending: Optional[int] = None):
+    """Reads one json job per line and writes one json response per line as soon as the job is done."""
+    write_lock = threading.Lock()
+    pending = threading.BoundedSemaphore(max_pending) if max_pending else None
+
+    def respond(response: dict):
+        with write_lock:
+            output_stream.write(json.dumps(response) + "\n")
+            output_stream.flush()
+
+    def on_done(future: Future, job_id):
+        if pending is not None:
+            pending.release()
+        respond(_get_response(future, job_id))
+
+    futures = []
+    for line in input_stream:
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise ValueError("A job has to be a json object.")
+        except ValueError as value_error:
+            respond({"id": None, "exit_code": 1, "error": f"Invalid job: {value_error}", "output": "",
+                     "seconds": 0.0})
+            continue
+
+        # blocks reading new jobs until a running one is done
+        if pending is not None:
+            pending.acquire()
+        future = executor.submit(run_job, job)
+        future.add_done_callback(lambda done_future, job_id=job.get("id"): on_done(done_future, job_id))
+        futures.append(future)
+    wait(futures)
+
+
+def serve_socket(executor: ProcessPoolExecutor, socket_path: str, max_pending: Optional[int] = None):
+    assert hasattr(socketserver, "ThreadingUnixStreamServer"), \
+        "Unix sockets aren't supported on this platform. Use stdin instead."
+
+    class JobHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            input_stream = io.TextIOWrapper(self.rfile, encoding="utf-8")
+            output_stream = io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+            serve_stream(executor, input_stream, output_stream, max_pending)
+
+    def stop(*_):
+        raise KeyboardInterrupt
+
+    # build scripts usually stop the daemon with SIGTERM
+    signal.signal(signal.SIGTERM, stop)
+    # a socket file left behind by a daemon that didn't exit cleanly
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    with socketserver.ThreadingUnixStreamServer(socket_path, JobHandler) as server:
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+
+def main(socket_path: Optional[str] = None, workers: Optional[int] = None, max_pending: Optional[int] = None):
+    with ProcessPoolExecutor(workers, initializer=_preload_tools) as executor:
+        if socket_path is None:
+            serve_stream(executor, sys.stdin, sys.stdout, max_pending)
+        else:
+            print(f"Listening on {socket_path}.", file=sys.stderr)
+            serve_socket(executor, socket_path, max_pending)
+
+
+def run_from_args(args: Sequence[str]):
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        prog="daemon(.py) Written by TKFRvision",
+        description="Keeps warm worker processes running and runs jobs for the other tools sent as json lines "
+                    "like {\"id\": 1, \"tool\": \"scene_dec\", \"args\": [\"in.oct\", \"out.xml\"], \"cwd\": \".\"}."
+    )
+
+    arg_parser.add_argument("--socket", dest="socket_path",
+                            help="A unix socket to listen on. Without it the jobs are read from stdin and the "
+                                 "responses are written to stdout.")
+    arg_parser.add_argument("-j", dest="jobs", type=int, help="Amount of processes to use.")
+    arg_parser.add_argument("--max-pending", dest="max_pending", type=int,
+                            help="Stop reading jobs while this many jobs of a connection are queued or running.")
+    parsed_args = arg_parser.parse_args(args)
+
+    if parsed_args.max_pending is not None:
+        assert parsed_args.max_pending > 0, "--max-pending has to be at least 1."
+
+    main(parsed_args.socket_path, parsed_args.jobs, parsed_args.max_pending)
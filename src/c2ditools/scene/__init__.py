@@ -11,4 +11,7 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-from . import scene_dec, scene_enc
+from ..tools import lazy_submodules
+
+__getattr__ = lazy_submodules(__name__, ("scene_dec", "scene_enc", "scene_swap", "scene_index", "scene_json",
+                                         "scene_patch", "scene_roundtrip", "scene_diff"))
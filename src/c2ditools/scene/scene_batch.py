@@ -0,0 +1,90 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import contextlib
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, List, Optional, Sequence, Tuple
+
+SCENE_EXTENSIONS = (".oct", ".bent")
+
+# relative path, input path, output path
+BatchFileType = Tuple[str, str, str]
+
+
+class BatchResult:
+    def __init__(self, relative_path: str, size: int, seconds: float, error: Optional[str] = None):
+        self.relative_path = relative_path
+        self.size = size
+        self.seconds = seconds
+        self.error = error
+
+
+def find_files(in_dir: str, out_dir: str, extensions: Sequence[str],
+               rename: Callable[[str], str]) -> List[BatchFileType]:
+    extensions = tuple(extension.lower() for extension in extensions)
+    found_files = []
+    for folder_name, folder_names, filenames in os.walk(in_dir):
+        folder_names.sort()
+        for filename in sorted(filenames):
+            if not filename.lower().endswith(extensions):
+                continue
+            in_path = os.path.join(folder_name, filename)
+            relative_path = os.path.relpath(in_path, in_dir)
+            found_files.append((relative_path, in_path, os.path.join(out_dir, rename(relative_path))))
+    return found_files
+
+
+def _run_job(func: Callable, args: tuple, relative_path: str, size: int) -> BatchResult:
+    start_time = time.perf_counter()
+    try:
+        # the tools like to print stuff which would only clutter the progress output
+        with contextlib.redirect_stdout(io.StringIO()):
+            func(*args)
+    except Exception as exception:
+        return BatchResult(relative_path, size, time.perf_counter() - start_time,
+                           f"{type(exception).__name__}: {exception}")
+    return BatchResult(relative_path, size, time.perf_counter() - start_time)
+
+
+def run_batch(jobs: Sequence[Tuple[BatchFileType, Callable, tuple]], workers: Optional[int] = None,
+              sizes: Optional[Sequence[int]] = None) -> List[BatchResult]:
+    """Runs func(*args) for every file across a process pool and prints the progress and a summary. sizes are needed
+    if the inputs aren't files."""
+    for (_, _, out_path), _, _ in jobs:
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    if sizes is None:
+        sizes = [os.path.getsize(in_path) for (_, in_path, _), _, _ in jobs]
+
+    results = []
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(_run_job, func, args, relative_path, size)
+                   for ((relative_path, _, _), func, args), size in zip(jobs, sizes)]
+        for done_count, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            status = "FAILED" if result.error else "ok"
+            print(f"[{done_count}/{len(jobs)}] {status} {result.relative_path} ({result.seconds:.2f}s)")
+    total_seconds = time.perf_counter() - start_time
+
+    failed = [result for result in results if result.error]
+    total_mb = sum(result.size for result in results) / 0x100000
+    print(f"Converted {len(results) - len(failed)}/{len(results)} files ({total_mb:.2f} MB) "
+          f"in {total_seconds:.2f}s: {total_mb / max(total_seconds, 1e-9):.2f} MB/s, "
+          f"{len(results) / max(total_seconds, 1e-9):.1f} files/s")
+    for result in sorted(failed, key=lambda failed_result: failed_result.relative_path):
+        print(f"  {result.relative_path}: {result.error}")
+    return results
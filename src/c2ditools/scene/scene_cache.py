@@ -0,0 +1,287 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import hashlib
+import os
+import shutil
+import struct
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+_CACHE_VERSION = b"1"  # bump this if the output of the tools changes
+_OUTPUT_NAME = "output"
+_TEXTURES_NAME = "textures"
+_USED_NAME = ".used"  # the mtime of this file is used for lru eviction
+_STATS_NAME = "stats"
+_STATS_STRUCT = struct.Struct("<QQ")  # hits, misses
+_COUNTERS = ("hits", "misses")
+_O_BINARY = getattr(os, "O_BINARY", 0)  # windows
+
+# OutputPath, TextureFolder or None
+BuildFuncType = Callable[[str, Optional[str]], None]
+
+
+def hash_file(path: str) -> bytes:
+    sha256_hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(0x100000), b""):
+            sha256_hash.update(chunk)
+    return sha256_hash.digest()
+
+
+def _link_or_copy(src: str, dst: str, link: bool):
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass  # other file system or no hardlink support
+    shutil.copyfile(src, dst)
+
+
+def _get_folder_size(folder: str) -> int:
+    return sum(os.path.getsize(os.path.join(folder_name, filename))
+               for folder_name, _, filenames in os.walk(folder) for filename in filenames)
+
+
+class SceneCache:
+    """A content addressed cache for the outputs of scene_dec and scene_enc."""
+
+    def __init__(self, cache_dir: str, max_size: Optional[int] = None, link: bool = False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.link = link
+
+    @staticmethod
+    def make_key(tool: str, options: Sequence[str], hashes: Iterable[bytes]) -> str:
+        sha256_hash = hashlib.sha256(_CACHE_VERSION + b"\x00" + tool.encode("utf-8"))
+        for option in options:
+            sha256_hash.update(b"\x00" + option.encode("utf-8"))
+        for file_hash in hashes:
+            sha256_hash.update(b"\x01" + file_hash)
+        return sha256_hash.hexdigest()
+
+    @property
+    def _entries_dir(self) -> str:
+        return os.path.join(self.cache_dir, "entries")
+
+    def _get_entry_dir(self, key: str) -> str:
+        return os.path.join(self._entries_dir, key[:2], key)
+
+    @staticmethod
+    def _read_counters(stats_fd: int) -> List[int]:
+        data = os.read(stats_fd, _STATS_STRUCT.size)
+        return list(_STATS_STRUCT.unpack(data)) if len(data) == _STATS_STRUCT.size else [0] * len(_COUNTERS)
+
+    def _count(self, counter: str):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        stats_fd = os.open(os.path.join(self.cache_dir, _STATS_NAME), os.O_RDWR | os.O_CREAT | _O_BINARY)
+        try:
+            # multiple processes share the counters, without fcntl a count can get lost now and then
+            if fcntl is not None:
+                fcntl.flock(stats_fd, fcntl.LOCK_EX)
+            counters = self._read_counters(stats_fd)
+            counters[_COUNTERS.index(counter)] += 1
+            os.lseek(stats_fd, 0, os.SEEK_SET)
+            os.write(stats_fd, _STATS_STRUCT.pack(*counters))
+        finally:
+            os.close(stats_fd)  # also releases the lock
+
+    def _iter_entries(self) -> Iterable[Tuple[str, float]]:
+        if not os.path.isdir(self._entries_dir):
+            return
+        for prefix in os.listdir(self._entries_dir):
+            for key in os.listdir(os.path.join(self._entries_dir, prefix)):
+                entry_dir = os.path.join(self._entries_dir, prefix, key)
+                try:
+                    yield entry_dir, os.path.getmtime(os.path.join(entry_dir, _USED_NAME))
+                except OSError:
+                    continue  # got evicted or is incomplete
+
+    def get(self, key: str) -> Optional[str]:
+        entry_dir = self._get_entry_dir(key)
+        used_path = os.path.join(entry_dir, _USED_NAME)
+        try:
+            os.utime(used_path)
+        except OSError:
+            return None
+        return entry_dir
+
+    def put(self, key: str, build: BuildFuncType, with_textures: bool = False) -> str:
+        tmp_dir = os.path.join(self.cache_dir, "tmp", uuid.uuid4().hex)
+        os.makedirs(tmp_dir)
+        try:
+            textures_dir = os.path.join(tmp_dir, _TEXTURES_NAME) if with_textures else None
+            build(os.path.join(tmp_dir, _OUTPUT_NAME), textures_dir)
+            if textures_dir:
+                os.makedirs(textures_dir, exist_ok=True)
+            open(os.path.join(tmp_dir, _USED_NAME), "wb").close()
+
+            entry_dir = self._get_entry_dir(key)
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            try:
+                os.replace(tmp_dir, entry_dir)
+            except OSError:
+                pass  # another process was faster
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return entry_dir
+
+    def run(self, key: str, file_out: str, build: BuildFuncType, bin_folder: Optional[str] = None) -> bool:
+        """Restores the outputs of key to file_out and bin_folder, building them first if needed. True on a hit."""
+        entry_dir = self.get(key)
+        hit = entry_dir is not None
+        if hit:
+            self._count("hits")
+        else:
+            self._count("misses")
+            entry_dir = self.put(key, build, bin_folder is not None)
+
+        _link_or_copy(os.path.join(entry_dir, _OUTPUT_NAME), file_out, self.link)
+        if bin_folder is not None:
+            os.makedirs(bin_folder, exist_ok=True)
+            textures_dir = os.path.join(entry_dir, _TEXTURES_NAME)
+            for filename in os.listdir(textures_dir):
+                _link_or_copy(os.path.join(textures_dir, filename), os.path.join(bin_folder, filename), self.link)
+
+        # evicting after restoring so the entry we just used can't disappear in between
+        if not hit and self.max_size is not None:
+            self.evict(self.max_size)
+        return hit
+
+    def load(self, key: str, build: Callable[[], bytes]) -> Tuple[bytes, bool]:
+        """Like run but for outputs that are kept in memory. Returns the output and True on a hit."""
+        entry_dir = self.get(key)
+        if entry_dir is not None:
+            try:
+                with open(os.path.join(entry_dir, _OUTPUT_NAME), "rb") as output_file:
+                    data = output_file.read()
+                self._count("hits")
+                return data, True
+            except OSError:
+                pass  # got evicted in the meantime
+
+        self._count("misses")
+        data = build()
+
+        def write_output(output_path: str, _):
+            with open(output_path, "wb") as output_file:
+                output_file.write(data)
+
+        self.put(key, write_output)
+        return data, False
+
+    def evict(self, max_size: int) -> List[str]:
+        entries = sorted(self._iter_entries(), key=lambda entry: entry[1])
+        sizes = {entry_dir: _get_folder_size(entry_dir) for entry_dir, _ in entries}
+        total_size = sum(sizes.values())
+
+        evicted = []
+        for entry_dir, _ in entries:
+            if total_size <= max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= sizes[entry_dir]
+            evicted.append(entry_dir)
+        return evicted
+
+    def clear(self):
+        shutil.rmtree(self._entries_dir, ignore_errors=True)
+        self.reset_stats()
+
+    def reset_stats(self):
+        # hits and misses are the growing counter files of older versions
+        for stats_name in (_STATS_NAME,) + _COUNTERS:
+            stats_path = os.path.join(self.cache_dir, stats_name)
+            if os.path.exists(stats_path):
+                os.remove(stats_path)
+
+    def stats(self) -> Dict[str, int]:
+        try:
+            stats_fd = os.open(os.path.join(self.cache_dir, _STATS_NAME), os.O_RDONLY | _O_BINARY)
+        except FileNotFoundError:
+            counters = [0] * len(_COUNTERS)
+        else:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(stats_fd, fcntl.LOCK_SH)
+                counters = self._read_counters(stats_fd)
+            finally:
+                os.close(stats_fd)
+
+        entry_dirs = [entry_dir for entry_dir, _ in self._iter_entries()]
+        return {
+            "entries": len(entry_dirs),
+            "size": sum(_get_folder_size(entry_dir) for entry_dir in entry_dirs),
+            **dict(zip(_COUNTERS, counters)),
+        }
+
+
+def add_cache_args(arg_parser):
+    arg_parser.add_argument("--cache", dest="cache_dir", help="A folder to cache the results in.")
+    arg_parser.add_argument("--cache-size", dest="cache_size", type=int,
+                            help="The maximum size of the cache in MiB. The least recently used results get removed.")
+    arg_parser.add_argument("--cache-link", dest="cache_link", action="store_true",
+                            help="Hardlink cached results instead of copying them. "
+                                 "Don't edit the resulting files in place if you use this.")
+
+
+def cache_from_args(parsed_args) -> Optional[SceneCache]:
+    if parsed_args.cache_dir is None:
+        return None
+    max_size = parsed_args.cache_size * 0x100000 if parsed_args.cache_size is not None else None
+    return SceneCache(parsed_args.cache_dir, max_size, parsed_args.cache_link)
+
+
+def run_from_args(args: Sequence[str]):
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        prog="scene_cache(.py) Written by TKFRvision",
+        description="A program to manage the cache used by scene_dec and scene_enc."
+    )
+
+    arg_parser.add_argument("command", choices=("stats", "prune", "clear"),
+                            help="stats shows the size and hit rate, prune removes the least recently used results "
+                                 "until the cache fits into --max-size, clear removes everything.")
+    arg_parser.add_argument("cache_dir", help="The cache folder.")
+    arg_parser.add_argument("--max-size", dest="max_size", type=int, help="The size in MiB to prune to.")
+    arg_parser.add_argument("--reset", action="store_true", help="Reset the hit and miss counters after stats.")
+    parsed_args = arg_parser.parse_args(args)
+
+    assert os.path.isdir(parsed_args.cache_dir), "Cache folder not found."
+    cache = SceneCache(parsed_args.cache_dir)
+
+    match parsed_args.command:
+        case "stats":
+            stats = cache.stats()
+            lookups = stats["hits"] + stats["misses"]
+            print(f"Entries: {stats['entries']}")
+            print(f"Size: {stats['size'] / 0x100000:.2f} MiB")
+            print(f"Hits: {stats['hits']}, Misses: {stats['misses']}, "
+                  f"Hit rate: {stats['hits'] / lookups if lookups else 0:.1%}")
+            if parsed_args.reset:
+                cache.reset_stats()
+        case "prune":
+            assert parsed_args.max_size is not None, "prune requires --max-size."
+            evicted = cache.evict(parsed_args.max_size * 0x100000)
+            print(f"Removed {len(evicted)} entries.")
+        case "clear":
+            cache.clear()
@@ -15,19 +15,25 @@
 # Inspired by the work of the amazing "zzh8829"
 #
 
+import mmap
 import os
 import struct
-from typing import BinaryIO, List, Sequence, Callable, Iterator, Optional
+import sys
+import time
+from typing import BinaryIO, List, Sequence, Callable, Optional
 from xml.dom import minidom
 from xml.etree import ElementTree
 
-from .scene_types import SceneHeader, SceneNode
-from ..utils import chunk_iter, get_str_endianness, Endianness
+from . import scene_batch
+from .scene_cache import SceneCache, hash_file, add_cache_args, cache_from_args
+from .scene_profile import SceneProfiler, add_profile_args, profiler_from_args
+from .scene_types import SceneHeader, SceneNode, get_type_layout
+from ..utils import copy_range, get_str_endianness, no_phase, Endianness, StreamSlice
 
 _STRING_ENCODING = "utf-8"  # I know that's stupid
 
-# ParentElement, Element, IteratorForReading, Did I actually read this and do anything?
-StoreBinFileType = Callable[[ElementTree.Element, ElementTree.Element, Iterator[bytes]], bool]
+# ParentElement, Element, SliceForReading, Did I actually read this and do anything?
+StoreBinFileType = Callable[[ElementTree.Element, ElementTree.Element, StreamSlice], bool]
 
 
 def read_string_table(input_stream: BinaryIO, size: int) -> List[str]:
@@ -41,7 +47,8 @@ def convert_data_table_to_xml(parent: ElementTree.Element,
                               target_pos: int,
                               endianness: Endianness,
                               file_func: StoreBinFileType = None,
-                              level: int = 1):
+                              level: int = 1,
+                              profiler: Optional[SceneProfiler] = None):
     str_endianness = get_str_endianness(endianness)
 
     def read_array(element_to_write: ElementTree.Element, count_size: int, element_size: int,
@@ -56,7 +63,9 @@ def convert_data_table_to_xml(parent: ElementTree.Element,
         # this is so the implementation for file handling is more flexible
         if file_func:
             count = int.from_bytes(input_stream.read(count_size), endianness, signed=False)
-            if file_func(parent, element_to_write, chunk_iter(input_stream, input_stream.tell() + count * element_size)):
+            data_end = input_stream.tell() + count * element_size
+            if file_func(parent, element_to_write, StreamSlice(input_stream, input_stream.tell(), data_end)):
+                input_stream.seek(data_end)
                 return
             else:
                 input_stream.seek(-count_size, os.SEEK_CUR)
@@ -73,6 +82,9 @@ def convert_data_table_to_xml(parent: ElementTree.Element,
                    lambda in_data: str(struct.unpack(str_endianness + "f", in_data)[0]))
 
     while input_stream.tell() < target_pos:
+        if profiler is not None:
+            node_start_time, node_start_pos = time.perf_counter(), input_stream.tell()
+
         # read flag
         scene_node = SceneNode.from_bytes(input_stream.read(4), endianness)
 
@@ -171,6 +183,10 @@ def convert_data_table_to_xml(parent: ElementTree.Element,
             case _:
                 raise ValueError(f"Unknown DataFormat {hex(scene_node.type_int)} at {hex(input_stream.tell())}")
 
+        if profiler is not None:
+            profiler.add_node(scene_node.type_int, scene_node.level, input_stream.tell() - node_start_pos,
+                              time.perf_counter() - node_start_time)
+
         # check if we already reached the end of the file
         # this is a botch to prevent an infinite loop
         if input_stream.tell() >= target_pos:
@@ -182,12 +198,17 @@ def convert_data_table_to_xml(parent: ElementTree.Element,
 
         if scene_node.level > level:
             convert_data_table_to_xml(own_element, string_table, input_stream, target_pos, endianness, file_func,
-                                      scene_node.level)
+                                      scene_node.level, profiler)
+
 
+def convert_scene_xml(input_stream: BinaryIO, store_bin_file: StoreBinFileType = None, strict: bool = False,
+                      profiler: Optional[SceneProfiler] = None):
+    phase = profiler.phase if profiler is not None else no_phase
 
-def convert_scene_xml(input_stream: BinaryIO, store_bin_file: StoreBinFileType = None):
-    header = SceneHeader.from_file(input_stream)
-    string_table = read_string_table(input_stream, header.string_table_size)
+    with phase("header", SceneHeader.get_size()):
+        header = SceneHeader.from_file(input_stream)
+    with phase("string_table", header.string_table_size):
+        string_table = read_string_table(input_stream, header.string_table_size)
 
     # root node 1, 0
     input_stream.read(4)
@@ -201,36 +222,149 @@ def convert_scene_xml(input_stream: BinaryIO, store_bin_file: StoreBinFileType =
     # reading and converting the data
     input_stream.seek(start_pos)
     try:
-        convert_data_table_to_xml(root, string_table, input_stream, end_pos, header.endianness, store_bin_file)
+        with phase("tree", end_pos - start_pos):
+            convert_data_table_to_xml(root, string_table, input_stream, end_pos, header.endianness, store_bin_file,
+                                      profiler=profiler)
     except ValueError as value_error:
+        if strict:
+            raise
         print(value_error)
     return root
 
 
-def main(file_in: str, file_out: str, bin_folder: Optional[str] = None):
+def main(file_in: str, file_out: str, bin_folder: Optional[str] = None, strict: bool = False,
+         cache: Optional[SceneCache] = None, profiler: Optional[SceneProfiler] = None):
+    if cache is not None:
+        key = cache.make_key("scene_dec", ("textures" if bin_folder else "", "strict" if strict else ""),
+                             (hash_file(file_in),))
+        cache.run(key, file_out, lambda cache_out, cache_bin_folder: main(file_in, cache_out, cache_bin_folder, strict,
+                                                                          profiler=profiler),
+                  bin_folder)
+        return
+
+    with open(file_in, "rb") as scene_file:
+        write_scene_xml(scene_file, file_out, bin_folder, strict, profiler)
+        print(scene_file.tell())
+
+
+def write_scene_xml(input_stream: BinaryIO, file_out: str, bin_folder: Optional[str] = None, strict: bool = False,
+                    profiler: Optional[SceneProfiler] = None):
     def store_bin_file(parent_element: ElementTree.Element,
                        element: ElementTree.Element,
-                       dds_data: Iterator[bytes]) -> bool:
+                       dds_data: StreamSlice) -> bool:
         if bin_folder and parent_element.tag == "Texture" and element.tag == "Data":
             filename = f"{parent_element.find('./Name').text}.dds"
-            with open(os.path.join(bin_folder, filename), "wb") as bin_file:
-                for bin_chunk in dds_data:
-                    bin_file.write(bin_chunk)
+            with phase("sidecar", len(dds_data)), open(os.path.join(bin_folder, filename), "wb") as bin_file:
+                dds_data.copy_to(bin_file)
             element.set("filepath", filename)
             return True
         return False
 
+    phase = profiler.phase if profiler is not None else no_phase
     if bin_folder and not os.path.isdir(bin_folder):
-        os.mkdir(bin_folder)
+        os.makedirs(bin_folder, exist_ok=True)
 
-    with open(file_in, "rb") as scene_file:
-        result_xml = convert_scene_xml(scene_file, store_bin_file)
-        print(scene_file.tell())
+    result_xml = convert_scene_xml(input_stream, store_bin_file, strict, profiler)
 
-    with open(file_out, "w", encoding="utf-8") as xml_file:
+    with phase("serialize"), open(file_out, "w", encoding="utf-8") as xml_file:
         xml_file.write(minidom.parseString(ElementTree.tostring(result_xml)).toprettyxml(indent="   "))
 
 
+def extract_textures(input_stream: BinaryIO, bin_folder: str) -> int:
+    """Stores the textures like main does but only walks the node headers instead of building a xml."""
+    from .scene_index import SceneIndex, open_scene_buffer, decode_payload  # scene_index imports this module
+
+    scene_index = SceneIndex.from_file(input_stream)
+    data = open_scene_buffer(input_stream)
+    texture_count = 0
+    try:
+        for entry_index, entry in enumerate(scene_index.entries):
+            if entry.parent == -1 or scene_index.get_name(entry_index) != "Data" \
+                    or scene_index.get_name(entry.parent) != "Texture":
+                continue
+            layout = get_type_layout(entry.node.type_int, entry.offset)
+            if not layout.count_size or layout.element in ("string", "float"):
+                continue  # scene_dec only stores integer arrays as files
+
+            name_indices = [child_index for child_index in scene_index.get_children(entry.parent)
+                            if scene_index.get_name(child_index) == "Name" and child_index < entry_index]
+            if not name_indices:
+                raise ValueError(f"Texture without a name at {hex(entry.offset)}")
+            name_entry = scene_index.entries[name_indices[0]]
+            name = decode_payload(data, scene_index.get_payload_range(name_indices[0])[0],
+                                  get_type_layout(name_entry.node.type_int, name_entry.offset),
+                                  scene_index.endianness, scene_index.string_table)
+
+            payload_start, payload_end = scene_index.get_payload_range(entry_index)
+            with open(os.path.join(bin_folder, f"{name}.dds"), "wb") as bin_file:
+                input_stream.seek(payload_start + layout.fixed_size + layout.count_size)
+                copy_range(input_stream, bin_file, payload_end)
+            texture_count += 1
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+    return texture_count
+
+
+def main_textures(file_in: str, bin_folder: str):
+    os.makedirs(bin_folder, exist_ok=True)
+    with open(file_in, "rb") as scene_file:
+        print(f"Extracted {extract_textures(scene_file, bin_folder)} textures.")
+
+
+def main_archive(archive_path: str, member_name: str, file_out: Optional[str], bin_folder: Optional[str] = None,
+                 output_format: str = "xml"):
+    """Converts a member of an archive without extracting it. output_format is xml, json or textures."""
+    from ..archives.archive_reader import open_cached  # needs PyCryptodome
+
+    with open_cached(archive_path).open(member_name) as scene_file:
+        match output_format:
+            case "textures":
+                os.makedirs(bin_folder, exist_ok=True)
+                print(f"Extracted {extract_textures(scene_file, bin_folder)} textures.")
+            case "json":
+                from . import scene_json  # scene_json needs scene_index which needs this module
+                scene_json.write_scene_json(scene_file, file_out)
+            case _:
+                write_scene_xml(scene_file, file_out, bin_folder)
+
+
+def run_archive(archive_path: str, pattern: str, out_path: Optional[str], texture_folder: Optional[str],
+                output_format: str, batch: bool, extensions: Sequence[str], workers: Optional[int] = None) -> bool:
+    """Converts the members matching pattern. Returns False if any of them failed."""
+    from ..archives.archive_reader import open_cached, get_safe_member_path
+
+    reader = open_cached(archive_path)
+    if not batch and not any(char in pattern for char in "*?["):
+        assert pattern in reader.entries, f"{pattern} is not in the archive."
+        main_archive(archive_path, pattern, out_path, texture_folder, output_format)
+        return True
+
+    # like --batch every member gets its own file and texture folder
+    extensions = tuple(extension.lower() for extension in extensions)
+    member_names = [name for name in reader.glob(pattern) if name.lower().endswith(extensions)]
+    assert member_names, f"No scene files in the archive match {pattern}."
+    if output_format != "textures":
+        assert not os.path.isfile(out_path), "Output folder is invalid."
+    jobs = []
+    sizes = []
+    unsafe_count = 0
+    for member_name in member_names:
+        member_textures = get_safe_member_path(member_name, texture_folder) if texture_folder else None
+        # the texture folder is the output of --textures-only
+        member_out = member_textures if output_format == "textures" \
+            else get_safe_member_path(f"{member_name}.{output_format}", out_path)
+        if member_out is None or (texture_folder and member_textures is None):
+            print(f"FAILED {member_name}: The name points outside of the output folder.")
+            unsafe_count += 1
+            continue
+        jobs.append(((member_name, archive_path, member_out), main_archive,
+                     (archive_path, member_name, member_out, member_textures, output_format)))
+        sizes.append(reader.entries[member_name].file_size)
+    results = scene_batch.run_batch(jobs, workers, sizes)
+    return not unsafe_count and not any(result.error for result in results)
+
+
 def run_from_args(args: Sequence[str]):
     import argparse
 
@@ -239,14 +373,118 @@ def run_from_args(args: Sequence[str]):
         description="A program to convert scene format files (.oct, .bent etc.) to xml and extract the textures."
     )
 
-    arg_parser.add_argument("in_file", help="The scene file to convert.")
-    arg_parser.add_argument("out_file", help="The resulting xml file.")
+    arg_parser.add_argument("in_file", help="The scene file to convert. A folder if --batch is used. With --archive "
+                                            "the name of the member or a pattern like levels/*.oct.")
+    arg_parser.add_argument("out_file", nargs="?",
+                            help="The resulting xml file. A folder if --batch is used. Not used with --textures-only.")
     arg_parser.add_argument("-t", dest="texture_folder", help="A folder to store the textures in.")
+    arg_parser.add_argument("--format", dest="output_format", choices=("xml", "json"), default="xml",
+                            help="json is a lot faster and stores all arrays and textures in a .bin file next to the "
+                                 "json file. It's meant for scripts and can only be converted back with scene_enc.")
+    arg_parser.add_argument("--textures-only", dest="textures_only", action="store_true",
+                            help="Only store the textures without creating a xml. Requires -t.")
+    arg_parser.add_argument("--batch", action="store_true",
+                            help="Convert every scene file in the input folder and its sub folders.")
+    arg_parser.add_argument("-j", dest="jobs", type=int, help="Amount of processes to use with --batch.")
+    arg_parser.add_argument("--ext", dest="extensions", action="append",
+                            help="A file extension to convert with --batch. Can be used multiple times. "
+                                 f"Defaults to {', '.join(scene_batch.SCENE_EXTENSIONS)}.")
+    arg_parser.add_argument("--archive",
+                            help="Read the scene files from this archive (zip, why or whyjustwhy) instead of the disk. "
+                                 "If in_file is a pattern or --batch is used every match is converted.")
+    add_cache_args(arg_parser)
+    add_profile_args(arg_parser)
     parsed_args = arg_parser.parse_args(args)
+    cache = cache_from_args(parsed_args)
+    profiler = profiler_from_args(parsed_args)
+    assert profiler is None or not (parsed_args.batch or parsed_args.textures_only), \
+        "--profile doesn't work with --batch and --textures-only."
+
+    if parsed_args.archive:
+        assert os.path.isfile(parsed_args.archive), "Archive not found."
+        assert cache is None and profiler is None, "--cache and --profile don't work with --archive."
+        if parsed_args.textures_only:
+            assert parsed_args.texture_folder, "--textures-only requires a texture folder."
+            output_format = "textures"
+        else:
+            assert parsed_args.out_file is not None, "No output file specified."
+            assert parsed_args.output_format == "xml" or not parsed_args.texture_folder, \
+                "The textures are stored in the .bin file when using json."
+            output_format = parsed_args.output_format
+        if not run_archive(parsed_args.archive, parsed_args.in_file, parsed_args.out_file,
+                           parsed_args.texture_folder, output_format, parsed_args.batch,
+                           parsed_args.extensions or scene_batch.SCENE_EXTENSIONS, parsed_args.jobs):
+            sys.exit(1)
+        return
+
+    if parsed_args.textures_only:
+        assert parsed_args.texture_folder, "--textures-only requires a texture folder."
+        assert not os.path.isfile(parsed_args.texture_folder), "Texture folder is invalid."
+        if parsed_args.batch:
+            assert os.path.isdir(parsed_args.in_file), "Input folder not found."
+            # the texture folder of every file is the output
+            jobs = [(batch_file, main_textures, (batch_file[1], batch_file[2]))
+                    for batch_file in scene_batch.find_files(
+                        parsed_args.in_file, parsed_args.texture_folder,
+                        parsed_args.extensions or scene_batch.SCENE_EXTENSIONS,
+                        lambda relative_path: relative_path)]
+            if any(result.error for result in scene_batch.run_batch(jobs, parsed_args.jobs)):
+                sys.exit(1)
+        else:
+            assert os.path.isfile(parsed_args.in_file), "Input file not found."
+            main_textures(parsed_args.in_file, parsed_args.texture_folder)
+        return
+
+    assert parsed_args.out_file is not None, "No output file specified."
+    if parsed_args.output_format == "json":
+        # scene_json needs scene_index which needs this module
+        from . import scene_json
+
+        assert not parsed_args.texture_folder, "The textures are stored in the .bin file when using json."
+        assert cache is None, "--cache only works with xml."
+        if parsed_args.batch:
+            assert os.path.isdir(parsed_args.in_file), "Input folder not found."
+            assert not os.path.isfile(parsed_args.out_file), "Output folder is invalid."
+            jobs = [(batch_file, scene_json.main_dec, (batch_file[1], batch_file[2]))
+                    for batch_file in scene_batch.find_files(
+                        parsed_args.in_file, parsed_args.out_file,
+                        parsed_args.extensions or scene_batch.SCENE_EXTENSIONS,
+                        lambda relative_path: relative_path + ".json")]
+            if any(result.error for result in scene_batch.run_batch(jobs, parsed_args.jobs)):
+                sys.exit(1)
+            return
+
+        assert os.path.isfile(parsed_args.in_file), "Input file not found."
+        assert not os.path.isdir(parsed_args.out_file), "Output file destination is invalid."
+        scene_json.main_dec(parsed_args.in_file, parsed_args.out_file, profiler)
+        if profiler is not None:
+            profiler.output(parsed_args.profile)
+        return
+
+    if parsed_args.batch:
+        assert os.path.isdir(parsed_args.in_file), "Input folder not found."
+        assert not os.path.isfile(parsed_args.out_file), "Output folder is invalid."
+        if parsed_args.texture_folder:
+            assert not os.path.isfile(parsed_args.texture_folder), "Texture folder is invalid."
+
+        jobs = []
+        for batch_file in scene_batch.find_files(parsed_args.in_file, parsed_args.out_file,
+                                                 parsed_args.extensions or scene_batch.SCENE_EXTENSIONS,
+                                                 lambda relative_path: relative_path + ".xml"):
+            relative_path, in_path, out_path = batch_file
+            # every scene file gets its own texture folder so textures with the same name don't collide
+            texture_folder = os.path.join(parsed_args.texture_folder, relative_path) \
+                if parsed_args.texture_folder else None
+            jobs.append((batch_file, main, (in_path, out_path, texture_folder, True, cache)))
+        if any(result.error for result in scene_batch.run_batch(jobs, parsed_args.jobs)):
+            sys.exit(1)
+        return
 
     assert os.path.isfile(parsed_args.in_file), "Input file not found."
     assert not os.path.isdir(parsed_args.out_file), "Output file destination is invalid."
     if parsed_args.texture_folder:
         assert not os.path.isfile(parsed_args.texture_folder), "Texture folder is invalid."
 
-    main(parsed_args.in_file, parsed_args.out_file, parsed_args.texture_folder)
+    main(parsed_args.in_file, parsed_args.out_file, parsed_args.texture_folder, cache=cache, profiler=profiler)
+    if profiler is not None:
+        profiler.output(parsed_args.profile)
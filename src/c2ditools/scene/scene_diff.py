@@ -0,0 +1,173 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import hashlib
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .scene_index import SceneQuery
+from .scene_types import get_type_layout
+
+# uint8 arrays bigger than this are compared by their hash so they never have to be copied
+BLOB_SIZE = 0x10000
+
+# kind ("+", "-", "~"), path, description
+DiffType = Tuple[str, str, str]
+
+
+def get_node_keys(scene_query: SceneQuery) -> List[str]:
+    """Returns the path of every node. Siblings with the same name get numbered like Name[1]."""
+    scene_index = scene_query.index
+    keys = []
+    # (parent, name) -> amount of siblings with that name so far
+    occurrences: Dict[Tuple[int, str], int] = {}
+    for entry_index, entry in enumerate(scene_index.entries):
+        name = scene_index.get_name(entry_index)
+        occurrence = occurrences.get((entry.parent, name), 0)
+        occurrences[entry.parent, name] = occurrence + 1
+        if occurrence:
+            name = f"{name}[{occurrence}]"
+        keys.append(name if entry.parent == -1 else f"{keys[entry.parent]}/{name}")
+    return keys
+
+
+def hash_payload(data, start: int, end: int) -> str:
+    payload_hash = hashlib.sha256()
+    for chunk_start in range(start, end, 0x100000):
+        with memoryview(data) as data_view, data_view[chunk_start:min(chunk_start + 0x100000, end)] as chunk:
+            payload_hash.update(chunk)
+    return payload_hash.hexdigest()
+
+
+def format_value(value: Any, max_entries: int = 8) -> str:
+    if isinstance(value, bytes):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, list) and len(value) > max_entries:
+        return f"[{', '.join(repr(entry) for entry in value[:max_entries])}, ... ({len(value)} entries)]"
+    if isinstance(value, tuple):
+        return f"({', '.join(format_value(field, max_entries) for field in value)})"
+    return repr(value)
+
+
+def _describe_change(old_value: Any, new_value: Any) -> str:
+    old_array = old_value[-1] if isinstance(old_value, tuple) else old_value
+    new_array = new_value[-1] if isinstance(new_value, tuple) else new_value
+    description = f"{format_value(old_value)} -> {format_value(new_value)}"
+    if isinstance(old_array, (list, bytes)) and isinstance(new_array, (list, bytes)) \
+            and len(old_array) == len(new_array):
+        different = [entry_index for entry_index, (old_entry, new_entry) in enumerate(zip(old_array, new_array))
+                     if old_entry != new_entry]
+        if different:
+            description += f" ({len(different)} of {len(old_array)} entries differ, the first at {different[0]})"
+    return description
+
+
+class SceneDiffer:
+    """Compares two scene files node by node. Nodes are matched by their path, not their position."""
+
+    def __init__(self, old_query: SceneQuery, new_query: SceneQuery):
+        self.old = old_query
+        self.new = new_query
+        # same strings and endianness mean the same payload bytes are the same values
+        self._same_encoding = old_query.index.endianness == new_query.index.endianness \
+            and old_query.index.string_table == new_query.index.string_table
+
+    def _compare(self, old_index: int, new_index: int) -> Optional[str]:
+        old_entry = self.old.index.entries[old_index]
+        new_entry = self.new.index.entries[new_index]
+        old_layout = get_type_layout(old_entry.node.type_int, old_entry.offset)
+        new_layout = get_type_layout(new_entry.node.type_int, new_entry.offset)
+        if old_layout is not new_layout:
+            return f"type {old_layout.name} -> {new_layout.name}: " \
+                   f"{format_value(self.old.read_value(old_index))} -> {format_value(self.new.read_value(new_index))}"
+
+        old_start, old_end = self.old.index.get_payload_range(old_index)
+        new_start, new_end = self.new.index.get_payload_range(new_index)
+        if old_layout.element == "uint8" and not old_layout.fields and \
+                max(old_end - old_start, new_end - new_start) > BLOB_SIZE:
+            # textures etc. don't depend on the endianness
+            old_hash = hash_payload(self.old.data, old_start + old_layout.count_size, old_end)
+            new_hash = hash_payload(self.new.data, new_start + new_layout.count_size, new_end)
+            if old_hash == new_hash:
+                return None
+            return f"<{old_end - old_start - old_layout.count_size} bytes, sha256 {old_hash[:16]}> -> " \
+                   f"<{new_end - new_start - new_layout.count_size} bytes, sha256 {new_hash[:16]}>"
+
+        if self._same_encoding and self.old.data[old_start:old_end] == self.new.data[new_start:new_end]:
+            return None
+        old_value = self.old.read_value(old_index)
+        new_value = self.new.read_value(new_index)
+        # nan is never equal to itself
+        if old_value == new_value or repr(old_value) == repr(new_value):
+            return None
+        return _describe_change(old_value, new_value)
+
+    def _describe(self, scene_query: SceneQuery, entry_index: int) -> str:
+        entry = scene_query.index.entries[entry_index]
+        layout = get_type_layout(entry.node.type_int, entry.offset)
+        if not layout.name:
+            return "empty"
+        return f"{layout.name} {format_value(scene_query.read_value(entry_index))}"
+
+    def iter_diff(self) -> Iterator[DiffType]:
+        """Yields the changed and removed nodes in the order of the old file and then the added nodes in the order of
+        the new file."""
+        old_keys = get_node_keys(self.old)
+        new_keys = get_node_keys(self.new)
+        new_indices = {key: entry_index for entry_index, key in enumerate(new_keys)}
+
+        for old_index, key in enumerate(old_keys):
+            new_index = new_indices.pop(key, None)
+            if new_index is None:
+                yield "-", key, self._describe(self.old, old_index)
+            elif (change := self._compare(old_index, new_index)) is not None:
+                yield "~", key, change
+
+        # the remaining nodes are only in the new file, dicts keep the order they were filled in
+        for key, new_index in new_indices.items():
+            yield "+", key, self._describe(self.new, new_index)
+
+
+def main(old_file: str, new_file: str, summary_only: bool = False) -> Dict[str, int]:
+    counts = {"+": 0, "-": 0, "~": 0}
+    with SceneQuery(old_file) as old_query, SceneQuery(new_file) as new_query:
+        for kind, path, description in SceneDiffer(old_query, new_query).iter_diff():
+            counts[kind] += 1
+            if not summary_only:
+                print(f"{kind} {path}: {description}")
+    print(f"{counts['+']} added, {counts['-']} removed, {counts['~']} changed.")
+    return counts
+
+
+def run_from_args(args: Sequence[str]):
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        prog="scene_diff(.py) Written by TKFRvision",
+        description="A program to show which nodes of two scene format files (.oct, .bent etc.) were added, removed "
+                    "or changed. Nodes are matched by their path so the order of the string table doesn't matter."
+    )
+
+    arg_parser.add_argument("old_file", help="The original scene file.")
+    arg_parser.add_argument("new_file", help="The changed scene file.")
+    arg_parser.add_argument("-q", dest="summary_only", action="store_true", help="Only print the amount of changes.")
+    parsed_args = arg_parser.parse_args(args)
+
+    assert os.path.isfile(parsed_args.old_file), "Old file not found."
+    assert os.path.isfile(parsed_args.new_file), "New file not found."
+
+    counts = main(parsed_args.old_file, parsed_args.new_file, parsed_args.summary_only)
+    # like diff
+    if any(counts.values()):
+        sys.exit(1)
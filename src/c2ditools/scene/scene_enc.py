@@ -16,18 +16,24 @@
 #
 
 import os.path
+import sys
 
-from typing import BinaryIO, List, Sequence, Callable, Iterator, Tuple, Optional
+from typing import BinaryIO, List, Sequence, Callable, Iterable, Tuple, Optional
 from xml.etree import ElementTree
 import struct
 import itertools
-from .scene_types import SceneHeader, SceneNode
-from ..utils import get_str_endianness, chunk_iter, Endianness
+import time
+from . import scene_batch, scene_json
+from .scene_cache import SceneCache, hash_file, add_cache_args, cache_from_args
+from .scene_profile import SceneProfiler, add_profile_args, profiler_from_args
+from .scene_types import SceneHeader, SceneNode, TYPE_LAYOUTS, TYPE_IDS
+from ..utils import get_str_endianness, no_phase, Endianness, StreamSlice
 
 _TAG_BLACKLIST = "entry", "root_node"
 
-# ParentElement, Element, count, bytes to write or nothing if it should continue as usual.
-ReadBinFileType = Callable[[ElementTree.Element, ElementTree.Element], Tuple[int, Iterator[bytes]] | None]
+# ParentElement, Element, count, slice or bytes to write or nothing if it should continue as usual.
+ReadBinFileType = Callable[[ElementTree.Element, ElementTree.Element],
+                           Tuple[int, StreamSlice | Iterable[bytes]] | None]
 
 
 def create_string_table(input_xml: ElementTree.Element) -> List[str]:
@@ -60,7 +66,8 @@ def write_string_table(string_table: List[str], output_stream: BinaryIO) -> int:
 
 
 def convert_xml_to_table(cur_element: ElementTree.Element, string_table: Sequence[str], output_stream: BinaryIO,
-                         endianness: Endianness, file_reader: ReadBinFileType, level: int = 1):
+                         endianness: Endianness, file_reader: ReadBinFileType, level: int = 1,
+                         profiler: Optional[SceneProfiler] = None):
     str_endianness = get_str_endianness(endianness)
 
     def array_to_bytes(element_to_write: ElementTree.Element, count_size: int, conv: Callable[[str], bytes]) -> bytes:
@@ -69,12 +76,14 @@ def convert_xml_to_table(cur_element: ElementTree.Element, string_table: Sequenc
         return count_bytes + b"".join(conv(entry.text) for entry in element_to_write.iterfind("./entry"))
 
     def array_to_bytes_int(element_to_write: ElementTree.Element, count_size: int, element_size: int,
-                           signed: bool) -> bytes | Iterator[bytes]:
+                           signed: bool) -> bytes | Tuple[bytes, StreamSlice | Iterable[bytes]]:
         file_reader_res = file_reader(cur_element, element_to_write)
         if file_reader_res:
-            count, byte_iterator = file_reader_res
-            count_bytes = count.to_bytes(count_size, endianness, signed=False)
-            return itertools.chain((count_bytes,), byte_iterator)
+            count, data = file_reader_res
+            if count >= 1 << 8 * count_size:
+                raise ValueError(f"{element_to_write.tag} has {count} entries but "
+                                 f"{element_to_write.get('type')} can only hold {(1 << 8 * count_size) - 1}.")
+            return count.to_bytes(count_size, endianness, signed=False), data
 
         return array_to_bytes(element_to_write, count_size,
                               lambda entry: int(entry).to_bytes(element_size, endianness, signed=signed))
@@ -91,6 +100,9 @@ def convert_xml_to_table(cur_element: ElementTree.Element, string_table: Sequenc
         if element.tag == "entry":
             continue
 
+        if profiler is not None:
+            node_start_time, node_start_pos = time.perf_counter(), output_stream.tell()
+
         data_format = element.get("type")
         match data_format:
             case None:
@@ -177,51 +189,124 @@ def convert_xml_to_table(cur_element: ElementTree.Element, string_table: Sequenc
                                       string_table.index(element.tag.strip("__").replace("_____", " ")
                                                          )).to_bytes(endianness))
 
-        if isinstance(to_write, Iterator):
-            for chunk in to_write:
-                output_stream.write(chunk)
+        if isinstance(to_write, tuple):
+            count_bytes, data = to_write
+            output_stream.write(count_bytes)
+            if profiler is not None:
+                sidecar_start_time, sidecar_start_pos = time.perf_counter(), output_stream.tell()
+            if isinstance(data, StreamSlice):
+                data.copy_to(output_stream)
+            else:
+                for chunk in data:
+                    output_stream.write(chunk)
+            if profiler is not None:
+                profiler.add("sidecar", time.perf_counter() - sidecar_start_time,
+                             output_stream.tell() - sidecar_start_pos)
         else:
             output_stream.write(to_write)
 
-        convert_xml_to_table(element, string_table, output_stream, endianness, file_reader, level + 1)
+        if profiler is not None:
+            profiler.add_node(type_id, level, output_stream.tell() - node_start_pos,
+                              time.perf_counter() - node_start_time)
+
+        convert_xml_to_table(element, string_table, output_stream, endianness, file_reader, level + 1, profiler)
 
 
-def convert_xml_scene(in_xml: str, output_stream: BinaryIO, endianness: Endianness, file_reader: ReadBinFileType):
-    root_element = ElementTree.fromstring(in_xml)
+def convert_xml_scene(in_xml: str | ElementTree.Element, output_stream: BinaryIO, endianness: Endianness,
+                      file_reader: ReadBinFileType, profiler: Optional[SceneProfiler] = None):
+    phase = profiler.phase if profiler is not None else no_phase
+
+    if isinstance(in_xml, str):
+        with phase("parse", len(in_xml)):
+            root_element = ElementTree.fromstring(in_xml)
+    else:
+        root_element = in_xml
     # leave space to fill out header later
     output_stream.write(b"\x00" * SceneHeader.get_size())
 
-    string_table = create_string_table(root_element)
-    string_table_size = write_string_table(string_table, output_stream)
+    with phase("string_table"):
+        string_table = create_string_table(root_element)
+        string_table_size = write_string_table(string_table, output_stream)
 
     # root Node
     output_stream.write(SceneNode(0, 1, 0).to_bytes(endianness))
 
-    convert_xml_to_table(root_element, string_table, output_stream, endianness, file_reader)
-
-    tree_size = output_stream.tell() - string_table_size - SceneHeader.get_size()
-    output_stream.seek(0)
-    output_stream.write(SceneHeader(string_table_size, tree_size, endianness).to_bytes())
-
-
-def main(in_file: str, out_file: str, endianness: Endianness, path: Optional[str] = None):
-    def read_files(_: ElementTree.Element, element: ElementTree.Element) -> Tuple[int, Iterator[bytes]] | None:
-        if filepath := element.get("filepath"):
-            assert filepath is not None, f"This xml requires the external file {filepath}. No folder was specified."
-            if not os.path.isabs(filepath):
-                filepath = os.path.join(path, filepath)
-            assert os.path.exists(filepath), f"The file at {filepath} was not found."
+    tree_start = output_stream.tell()
+    with phase("tree"):
+        convert_xml_to_table(root_element, string_table, output_stream, endianness, file_reader, profiler=profiler)
+    if profiler is not None:
+        profiler.phases["tree"]["bytes"] += output_stream.tell() - tree_start
+
+    with phase("header", SceneHeader.get_size()):
+        tree_size = output_stream.tell() - string_table_size - SceneHeader.get_size()
+        output_stream.seek(0)
+        output_stream.write(SceneHeader(string_table_size, tree_size, endianness).to_bytes())
+
+
+def get_sidecar_path(filepath: str, path: Optional[str]) -> str:
+    if not os.path.isabs(filepath):
+        assert path is not None, f"This xml requires the external file {filepath}. No folder was specified."
+        filepath = os.path.join(path, filepath)
+    assert os.path.exists(filepath), f"The file at {filepath} was not found."
+    return filepath
+
+
+def get_sidecar_count(element: ElementTree.Element, filepath: str) -> int:
+    """Returns the amount of entries the file at filepath holds and checks if they fit into element."""
+    return get_sidecar_count_for_size(element, filepath, os.path.getsize(filepath))
+
+
+def get_sidecar_count_for_size(element: ElementTree.Element, name: str, size: int) -> int:
+    layout = TYPE_LAYOUTS[TYPE_IDS[None]]
+    if element.get("type") in TYPE_IDS:
+        layout = TYPE_LAYOUTS[TYPE_IDS[element.get("type")]]
+    if not layout.count_size or layout.element in ("string", "float"):
+        raise ValueError(f"{element.tag} references {name} but {layout.name or 'empty'} can't store files.")
+
+    count, remainder = divmod(size, layout.element_size)
+    if remainder:
+        raise ValueError(f"The size of {name} is not a multiple of {layout.element_size}.")
+    if count > layout.max_count:
+        raise ValueError(f"{name} has {count} entries but {layout.name} can only hold {layout.max_count}.")
+    return count
+
+
+def main(in_file: str, out_file: str, endianness: Endianness, path: Optional[str] = None,
+         cache: Optional[SceneCache] = None, profiler: Optional[SceneProfiler] = None):
+    if cache is not None:
+        # the key has to cover the xml and every file it references
+        hashes = [hash_file(in_file)]
+        with open(in_file, "rb") as xml_file:
+            for element in ElementTree.parse(xml_file).iter():
+                if filepath := element.get("filepath"):
+                    hashes.append(hash_file(get_sidecar_path(filepath, path)))
+        key = cache.make_key("scene_enc", (endianness,), hashes)
+        cache.run(key, out_file, lambda cache_out, _: main(in_file, cache_out, endianness, path, profiler=profiler))
+        return
+
+    phase = profiler.phase if profiler is not None else no_phase
+
+    with phase("parse", os.path.getsize(in_file)), open(in_file, "r", encoding="utf-8") as xml_file:
+        root_element = ElementTree.fromstring(xml_file.read())
+
+    # checking the sizes of the files first so we don't fail halfway through writing the scene file
+    sidecar_counts = {}
+    with phase("sidecar"):
+        for element in root_element.iter():
+            if filepath := element.get("filepath"):
+                sidecar_counts[element] = get_sidecar_count(element, get_sidecar_path(filepath, path))
+
+    def read_files(_: ElementTree.Element, element: ElementTree.Element) -> Tuple[int, StreamSlice] | None:
+        if element in sidecar_counts:
+            filepath = get_sidecar_path(element.get("filepath"), path)
             file_size = os.path.getsize(filepath)
 
-            return os.path.getsize(filepath), chunk_iter(open(filepath, "rb"), file_size, close_after=True)
+            return sidecar_counts[element], StreamSlice(open(filepath, "rb"), 0, file_size, close_after=True)
         else:
             return None
 
-    with open(in_file, "r", encoding="utf-8") as xml_file:
-        xml_content = xml_file.read()
-
     with open(out_file, "wb") as scene_file:
-        convert_xml_scene(xml_content, scene_file, endianness, read_files)
+        convert_xml_scene(root_element, scene_file, endianness, read_files, profiler)
 
 
 def run_from_args(args: Sequence[str]):
@@ -233,17 +318,71 @@ def run_from_args(args: Sequence[str]):
                     "by scene_dec to scene format files (*.oct, *.bent etc.).",
     )
 
-    arg_parser.add_argument("in_file", help="The xml file to convert.")
-    arg_parser.add_argument("out_file", help="The resulting scene file.")
+    arg_parser.add_argument("in_file", help="The xml file to convert. A folder if --batch is used.")
+    arg_parser.add_argument("out_file", help="The resulting scene file. A folder if --batch is used.")
     arg_parser.add_argument("-t", dest="texture_folder",
                             help="The texture folder to use. Use if you have a texture folder.")
-    arg_parser.add_argument("-c", dest="endianness", action="store_const", const="big", default="little",
-                            help="Use this flag to create a scene file for a console. Uses Big Endian.")
+    arg_parser.add_argument("-c", dest="endianness", action="store_const", const="big",
+                            help="Use this flag to create a scene file for a console. Uses Big Endian. "
+                                 "json files keep the endianness of the original file without it.")
+    arg_parser.add_argument("--format", dest="input_format", choices=("xml", "json"),
+                            help="The format of the input. By default json files are detected by their extension.")
+    arg_parser.add_argument("--batch", action="store_true",
+                            help="Convert every xml file in the input folder and its sub folders.")
+    arg_parser.add_argument("-j", dest="jobs", type=int, help="Amount of processes to use with --batch.")
+    add_cache_args(arg_parser)
+    add_profile_args(arg_parser)
     parsed_args = arg_parser.parse_args(args)
+    cache = cache_from_args(parsed_args)
+    profiler = profiler_from_args(parsed_args)
+    assert profiler is None or not parsed_args.batch, "--profile doesn't work with --batch."
+    input_format = parsed_args.input_format or ("json" if parsed_args.in_file.lower().endswith(".json") else "xml")
+
+    if input_format == "json":
+        assert not parsed_args.texture_folder, "The textures are stored in the .bin file when using json."
+        assert cache is None, "--cache only works with xml."
+        if parsed_args.batch:
+            assert os.path.isdir(parsed_args.in_file), "Input folder not found."
+            assert not os.path.isfile(parsed_args.out_file), "Output folder is invalid."
+            jobs = [(batch_file, scene_json.main_enc, (batch_file[1], batch_file[2], parsed_args.endianness))
+                    for batch_file in scene_batch.find_files(
+                        parsed_args.in_file, parsed_args.out_file, (".json",),
+                        lambda relative_path: relative_path[:-5])]
+            if any(result.error for result in scene_batch.run_batch(jobs, parsed_args.jobs)):
+                sys.exit(1)
+            return
+
+        assert os.path.isfile(parsed_args.in_file), "Input file not found."
+        assert not os.path.isdir(parsed_args.out_file), "Output file destination is invalid."
+        scene_json.main_enc(parsed_args.in_file, parsed_args.out_file, parsed_args.endianness, profiler)
+        if profiler is not None:
+            profiler.output(parsed_args.profile)
+        return
+
+    endianness = parsed_args.endianness or "little"
+    if parsed_args.batch:
+        assert os.path.isdir(parsed_args.in_file), "Input folder not found."
+        assert not os.path.isfile(parsed_args.out_file), "Output folder is invalid."
+        if parsed_args.texture_folder is not None:
+            assert os.path.isdir(parsed_args.texture_folder), "Texture folder is invalid."
+
+        jobs = []
+        for batch_file in scene_batch.find_files(parsed_args.in_file, parsed_args.out_file, (".xml",),
+                                                 lambda relative_path: relative_path[:-4]):
+            relative_path, in_path, out_path = batch_file
+            # scene_dec --batch stores the textures of every file in its own folder
+            texture_folder = os.path.join(parsed_args.texture_folder, relative_path[:-4]) \
+                if parsed_args.texture_folder else None
+            jobs.append((batch_file, main, (in_path, out_path, endianness, texture_folder, cache)))
+        if any(result.error for result in scene_batch.run_batch(jobs, parsed_args.jobs)):
+            sys.exit(1)
+        return
 
     assert os.path.isfile(parsed_args.in_file), "Input file not found."
     assert not os.path.isdir(parsed_args.out_file), "Output file destination is invalid."
     if parsed_args.texture_folder is not None:
         assert os.path.isdir(parsed_args.texture_folder), "Texture folder is invalid."
 
-    main(parsed_args.in_file, parsed_args.out_file, parsed_args.endianness, parsed_args.texture_folder)
+    main(parsed_args.in_file, parsed_args.out_file, endianness, parsed_args.texture_folder, cache, profiler)
+    if profiler is not None:
+        profiler.output(parsed_args.profile)
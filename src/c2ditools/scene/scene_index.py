@@ -0,0 +1,346 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import fnmatch
+import mmap
+import os
+import struct
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple
+from xml.etree import ElementTree
+
+from .scene_dec import read_string_table, convert_data_table_to_xml
+from .scene_types import SceneHeader, SceneNode, TypeLayout, FIELD_SIZES, get_type_layout
+from ..utils import get_str_endianness, Endianness
+
+_INDEX_MAGIC = b"C2SI"
+_INDEX_VERSION = 1
+# magic, version, endianness, source size, source mtime, string table size, entry count, tree start
+_INDEX_HEADER_STRUCT = "<4sBB2xQQIII"
+# parent, level and type like in the scene file, string index, offset
+_INDEX_ENTRY_STRUCT = "<iHHI"
+
+# struct format characters for the fields that struct can handle
+_FIELD_FORMATS = {
+    "string": "H",
+    "int8": "b",
+    "uint8": "B",
+    "uint16": "H",
+    "uint32": "I",
+    "float": "f",
+}
+
+
+def open_scene_buffer(input_stream: BinaryIO) -> bytes | mmap.mmap:
+    """Maps the whole scene file into memory if possible so payloads can be skipped without reading them."""
+    try:
+        return mmap.mmap(input_stream.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        input_stream.seek(0)
+        return input_stream.read()
+
+
+def get_payload_size(data: bytes | mmap.mmap, offset: int, layout: TypeLayout, endianness: Endianness) -> int:
+    """Returns the size of the payload starting at offset without reading the array entries."""
+    if not layout.count_size:
+        return layout.fixed_size
+    count_offset = offset + layout.fixed_size
+    count = int.from_bytes(data[count_offset:count_offset + layout.count_size], endianness, signed=False)
+    return layout.fixed_size + layout.count_size + count * layout.element_size
+
+
+def scan_nodes(data: bytes | mmap.mmap, start_pos: int, end_pos: int, endianness: Endianness) \
+        -> Iterator[Tuple[int, SceneNode]]:
+    """Walks only the node headers and yields the offset of every node and the node itself."""
+    node_size = SceneNode.get_size()
+    offset = start_pos
+    while offset < end_pos:
+        scene_node = SceneNode.from_bytes(data[offset:offset + node_size], endianness)
+        layout = get_type_layout(scene_node.type_int, offset)
+        yield offset, scene_node
+        offset += node_size + get_payload_size(data, offset + node_size, layout, endianness)
+    if offset > end_pos:
+        raise ValueError(f"Node payload exceeds the end of the file at {hex(end_pos)}")
+
+
+def decode_payload(data: bytes | mmap.mmap, offset: int, layout: TypeLayout, endianness: Endianness,
+                   string_table: Sequence[str]) -> Any:
+    """Decodes the payload at offset into python values. Strings get resolved using the string table."""
+    str_endianness = get_str_endianness(endianness)
+    values = []
+    for field in layout.fields:
+        field_size = FIELD_SIZES[field]
+        field_data = data[offset:offset + field_size]
+        if field in _FIELD_FORMATS:
+            value = struct.unpack(str_endianness + _FIELD_FORMATS[field], field_data)[0]
+        else:
+            value = int.from_bytes(field_data, endianness, signed=field == "int24")
+        values.append(string_table[value] if field == "string" else value)
+        offset += field_size
+
+    if layout.count_size:
+        count = int.from_bytes(data[offset:offset + layout.count_size], endianness, signed=False)
+        offset += layout.count_size
+        array_data = data[offset:offset + count * layout.element_size]
+        if layout.element == "uint8":
+            array = bytes(array_data)  # blobs like textures stay bytes
+        elif layout.element in _FIELD_FORMATS:
+            array = list(struct.unpack(f"{str_endianness}{count}{_FIELD_FORMATS[layout.element]}", array_data))
+            if layout.element == "string":
+                array = [string_table[str_index] for str_index in array]
+        else:
+            element_size = layout.element_size
+            array = [int.from_bytes(array_data[element_offset:element_offset + element_size], endianness,
+                                    signed=layout.element == "int24")
+                     for element_offset in range(0, len(array_data), element_size)]
+        values.append(array)
+
+    if not values:
+        return None
+    return values[0] if len(values) == 1 else tuple(values)
+
+
+class IndexEntry:
+    __slots__ = "parent", "node", "offset"
+
+    def __init__(self, parent: int, node: SceneNode, offset: int):
+        self.parent = parent  # index of the parent entry or -1 for top level nodes
+        self.node = node
+        self.offset = offset
+
+
+class SceneIndex:
+    """The path, type and offset of every node of a scene file."""
+
+    def __init__(self, endianness: Endianness, string_table: List[str], entries: List[IndexEntry],
+                 tree_start: int, file_size: int, source_mtime: int = 0):
+        self.endianness = endianness
+        self.string_table = string_table
+        self.entries = entries
+        self.tree_start = tree_start
+        self.file_size = file_size
+        self.source_mtime = source_mtime
+        self._paths: Optional[List[str]] = None
+        self._by_path: Optional[Dict[str, List[int]]] = None
+
+    @classmethod
+    def from_file(cls, input_stream: BinaryIO) -> "SceneIndex":
+        header = SceneHeader.from_file(input_stream)
+        string_table = read_string_table(input_stream, header.string_table_size)
+        tree_start = input_stream.tell() + SceneNode.get_size()  # skipping root node
+
+        data = open_scene_buffer(input_stream)
+        try:
+            entries = []
+            parent_stack: List[int] = []
+            for offset, scene_node in scan_nodes(data, tree_start, len(data), header.endianness):
+                while parent_stack and entries[parent_stack[-1]].node.level >= scene_node.level:
+                    parent_stack.pop()
+                entries.append(IndexEntry(parent_stack[-1] if parent_stack else -1, scene_node, offset))
+                parent_stack.append(len(entries) - 1)
+            file_size = len(data)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+        return cls(header.endianness, string_table, entries, tree_start, file_size)
+
+    @classmethod
+    def load(cls, index_stream: BinaryIO) -> "SceneIndex":
+        magic, version, endianness_int, file_size, source_mtime, string_table_size, entry_count, tree_start = \
+            struct.unpack(_INDEX_HEADER_STRUCT, index_stream.read(struct.calcsize(_INDEX_HEADER_STRUCT)))
+        if magic != _INDEX_MAGIC or version != _INDEX_VERSION:
+            raise ValueError("Not a scene index or an index of an unsupported version.")
+        endianness = "big" if endianness_int else "little"
+
+        string_table = read_string_table(index_stream, string_table_size)
+        entries = [IndexEntry(parent, SceneNode(level_type >> 10, level_type & 0x3FF, str_index), offset)
+                   for parent, level_type, str_index, offset in struct.iter_unpack(
+                       _INDEX_ENTRY_STRUCT, index_stream.read(entry_count * struct.calcsize(_INDEX_ENTRY_STRUCT)))]
+        return cls(endianness, string_table, entries, tree_start, file_size, source_mtime)
+
+    def save(self, index_stream: BinaryIO):
+        string_table_bytes = b"\x00".join(cur_string.encode("utf-8") for cur_string in self.string_table)
+        index_stream.write(struct.pack(_INDEX_HEADER_STRUCT, _INDEX_MAGIC, _INDEX_VERSION,
+                                       self.endianness == "big", self.file_size, self.source_mtime,
+                                       len(string_table_bytes), len(self.entries), self.tree_start))
+        index_stream.write(string_table_bytes)
+        index_stream.write(b"".join(struct.pack(_INDEX_ENTRY_STRUCT, entry.parent,
+                                                entry.node.level << 10 | entry.node.type_int,
+                                                entry.node.str_index, entry.offset)
+                                    for entry in self.entries))
+
+    @classmethod
+    def open(cls, scene_path: str, index_path: Optional[str] = None) -> "SceneIndex":
+        """Loads the index at index_path if it is still up to date, otherwise scans the file and saves the index."""
+        scene_stat = os.stat(scene_path)
+        if index_path is not None and os.path.isfile(index_path):
+            with open(index_path, "rb") as index_file:
+                try:
+                    scene_index = cls.load(index_file)
+                except (ValueError, struct.error):
+                    scene_index = None
+            if scene_index is not None and scene_index.file_size == scene_stat.st_size \
+                    and scene_index.source_mtime == scene_stat.st_mtime_ns:
+                return scene_index
+
+        with open(scene_path, "rb") as scene_file:
+            scene_index = cls.from_file(scene_file)
+        scene_index.source_mtime = scene_stat.st_mtime_ns
+
+        if index_path is not None:
+            with open(index_path, "wb") as index_file:
+                scene_index.save(index_file)
+        return scene_index
+
+    def get_name(self, entry_index: int) -> str:
+        return self.string_table[self.entries[entry_index].node.str_index]
+
+    def get_path(self, entry_index: int) -> str:
+        if self._paths is None:
+            self._paths = []
+            for entry in self.entries:
+                name = self.string_table[entry.node.str_index]
+                self._paths.append(name if entry.parent == -1 else f"{self._paths[entry.parent]}/{name}")
+        return self._paths[entry_index]
+
+    def find(self, path: str) -> List[int]:
+        """Returns the indices of all nodes matching path. Path can contain wildcards like "*/Texture/Name"."""
+        if self._by_path is None:
+            self._by_path = {}
+            for entry_index in range(len(self.entries)):
+                self._by_path.setdefault(self.get_path(entry_index), []).append(entry_index)
+
+        if any(wildcard in path for wildcard in "*?["):
+            return [entry_index for node_path, entry_indices in self._by_path.items()
+                    if fnmatch.fnmatchcase(node_path, path) for entry_index in entry_indices]
+        return list(self._by_path.get(path, ()))
+
+    def get_children(self, entry_index: int) -> List[int]:
+        children = []
+        for child_index in range(entry_index + 1, self.get_subtree_end_index(entry_index)):
+            if self.entries[child_index].parent == entry_index:
+                children.append(child_index)
+        return children
+
+    def get_subtree_end_index(self, entry_index: int) -> int:
+        level = self.entries[entry_index].node.level
+        end_index = entry_index + 1
+        while end_index < len(self.entries) and self.entries[end_index].node.level > level:
+            end_index += 1
+        return end_index
+
+    def get_subtree_end(self, entry_index: int) -> int:
+        end_index = self.get_subtree_end_index(entry_index)
+        return self.entries[end_index].offset if end_index < len(self.entries) else self.file_size
+
+    def get_payload_range(self, entry_index: int) -> Tuple[int, int]:
+        start = self.entries[entry_index].offset + SceneNode.get_size()
+        end = self.entries[entry_index + 1].offset if entry_index + 1 < len(self.entries) else self.file_size
+        return start, end
+
+
+class SceneQuery:
+    """Reads single nodes or subtrees of a scene file without decoding all of it."""
+
+    def __init__(self, scene_path: str, index_path: Optional[str] = None):
+        self.index = SceneIndex.open(scene_path, index_path)
+        self._scene_file = open(scene_path, "rb")
+        self._data = open_scene_buffer(self._scene_file)
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._scene_file.close()
+
+    def __enter__(self) -> "SceneQuery":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def data(self) -> bytes | mmap.mmap:
+        """The whole scene file. Only valid until the query gets closed."""
+        return self._data
+
+    def read_value(self, entry_index: int) -> Any:
+        entry = self.index.entries[entry_index]
+        layout = get_type_layout(entry.node.type_int, entry.offset)
+        payload_start, _ = self.index.get_payload_range(entry_index)
+        return decode_payload(self._data, payload_start, layout, self.index.endianness, self.index.string_table)
+
+    def read_subtree(self, entry_index: int) -> ElementTree.Element:
+        """Decodes a node and all of its children to xml like scene_dec does."""
+        entry = self.index.entries[entry_index]
+        self._scene_file.seek(entry.offset)
+        parent = ElementTree.Element("root_node")
+        convert_data_table_to_xml(parent, self.index.string_table, self._scene_file,
+                                  self.index.get_subtree_end(entry_index), self.index.endianness,
+                                  level=entry.node.level)
+        return parent[0]
+
+    def values(self, path: str) -> List[Any]:
+        return [self.read_value(entry_index) for entry_index in self.index.find(path)]
+
+    def value(self, path: str) -> Any:
+        """Returns the value of the only node at path."""
+        entry_indices = self.index.find(path)
+        if len(entry_indices) != 1:
+            raise KeyError(f"Expected exactly one node at {path}, found {len(entry_indices)}.")
+        return self.read_value(entry_indices[0])
+
+
+def main(file_in: str, paths: Sequence[str], index_path: Optional[str] = None, as_xml: bool = False):
+    with SceneQuery(file_in, index_path) as scene_query:
+        if not paths:
+            for entry_index, entry in enumerate(scene_query.index.entries):
+                layout = get_type_layout(entry.node.type_int, entry.offset)
+                print(f"{hex(entry.offset)} {layout.name or 'empty'} {scene_query.index.get_path(entry_index)}")
+            return
+
+        for path in paths:
+            for entry_index in scene_query.index.find(path):
+                if as_xml:
+                    print(ElementTree.tostring(scene_query.read_subtree(entry_index), encoding="unicode"))
+                    continue
+                value = scene_query.read_value(entry_index)
+                if isinstance(value, bytes):
+                    value = f"<{len(value)} bytes>"
+                print(f"{scene_query.index.get_path(entry_index)} = {value}")
+
+
+def run_from_args(args: Sequence[str]):
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        prog="scene_query(.py) Written by TKFRvision",
+        description="A program to read single values or parts of scene format files (.oct, .bent etc.) "
+                    "without converting the whole file."
+    )
+
+    arg_parser.add_argument("in_file", help="The scene file to read.")
+    arg_parser.add_argument("paths", nargs="*",
+                            help="Paths of the nodes to read like Texture/Name. Wildcards are supported. "
+                                 "Lists all nodes if none are specified.")
+    arg_parser.add_argument("-i", dest="index_file",
+                            help="A file to store the index in. It will be reused as long as the scene file "
+                                 "doesn't change.")
+    arg_parser.add_argument("-x", dest="as_xml", action="store_true",
+                            help="Print the nodes and their children as xml.")
+    parsed_args = arg_parser.parse_args(args)
+
+    assert os.path.isfile(parsed_args.in_file), "Input file not found."
+    if parsed_args.index_file:
+        assert not os.path.isdir(parsed_args.index_file), "Index file destination is invalid."
+
+    main(parsed_args.in_file, parsed_args.paths, parsed_args.index_file, parsed_args.as_xml)
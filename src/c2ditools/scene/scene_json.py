@@ -0,0 +1,195 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+import math
+import os
+import struct
+from typing import Any, BinaryIO, List, Optional, Sequence
+
+from .scene_index import open_scene_buffer, scan_nodes
+from .scene_profile import SceneProfiler
+from .scene_swap import byteswap_array
+from .scene_types import SceneHeader, SceneNode, FIELD_SIZES, TYPE_IDS, TYPE_LAYOUTS, get_type_layout
+from ..utils import get_str_endianness, no_phase, Endianness
+
+JSON_FORMAT = "c2ditools-scene"
+JSON_VERSION = 1
+
+# how the fields are stored in the scene file. int24 and uint24 don't have a struct format
+_FIELD_FORMATS = {"string": "H", "int8": "b", "uint8": "B", "uint16": "H", "uint32": "I", "float": "f"}
+
+
+def get_sidecar_path(json_path: str) -> str:
+    return os.path.splitext(json_path)[0] + ".bin"
+
+
+def _decode_field(data: bytes, field: str, str_endianness: str, endianness: Endianness) -> Any:
+    if field == "float":
+        value = struct.unpack(str_endianness + "f", data)[0]
+        # json can't store nan and infinity, the bit pattern also keeps the payload of nan
+        return value if math.isfinite(value) else f"0x{int.from_bytes(data, endianness, signed=False):08x}"
+    if field in _FIELD_FORMATS:
+        return struct.unpack(str_endianness + _FIELD_FORMATS[field], data)[0]
+    return int.from_bytes(data, endianness, signed=field == "int24")
+
+
+def _encode_field(value: Any, field: str, str_endianness: str, endianness: Endianness) -> bytes:
+    if field == "float" and isinstance(value, str):
+        return int(value, 16).to_bytes(4, endianness, signed=False)
+    if field in _FIELD_FORMATS:
+        return struct.pack(str_endianness + _FIELD_FORMATS[field], value)
+    return value.to_bytes(3, endianness, signed=field == "int24")
+
+
+def convert_scene_json(input_stream: BinaryIO, sidecar_stream: BinaryIO,
+                       profiler: Optional[SceneProfiler] = None) -> dict:
+    """Converts a scene file to a json document. Arrays of numbers are written to sidecar_stream as little endian
+    and referenced by their offset and count. Strings are stored as indices into the original string table so
+    encoding the document creates the same file again."""
+    phase = profiler.phase if profiler is not None else no_phase
+
+    with phase("header", SceneHeader.get_size()):
+        header = SceneHeader.from_file(input_stream)
+    with phase("string_table", header.string_table_size):
+        string_table = input_stream.read(header.string_table_size).decode("utf-8").split("\0")
+    tree_start = input_stream.tell()
+
+    endianness = header.endianness
+    str_endianness = get_str_endianness(endianness)
+    node_size = SceneNode.get_size()
+    nodes = []
+    sidecar_size = 0
+    data = open_scene_buffer(input_stream)
+    try:
+        with phase("tree", len(data) - tree_start):
+            # the root node is stored like every other node
+            for offset, scene_node in scan_nodes(data, tree_start, len(data), endianness):
+                layout = get_type_layout(scene_node.type_int, offset)
+                offset += node_size
+                values: List[Any] = []
+                for field in layout.fields:
+                    field_size = FIELD_SIZES[field]
+                    values.append(_decode_field(data[offset:offset + field_size], field, str_endianness, endianness))
+                    offset += field_size
+
+                if layout.count_size:
+                    count = int.from_bytes(data[offset:offset + layout.count_size], endianness, signed=False)
+                    offset += layout.count_size
+                    array = data[offset:offset + count * layout.element_size]
+                    if layout.element == "string":
+                        values.append(list(struct.unpack(f"{str_endianness}{count}H", array)))
+                    else:
+                        if endianness == "big":
+                            array = byteswap_array(array, layout.element_size)
+                        sidecar_stream.write(array)
+                        values.append({"bin": sidecar_size, "count": count})
+                        sidecar_size += len(array)
+
+                value = values[0] if len(values) == 1 else (values or None)
+                nodes.append([scene_node.level, layout.name, scene_node.str_index, value])
+    finally:
+        if not isinstance(data, bytes):
+            data.close()
+
+    return {"format": JSON_FORMAT, "version": JSON_VERSION, "endianness": endianness, "strings": string_table,
+            "nodes": nodes}
+
+
+def convert_json_scene(document: dict, sidecar: bytes, output_stream: BinaryIO, endianness: Optional[Endianness] = None,
+                       profiler: Optional[SceneProfiler] = None):
+    """Converts a document created by convert_scene_json back. Without endianness the one of the original file is
+    used."""
+    phase = profiler.phase if profiler is not None else no_phase
+    if document.get("format") != JSON_FORMAT or document.get("version") != JSON_VERSION:
+        raise ValueError(f"This is not a version {JSON_VERSION} {JSON_FORMAT} document.")
+
+    endianness = endianness or document["endianness"]
+    str_endianness = get_str_endianness(endianness)
+    string_table: Sequence[str] = document["strings"]
+    # leave space to fill out header later
+    output_stream.write(b"\x00" * SceneHeader.get_size())
+    with phase("string_table"):
+        string_table_size = output_stream.write("\0".join(string_table).encode("utf-8"))
+
+    tree_start = output_stream.tell()
+    with phase("tree"):
+        for node_index, (level, type_name, str_index, value) in enumerate(document["nodes"]):
+            if type_name not in TYPE_IDS:
+                raise ValueError(f"Unknown type {type_name} of node {node_index}.")
+            if not 0 <= str_index < len(string_table):
+                raise ValueError(f"The name of node {node_index} is not in the string table.")
+            type_int = TYPE_IDS[type_name]
+            layout = TYPE_LAYOUTS[type_int]
+            value_count = len(layout.fields) + bool(layout.count_size)
+            values = [] if value is None else [value] if value_count == 1 else value
+            # zip would silently skip missing values and write a broken node
+            if not isinstance(values, list) or len(values) != value_count:
+                raise ValueError(f"Node {node_index} needs {value_count} values.")
+            output_stream.write(SceneNode(level, type_int, str_index).to_bytes(endianness))
+
+            try:
+                for field, field_value in zip(layout.fields, values):
+                    output_stream.write(_encode_field(field_value, field, str_endianness, endianness))
+
+                if layout.count_size:
+                    array = values[-1]
+                    if layout.element == "string":
+                        count = len(array)
+                        array_data = struct.pack(f"{str_endianness}{count}H", *array)
+                    else:
+                        count = array["count"]
+                        array_data = sidecar[array["bin"]:array["bin"] + count * layout.element_size]
+                        if len(array_data) != count * layout.element_size:
+                            raise ValueError("The array exceeds the end of the binary file.")
+                        if endianness == "big":
+                            array_data = byteswap_array(array_data, layout.element_size)
+                    output_stream.write(count.to_bytes(layout.count_size, endianness, signed=False))
+                    output_stream.write(array_data)
+            except (struct.error, OverflowError, TypeError, KeyError, IndexError) as error:
+                raise ValueError(f"The value of node {node_index} doesn't fit a {type_name}: {error}") from None
+    if profiler is not None:
+        profiler.phases["tree"]["bytes"] += output_stream.tell() - tree_start
+
+    with phase("header", SceneHeader.get_size()):
+        tree_size = output_stream.tell() - string_table_size - SceneHeader.get_size()
+        output_stream.seek(0)
+        output_stream.write(SceneHeader(string_table_size, tree_size, endianness).to_bytes())
+
+
+def write_scene_json(input_stream: BinaryIO, file_out: str, profiler: Optional[SceneProfiler] = None):
+    phase = profiler.phase if profiler is not None else no_phase
+    with open(get_sidecar_path(file_out), "wb") as sidecar_file:
+        document = convert_scene_json(input_stream, sidecar_file, profiler)
+    with phase("serialize"), open(file_out, "w", encoding="utf-8") as json_file:
+        json_file.write(json.dumps(document, separators=(",", ":")))
+
+
+def main_dec(file_in: str, file_out: str, profiler: Optional[SceneProfiler] = None):
+    with open(file_in, "rb") as scene_file:
+        write_scene_json(scene_file, file_out, profiler)
+
+
+def main_enc(in_file: str, out_file: str, endianness: Optional[Endianness] = None,
+             profiler: Optional[SceneProfiler] = None):
+    phase = profiler.phase if profiler is not None else no_phase
+    with phase("parse"):
+        with open(in_file, "r", encoding="utf-8") as json_file:
+            document = json.load(json_file)
+        sidecar_path = get_sidecar_path(in_file)
+        assert os.path.isfile(sidecar_path), f"The binary file {sidecar_path} was not found."
+        with open(sidecar_path, "rb") as sidecar_file:
+            sidecar = sidecar_file.read()
+
+    with open(out_file, "wb") as scene_file:
+        convert_json_scene(document, sidecar, scene_file, endianness, profiler)
@@ -0,0 +1,124 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import mmap
+import os
+import shutil
+import struct
+from typing import List, Optional, Sequence, Tuple
+
+from .scene_index import SceneIndex
+from .scene_types import TypeLayout, FIELD_SIZES, get_type_layout
+from ..utils import get_str_endianness, Endianness
+
+# Path, Value as it would be written in the xml
+PatchType = Tuple[str, str]
+
+
+def encode_value(layout: TypeLayout, value: str, endianness: Endianness, string_table: Sequence[str]) -> bytes:
+    """Encodes value for a node that has a single fixed size field. Raises ValueError for everything else."""
+    if layout.count_size or len(layout.fields) != 1:
+        raise ValueError(f"Nodes of type {layout.name or 'empty'} can't be patched because their size could change.")
+
+    field = layout.fields[0]
+    try:
+        match field:
+            case "string":
+                value = value.strip()
+                if value not in string_table:
+                    raise ValueError(f"The string {value!r} is not in the string table.")
+                return string_table.index(value).to_bytes(2, endianness, signed=False)
+            case "float":
+                return struct.pack(get_str_endianness(endianness) + "f", float(value))
+            case _:
+                return int(value).to_bytes(FIELD_SIZES[field], endianness, signed=field in ("int8", "int24"))
+    except OverflowError:
+        raise ValueError(f"{value} doesn't fit into a {layout.name}.") from None
+
+
+def patch_scene(scene_path: str, patches: Sequence[PatchType], all_matches: bool = False,
+                index_path: Optional[str] = None) -> int:
+    """Overwrites the values of fixed size nodes in place. Returns the amount of nodes that were changed."""
+    scene_index = SceneIndex.open(scene_path, index_path)
+
+    # resolving everything before writing so a bad patch doesn't leave a half patched file
+    writes: List[Tuple[int, bytes]] = []
+    for path, value in patches:
+        entry_indices = scene_index.find(path)
+        if not entry_indices:
+            raise ValueError(f"No node found at {path}.")
+        if len(entry_indices) > 1 and not all_matches:
+            raise ValueError(f"Found {len(entry_indices)} nodes at {path}. Use all_matches to patch all of them.")
+
+        for entry_index in entry_indices:
+            entry = scene_index.entries[entry_index]
+            layout = get_type_layout(entry.node.type_int, entry.offset)
+            payload_start, payload_end = scene_index.get_payload_range(entry_index)
+            data = encode_value(layout, value, scene_index.endianness, scene_index.string_table)
+            if len(data) != payload_end - payload_start:
+                raise ValueError(f"The node at {path} has an unexpected size.")
+            writes.append((payload_start, data))
+
+    if not writes:
+        return 0
+
+    with open(scene_path, "r+b") as scene_file, mmap.mmap(scene_file.fileno(), 0) as scene_map:
+        for offset, data in writes:
+            scene_map[offset:offset + len(data)] = data
+        scene_map.flush()
+
+    # the offsets didn't change so the index only needs the new modification time
+    if index_path is not None:
+        scene_index.source_mtime = os.stat(scene_path).st_mtime_ns
+        with open(index_path, "wb") as index_file:
+            scene_index.save(index_file)
+    return len(writes)
+
+
+def main(file_in: str, patches: Sequence[PatchType], file_out: Optional[str] = None, all_matches: bool = False,
+         index_path: Optional[str] = None):
+    if file_out is not None:
+        shutil.copyfile(file_in, file_out)
+        file_in = file_out
+        index_path = None  # the index belongs to the input file
+    print(f"Patched {patch_scene(file_in, patches, all_matches, index_path)} nodes.")
+
+
+def run_from_args(args: Sequence[str]):
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        prog="scene_patch(.py) Written by TKFRvision",
+        description="A program to change single values (float, int8, uint16, uint32 etc. and strings that are already "
+                    "in the string table) of scene format files (.oct, .bent etc.) in place."
+    )
+
+    arg_parser.add_argument("in_file", help="The scene file to patch.")
+    arg_parser.add_argument("patches", nargs="+", help="The values to change like Material/Alpha=0.5.")
+    arg_parser.add_argument("-o", dest="out_file", help="Write the patched file here instead of changing in_file.")
+    arg_parser.add_argument("-a", dest="all_matches", action="store_true",
+                            help="Patch all nodes matching a path instead of failing if there is more than one.")
+    arg_parser.add_argument("-i", dest="index_file", help="An index file created by scene_query to use.")
+    parsed_args = arg_parser.parse_args(args)
+
+    assert os.path.isfile(parsed_args.in_file), "Input file not found."
+    if parsed_args.out_file is not None:
+        assert not os.path.isdir(parsed_args.out_file), "Output file destination is invalid."
+
+    patches = []
+    for patch in parsed_args.patches:
+        path, separator, value = patch.partition("=")
+        assert separator, f"The patch {patch} has to look like path=value."
+        patches.append((path, value))
+
+    main(parsed_args.in_file, patches, parsed_args.out_file, parsed_args.all_matches, parsed_args.index_file)
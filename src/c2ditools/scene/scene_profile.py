@@ -0,0 +1,78 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+from typing import Dict, List, Optional
+
+from .scene_types import TYPE_LAYOUTS
+from ..utils import PhaseTimer
+
+
+class SceneProfiler(PhaseTimer):
+    """Collects counts, bytes and time per phase, node type and tree level of scene_dec and scene_enc."""
+
+    def __init__(self):
+        super().__init__()
+        # count, bytes, seconds
+        self.types: Dict[int, List[float]] = {}
+        self.levels: Dict[int, List[float]] = {}
+
+    def add_node(self, type_int: int, level: int, size: int, seconds: float):
+        for stats in (self.types.setdefault(type_int, [0, 0, 0.0]), self.levels.setdefault(level, [0, 0, 0.0])):
+            stats[0] += 1
+            stats[1] += size
+            stats[2] += seconds
+
+    def to_dict(self) -> dict:
+        def to_stats(stats: List[float]) -> dict:
+            return {"count": stats[0], "bytes": stats[1], "seconds": stats[2]}
+
+        return {
+            "phases": self.phases,
+            "types": {hex(type_int): {"name": _get_type_name(type_int), **to_stats(stats)}
+                      for type_int, stats in self.types.items()},
+            "levels": {str(level): to_stats(stats) for level, stats in sorted(self.levels.items())},
+        }
+
+    def format_report(self) -> str:
+        lines = [super().format_report(), "", f"{'type':<24}{'count':>10}{'MiB':>12}{'seconds':>12}{'us/node':>10}"]
+        for type_int, (count, size, seconds) in sorted(self.types.items(), key=lambda item: -item[1][2]):
+            lines.append(f"{_get_type_name(type_int):<24}{count:>10}{size / 0x100000:>12.3f}{seconds:>12.4f}"
+                         f"{seconds / count * 1e6:>10.2f}")
+        lines += ["", f"{'level':<24}{'count':>10}{'MiB':>12}{'seconds':>12}"]
+        for level, (count, size, seconds) in sorted(self.levels.items()):
+            lines.append(f"{level:<24}{count:>10}{size / 0x100000:>12.3f}{seconds:>12.4f}")
+        return "\n".join(lines)
+
+    def output(self, destination: str):
+        """Prints the report if destination is "-", otherwise writes it as json."""
+        if destination == "-":
+            print(self.format_report())
+            return
+        with open(destination, "w", encoding="utf-8") as json_file:
+            json.dump(self.to_dict(), json_file, indent=2)
+
+
+def _get_type_name(type_int: int) -> str:
+    layout = TYPE_LAYOUTS.get(type_int)
+    return (layout.name or "empty") if layout else hex(type_int)
+
+
+def add_profile_args(arg_parser):
+    arg_parser.add_argument("--profile", nargs="?", const="-", metavar="JSON_FILE",
+                            help="Measure where the time goes per phase, node type and tree level. "
+                                 "Prints a report or writes it to JSON_FILE.")
+
+
+def profiler_from_args(parsed_args) -> Optional[SceneProfiler]:
+    return SceneProfiler() if parsed_args.profile is not None else None
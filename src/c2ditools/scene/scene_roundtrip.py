@@ -0,0 +1,205 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from xml.dom import minidom
+from xml.etree import ElementTree
+
+from . import scene_batch
+from .scene_index import SceneIndex
+from .scene_types import FIELD_SIZES, TypeLayout, get_type_layout
+from ..api import decode_scene, encode_scene, get_scene_endianness
+from ..utils import Endianness
+
+# the scene files are the same byte for byte
+STATUS_EXACT = "exact"
+# the scene files only differ in the order of the string table, which scene_enc doesn't keep
+STATUS_STRUCTURAL = "structural"
+STATUS_FAILED = "failed"
+STATUS_ERROR = "error"
+
+
+def _get_resolved_payload(data: bytes, offset: int, layout: TypeLayout, endianness: Endianness,
+                          string_table: Sequence[str]) -> Tuple[Any, ...]:
+    """Resolves the strings of a payload and keeps everything else as bytes, so floats like nan compare by their
+    bits."""
+    values = []
+    for field in layout.fields:
+        field_data = data[offset:offset + FIELD_SIZES[field]]
+        values.append(string_table[int.from_bytes(field_data, endianness, signed=False)] if field == "string"
+                      else field_data)
+        offset += FIELD_SIZES[field]
+
+    if layout.count_size:
+        count = int.from_bytes(data[offset:offset + layout.count_size], endianness, signed=False)
+        offset += layout.count_size
+        array_data = data[offset:offset + count * layout.element_size]
+        if layout.element == "string":
+            values.append([string_table[int.from_bytes(array_data[element_offset:element_offset + 2], endianness,
+                                                       signed=False)]
+                           for element_offset in range(0, len(array_data), 2)])
+        else:
+            values.append(array_data)
+    return tuple(values)
+
+
+def _get_resolved_nodes(data: bytes) -> Tuple[SceneIndex, List[Tuple[int, int, str, Any]]]:
+    scene_index = SceneIndex.from_file(io.BytesIO(data))
+    nodes = []
+    for entry_index, entry in enumerate(scene_index.entries):
+        layout = get_type_layout(entry.node.type_int, entry.offset)
+        value = _get_resolved_payload(data, scene_index.get_payload_range(entry_index)[0], layout,
+                                      scene_index.endianness, scene_index.string_table)
+        nodes.append((entry.node.level, entry.node.type_int, scene_index.get_name(entry_index), value))
+    return scene_index, nodes
+
+
+def compare_structure(original: bytes, result: bytes) -> Optional[str]:
+    """Compares two scene files node by node with resolved strings. Returns where they differ or None."""
+    original_index, original_nodes = _get_resolved_nodes(original)
+    result_index, result_nodes = _get_resolved_nodes(result)
+    if original_index.endianness != result_index.endianness:
+        return "The endianness differs."
+
+    for entry_index, (original_node, result_node) in enumerate(zip(original_nodes, result_nodes)):
+        if original_node != result_node:
+            return f"Node {original_index.get_path(entry_index)} at {hex(original_index.entries[entry_index].offset)}" \
+                   f" differs."
+    if len(original_nodes) != len(result_nodes):
+        return f"The original has {len(original_nodes)} nodes, the result {len(result_nodes)}."
+    return None
+
+
+def check_file(in_path: str, relative_path: str, pretty: bool = False, measure_memory: bool = True) -> dict:
+    """Decodes and encodes a scene file in memory and compares the result with the original."""
+    result = {"path": relative_path, "size": os.path.getsize(in_path), "status": STATUS_ERROR,
+              "decode_seconds": None, "encode_seconds": None, "peak_memory": None, "diverging_offset": None,
+              "detail": None}
+    with open(in_path, "rb") as scene_file:
+        original = scene_file.read()
+
+    # textures stay in memory like the files scene_dec would write with a texture folder
+    textures: Dict[str, bytes] = {}
+    if measure_memory:
+        tracemalloc.start()
+    try:
+        start_time = time.perf_counter()
+        endianness = get_scene_endianness(original)
+        root = decode_scene(original, textures)
+        xml_string = ElementTree.tostring(root, encoding="unicode")
+        if pretty:
+            # what scene_dec writes to the disk
+            xml_string = minidom.parseString(xml_string).toprettyxml(indent="   ")
+        result["decode_seconds"] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        encoded = encode_scene(xml_string, endianness, textures)
+        result["encode_seconds"] = time.perf_counter() - start_time
+    except Exception as exception:
+        result["detail"] = f"{type(exception).__name__}: {exception}"
+        return result
+    finally:
+        if measure_memory:
+            result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    if encoded == original:
+        result["status"] = STATUS_EXACT
+        return result
+
+    result["diverging_offset"] = next((offset for offset, (original_byte, encoded_byte)
+                                       in enumerate(zip(original, encoded)) if original_byte != encoded_byte),
+                                      min(len(original), len(encoded)))
+    try:
+        result["detail"] = compare_structure(original, encoded)
+    except ValueError as value_error:
+        result["detail"] = f"ValueError: {value_error}"
+    result["status"] = STATUS_STRUCTURAL if result["detail"] is None else STATUS_FAILED
+    return result
+
+
+def main(in_folder: str, extensions: Sequence[str], workers: Optional[int] = None, pretty: bool = False,
+         measure_memory: bool = True, report_path: Optional[str] = None) -> List[dict]:
+    scene_files = scene_batch.find_files(in_folder, in_folder, extensions, lambda relative_path: relative_path)
+
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(check_file, in_path, relative_path, pretty, measure_memory)
+                   for relative_path, in_path, _ in scene_files]
+        results = []
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            if result["status"] in (STATUS_FAILED, STATUS_ERROR):
+                offset = f" first difference at {hex(result['diverging_offset'])}" \
+                    if result["diverging_offset"] is not None else ""
+                print(f"{result['status'].upper()} {result['path']}:{offset} {result['detail']}")
+    total_seconds = time.perf_counter() - start_time
+
+    counts = {status: sum(1 for result in results if result["status"] == status)
+              for status in (STATUS_EXACT, STATUS_STRUCTURAL, STATUS_FAILED, STATUS_ERROR)}
+    passed = counts[STATUS_EXACT] + counts[STATUS_STRUCTURAL]
+    total_mb = sum(result["size"] for result in results) / 0x100000
+    print(f"Passed {passed}/{len(results)} ({passed / len(results) if results else 0:.1%}): "
+          + ", ".join(f"{count} {status}" for status, count in counts.items()))
+    print(f"Checked {total_mb:.2f} MB in {total_seconds:.2f}s: {total_mb / max(total_seconds, 1e-9):.2f} MB/s, "
+          f"{len(results) / max(total_seconds, 1e-9):.1f} files/s")
+
+    timed_results = [result for result in results if result["encode_seconds"] is not None]
+    for result in sorted(timed_results, key=lambda timed_result: -(timed_result["decode_seconds"]
+                                                                   + timed_result["encode_seconds"]))[:5]:
+        memory = f", {result['peak_memory'] / 0x100000:.1f} MiB" if result["peak_memory"] is not None else ""
+        print(f"  slow: {result['path']} decode {result['decode_seconds']:.3f}s, "
+              f"encode {result['encode_seconds']:.3f}s{memory}")
+
+    if report_path is not None:
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            json.dump({"seconds": total_seconds, "counts": counts, "files": results}, report_file, indent=2)
+    return results
+
+
+def run_from_args(args: Sequence[str]):
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        prog="scene_roundtrip(.py) Written by TKFRvision",
+        description="A program to check that scene_dec and scene_enc reproduce every scene file in a folder."
+    )
+
+    arg_parser.add_argument("in_folder", help="The folder with the scene files to check.")
+    arg_parser.add_argument("-j", dest="jobs", type=int, help="Amount of processes to use.")
+    arg_parser.add_argument("--ext", dest="extensions", action="append",
+                            help="A file extension to check. Can be used multiple times. "
+                                 f"Defaults to {', '.join(scene_batch.SCENE_EXTENSIONS)}.")
+    arg_parser.add_argument("--pretty", action="store_true",
+                            help="Pretty print the xml in between like scene_dec does.")
+    arg_parser.add_argument("--no-memory", dest="measure_memory", action="store_false",
+                            help="Don't measure the memory usage. Measuring it slows down the conversion.")
+    arg_parser.add_argument("--report", dest="report_file", help="A json file to store the results of every file in.")
+    parsed_args = arg_parser.parse_args(args)
+
+    assert os.path.isdir(parsed_args.in_folder), "Input folder not found."
+    if parsed_args.report_file:
+        assert not os.path.isdir(parsed_args.report_file), "Report file destination is invalid."
+
+    results = main(parsed_args.in_folder, parsed_args.extensions or scene_batch.SCENE_EXTENSIONS, parsed_args.jobs,
+                   parsed_args.pretty, parsed_args.measure_memory, parsed_args.report_file)
+    if any(result["status"] in (STATUS_FAILED, STATUS_ERROR) for result in results):
+        sys.exit(1)
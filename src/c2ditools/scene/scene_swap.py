@@ -0,0 +1,143 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import shutil
+import sys
+from typing import BinaryIO, Optional, Sequence
+
+from . import scene_batch
+from .scene_types import SceneHeader, SceneNode, FIELD_SIZES, get_type_layout
+from ..utils import chunk_iter, Endianness
+
+_COPY_STEP = 0x100000  # arrays are swapped in pieces of about 1 MiB
+
+
+def byteswap_array(data: bytes, element_size: int) -> bytes:
+    if element_size == 1:
+        return data
+    swapped = bytearray(len(data))
+    for byte_index in range(element_size):
+        swapped[byte_index::element_size] = data[element_size - 1 - byte_index::element_size]
+    return bytes(swapped)
+
+
+def _read_exact(input_stream: BinaryIO, size: int) -> bytes:
+    data = input_stream.read(size)
+    if len(data) != size:
+        raise ValueError(f"Unexpected end of file at {hex(input_stream.tell())}")
+    return data
+
+
+def swap_scene(input_stream: BinaryIO, output_stream: BinaryIO) -> Endianness:
+    header = SceneHeader.from_file(input_stream)
+    source_endianness = header.endianness
+    target_endianness = "big" if source_endianness == "little" else "little"
+    output_stream.write(SceneHeader(header.string_table_size, header.tree_size, target_endianness).to_bytes())
+
+    # the string table is just utf-8 so it can be copied as is
+    for chunk in chunk_iter(input_stream, input_stream.tell() + header.string_table_size, _COPY_STEP):
+        output_stream.write(chunk)
+
+    # get file size
+    start_pos = input_stream.tell()
+    input_stream.seek(0, os.SEEK_END)
+    end_pos = input_stream.tell()
+    input_stream.seek(start_pos)
+
+    # the root node is handled like every other node
+    while input_stream.tell() < end_pos:
+        node_offset = input_stream.tell()
+        scene_node = SceneNode.from_bytes(_read_exact(input_stream, SceneNode.get_size()), source_endianness)
+        output_stream.write(scene_node.to_bytes(target_endianness))
+
+        layout = get_type_layout(scene_node.type_int, node_offset)
+        if layout.fields:
+            fixed_data = _read_exact(input_stream, layout.fixed_size)
+            field_offset = 0
+            for field in layout.fields:
+                field_size = FIELD_SIZES[field]
+                output_stream.write(fixed_data[field_offset:field_offset + field_size][::-1])
+                field_offset += field_size
+
+        if layout.count_size:
+            count_bytes = _read_exact(input_stream, layout.count_size)
+            output_stream.write(count_bytes[::-1])
+
+            # blobs like textures are uint8 arrays and get copied untouched
+            element_size = layout.element_size
+            remaining = int.from_bytes(count_bytes, source_endianness, signed=False) * element_size
+            step = _COPY_STEP - _COPY_STEP % element_size
+            while remaining > 0:
+                chunk = _read_exact(input_stream, min(step, remaining))
+                output_stream.write(byteswap_array(chunk, element_size))
+                remaining -= len(chunk)
+
+    return target_endianness
+
+
+def main(file_in: str, file_out: str, endianness: Optional[Endianness] = None):
+    with open(file_in, "rb") as scene_file:
+        source_endianness = SceneHeader.from_file(scene_file).endianness
+        scene_file.seek(0)
+
+        if endianness == source_endianness:
+            # nothing to do
+            with open(file_out, "wb") as out_file:
+                shutil.copyfileobj(scene_file, out_file, _COPY_STEP)
+            return
+
+        with open(file_out, "wb") as out_file:
+            swap_scene(scene_file, out_file)
+
+
+def run_from_args(args: Sequence[str]):
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        prog="scene_swap(.py) Written by TKFRvision",
+        description="A program to convert scene format files (.oct, .bent etc.) between pc (little endian) "
+                    "and console (big endian) without going through xml."
+    )
+
+    arg_parser.add_argument("in_file", help="The scene file to convert. A folder if --batch is used.")
+    arg_parser.add_argument("out_file", help="The resulting scene file. A folder if --batch is used.")
+    arg_parser.add_argument("--to", dest="endianness", choices=("little", "big"),
+                            help="The endianness the resulting file should have. "
+                                 "Files that already have it are copied. Swaps the endianness if not specified.")
+    arg_parser.add_argument("--batch", action="store_true",
+                            help="Convert every scene file in the input folder and its sub folders.")
+    arg_parser.add_argument("-j", dest="jobs", type=int, help="Amount of processes to use with --batch.")
+    arg_parser.add_argument("--ext", dest="extensions", action="append",
+                            help="A file extension to convert with --batch. Can be used multiple times. "
+                                 f"Defaults to {', '.join(scene_batch.SCENE_EXTENSIONS)}.")
+    parsed_args = arg_parser.parse_args(args)
+
+    if parsed_args.batch:
+        assert os.path.isdir(parsed_args.in_file), "Input folder not found."
+        assert not os.path.isfile(parsed_args.out_file), "Output folder is invalid."
+
+        jobs = []
+        for batch_file in scene_batch.find_files(parsed_args.in_file, parsed_args.out_file,
+                                                 parsed_args.extensions or scene_batch.SCENE_EXTENSIONS,
+                                                 lambda relative_path: relative_path):
+            _, in_path, out_path = batch_file
+            jobs.append((batch_file, main, (in_path, out_path, parsed_args.endianness)))
+        if any(result.error for result in scene_batch.run_batch(jobs, parsed_args.jobs)):
+            sys.exit(1)
+        return
+
+    assert os.path.isfile(parsed_args.in_file), "Input file not found."
+    assert not os.path.isdir(parsed_args.out_file), "Output file destination is invalid."
+
+    main(parsed_args.in_file, parsed_args.out_file, parsed_args.endianness)
@@ -12,7 +12,7 @@
 #   limitations under the License.
 
 import struct
-from typing import BinaryIO
+from typing import BinaryIO, Dict, Optional, Tuple
 from ..utils import get_str_endianness, Endianness
 
 ENDIAN_MAGIC = {
@@ -73,3 +73,75 @@ class SceneNode:
     @staticmethod
     def get_size() -> int:
         return 4
+
+
+# size in bytes of the different field kinds a node payload is made of
+FIELD_SIZES = {
+    "string": 2,  # index into the string table
+    "int8": 1,
+    "uint8": 1,
+    "uint16": 2,
+    "int24": 3,
+    "uint24": 3,
+    "uint32": 4,
+    "float": 4,
+}
+
+
+class TypeLayout:
+    """Describes the payload of a node type: some fixed fields optionally followed by a counted array."""
+
+    def __init__(self, name: Optional[str], fields: Tuple[str, ...] = (), count_size: int = 0,
+                 element: Optional[str] = None):
+        self.name = name  # the type attribute used in the xml
+        self.fields = fields
+        self.count_size = count_size
+        self.element = element
+
+    @property
+    def fixed_size(self) -> int:
+        return sum(FIELD_SIZES[field] for field in self.fields)
+
+    @property
+    def element_size(self) -> int:
+        return FIELD_SIZES[self.element] if self.element else 0
+
+    @property
+    def max_count(self) -> int:
+        return (1 << (8 * self.count_size)) - 1
+
+
+TYPE_LAYOUTS: Dict[int, TypeLayout] = {
+    0x01: TypeLayout(None),
+    0x05: TypeLayout("reference_string", ("string",)),
+    0x0B: TypeLayout("string", ("string",)),
+    0x0A: TypeLayout("string_list", (), 1, "string"),
+    0x0F: TypeLayout("string_string", ("string", "string")),
+    0x1F: TypeLayout("uint8_string", ("string", "uint8")),
+    0x4A: TypeLayout("uint16_string_list", (), 2, "string"),
+    0x12: TypeLayout("float_list", (), 1, "float"),
+    0x13: TypeLayout("float", ("float",)),
+    0x1A: TypeLayout("int8_list", (), 1, "int8"),
+    0x1B: TypeLayout("int8", ("int8",)),
+    0x23: TypeLayout("uint8_list", (), 1, "uint8"),
+    0x15A: TypeLayout("uint16_uint16_list", (), 2, "uint16"),
+    0x5A: TypeLayout("uint16_uint8_list", (), 2, "uint8"),
+    0x63: TypeLayout("uint16_uint8_bin", (), 2, "uint8"),
+    0x11A: TypeLayout("uint16_list", (), 1, "uint16"),
+    0x11B: TypeLayout("uint16", ("uint16",)),
+    0x21A: TypeLayout("int24_list", (), 1, "int24"),
+    0x21B: TypeLayout("int24", ("uint24",)),
+    0x31B: TypeLayout("uint32", ("uint32",)),
+    0x16: TypeLayout("string_float32_list", ("string",), 1, "float"),
+    0xA3: TypeLayout("uint24_uint8_bin", (), 3, "uint8"),
+    0x52: TypeLayout("float_u16_list", (), 2, "float"),
+}
+
+TYPE_IDS = {layout.name: type_int for type_int, layout in TYPE_LAYOUTS.items()}
+
+
+def get_type_layout(type_int: int, offset: int) -> TypeLayout:
+    layout = TYPE_LAYOUTS.get(type_int)
+    if layout is None:
+        raise ValueError(f"Unknown DataFormat {hex(type_int)} at {hex(offset)}")
+    return layout
@@ -0,0 +1,52 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import importlib
+from typing import Callable, Sequence
+
+# tool name -> module with its run_from_args. the modules only get imported when a tool gets used
+# so e.g. scene_dec doesn't have to load PyCryptodome and mmh3 for whyjustwhy
+TOOL_MODULES = {
+    "why": "c2ditools.archives.why",
+    "whyjustwhy": "c2ditools.archives.whyjustwhy",
+    "scene_dec": "c2ditools.scene.scene_dec",
+    "scene_enc": "c2ditools.scene.scene_enc",
+    "scene_swap": "c2ditools.scene.scene_swap",
+    "scene_cache": "c2ditools.scene.scene_cache",
+    "scene_query": "c2ditools.scene.scene_index",
+    "scene_patch": "c2ditools.scene.scene_patch",
+    "scene_diff": "c2ditools.scene.scene_diff",
+    "scene_roundtrip": "c2ditools.scene.scene_roundtrip",
+    "scene_gen": "c2ditools.benchmarks.scene_gen",
+    "scene_bench": "c2ditools.benchmarks.scene_bench",
+    "archive_gen": "c2ditools.benchmarks.archive_gen",
+    "archive_bench": "c2ditools.benchmarks.archive_bench",
+    "daemon": "c2ditools.daemon",
+    "watch": "c2ditools.watch",
+    "build": "c2ditools.build",
+}
+
+
+def get_tool(name: str) -> Callable[[Sequence[str]], None]:
+    if name not in TOOL_MODULES:
+        raise ValueError(f"Unknown tool {name}.")
+    return importlib.import_module(TOOL_MODULES[name]).run_from_args
+
+
+def lazy_submodules(package_name: str, submodules: Sequence[str]) -> Callable[[str], object]:
+    """Returns a module __getattr__ (PEP 562) that imports the submodules on first access."""
+    def __getattr__(name: str):
+        if name in submodules:
+            return importlib.import_module(f"{package_name}.{name}")
+        raise AttributeError(f"module {package_name!r} has no attribute {name!r}")
+    return __getattr__
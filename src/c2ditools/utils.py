@@ -11,10 +11,22 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-from typing import BinaryIO, Literal, Generator
+import contextlib
+import io
+import os
+import sys
+import time
+from typing import BinaryIO, Dict, Literal, Generator, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
 
 Endianness = Literal["big", "little"]
 
+_COPY_STEP = 0x100000  # used if the copying can't be done by the kernel
+
 
 def chunk_iter(file: BinaryIO, end: int, step: int = 4096, close_after: bool = False) -> Generator[bytes, None, None]:
     while (distance_to_end := end - file.tell()) > 0:
@@ -26,5 +38,116 @@ def chunk_iter(file: BinaryIO, end: int, step: int = 4096, close_after: bool = F
         file.close()
 
 
+def get_peak_rss() -> Optional[int]:
+    """Returns the peak resident set size of this process in bytes if the platform can tell."""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
 def get_str_endianness(literal_endianness: Endianness) -> str:
     return ">" if literal_endianness == "big" else "<"
+
+
+def _copy_file_descriptors(in_fd: int, out_fd: int, in_pos: int, out_pos: int, count: int) -> int:
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < count:
+                step_copied = os.copy_file_range(in_fd, out_fd, count - copied, in_pos + copied, out_pos + copied)
+                if step_copied == 0:
+                    break
+                copied += step_copied
+            return copied
+        except OSError:
+            pass  # different file systems on old kernels or not supported at all
+    if hasattr(os, "sendfile"):
+        try:
+            os.lseek(out_fd, out_pos + copied, os.SEEK_SET)
+            while copied < count:
+                step_copied = os.sendfile(out_fd, in_fd, in_pos + copied, count - copied)
+                if step_copied == 0:
+                    break
+                copied += step_copied
+        except OSError:
+            pass  # some systems only support sockets as output
+    return copied
+
+
+def copy_range(input_stream: BinaryIO, output_stream: BinaryIO, end: int):
+    """Copies input_stream from its current position up to end without going through python if possible."""
+    start = input_stream.tell()
+    try:
+        in_fd, out_fd = input_stream.fileno(), output_stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        in_fd = out_fd = None
+
+    if in_fd is not None:
+        output_stream.flush()
+        out_pos = output_stream.tell()
+        copied = _copy_file_descriptors(in_fd, out_fd, start, out_pos, end - start)
+        # the file objects don't know what happened to their file descriptors
+        input_stream.seek(start + copied)
+        output_stream.seek(out_pos + copied)
+
+    for chunk in chunk_iter(input_stream, end, _COPY_STEP):
+        output_stream.write(chunk)
+
+
+class StreamSlice:
+    """A part of a file that can be iterated over in chunks or copied to another file using copy_range."""
+
+    def __init__(self, file: BinaryIO, start: int, end: int, close_after: bool = False):
+        self.file = file
+        self.start = start
+        self.end = end
+        self.close_after = close_after
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __iter__(self) -> Iterator[bytes]:
+        self.file.seek(self.start)
+        return chunk_iter(self.file, self.end, _COPY_STEP, self.close_after)
+
+    def copy_to(self, output_stream: BinaryIO):
+        self.file.seek(self.start)
+        copy_range(self.file, output_stream, self.end)
+        if self.close_after:
+            self.file.close()
+
+
+def no_phase(name: str, size: int = 0) -> contextlib.nullcontext:
+    """Stands in for PhaseTimer.phase if nothing should be measured."""
+    return contextlib.nullcontext()
+
+
+class PhaseTimer:
+    """Adds up the time and bytes spent in named phases."""
+
+    def __init__(self):
+        self.phases: Dict[str, Dict[str, float]] = {}
+
+    def add(self, name: str, seconds: float, size: int = 0):
+        phase = self.phases.setdefault(name, {"count": 0, "bytes": 0, "seconds": 0.0})
+        phase["count"] += 1
+        phase["bytes"] += size
+        phase["seconds"] += seconds
+
+    @contextlib.contextmanager
+    def phase(self, name: str, size: int = 0) -> Generator[None, None, None]:
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start_time, size)
+
+    def to_dict(self) -> dict:
+        return {"phases": self.phases}
+
+    def format_report(self) -> str:
+        lines = [f"{'phase':<16}{'count':>10}{'MiB':>12}{'seconds':>12}"]
+        for name, phase in self.phases.items():
+            lines.append(f"{name:<16}{phase['count']:>10}{phase['bytes'] / 0x100000:>12.3f}{phase['seconds']:>12.4f}")
+        return "\n".join(lines)
@@ -0,0 +1,416 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import ctypes
+import ctypes.util
+import os
+import select
+import stat
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from xml.etree import ElementTree
+
+from .api import encode_scene
+from .archives.archive_utils import PackedMember, pack_member
+from .scene.scene_batch import SCENE_EXTENSIONS
+from .scene.scene_enc import get_sidecar_path
+from .utils import Endianness
+
+# path -> (modification time, size)
+SnapshotType = Dict[str, Tuple[int, int]]
+
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+# watch descriptor, mask, cookie, length of the name
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class PollingNotifier:
+    def __init__(self, interval: float):
+        self.interval = interval
+
+    def add_folders(self, folders: Iterable[str]) -> List[str]:
+        return []
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[Set[str]]:
+        """Returns the paths that changed or None if everything has to be scanned."""
+        time.sleep(self.interval if timeout is None else timeout)
+        return None
+
+    def close(self):
+        pass
+
+
+class InotifyNotifier:
+    """Wakes up as soon as something changes in the watched folders. Only available on linux."""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> folder
+        self._folders: Dict[int, str] = {}
+        self._watched: Set[str] = set()
+
+    def add_folders(self, folders: Iterable[str]) -> List[str]:
+        """Watches the folders that aren't watched yet and returns them."""
+        added_folders = []
+        for folder in folders:
+            if folder in self._watched:
+                continue
+            watch = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), _IN_WATCH_MASK)
+            if watch >= 0:
+                self._folders[watch] = folder
+                self._watched.add(folder)
+                added_folders.append(folder)
+        return added_folders
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[Set[str]]:
+        """Returns the paths that changed or None if events were lost and everything has to be scanned."""
+        changed_paths = set()
+        readable, _, _ = select.select((self._fd,), (), (), self.timeout if timeout is None else timeout)
+        if not readable:
+            return changed_paths
+        events = bytearray()
+        try:
+            while chunk := os.read(self._fd, 0x10000):
+                events += chunk
+        except BlockingIOError:
+            pass
+
+        overflow = False
+        offset = 0
+        while offset < len(events):
+            watch, mask, _, name_size = _INOTIFY_EVENT.unpack_from(events, offset)
+            name = bytes(events[offset + _INOTIFY_EVENT.size:offset + _INOTIFY_EVENT.size + name_size]).rstrip(b"\0")
+            offset += _INOTIFY_EVENT.size + name_size
+            if mask & _IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            folder = self._folders.get(watch)
+            if folder is None:
+                continue
+            if mask & _IN_IGNORED:
+                # the folder is gone, add_folders watches it again if it is created again
+                del self._folders[watch]
+                self._watched.discard(folder)
+            changed_paths.add(os.path.join(folder, os.fsdecode(name)) if name else folder)
+        return None if overflow else changed_paths
+
+    def close(self):
+        os.close(self._fd)
+
+
+def create_notifier(interval: float, polling: bool = False) -> PollingNotifier | InotifyNotifier:
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyNotifier(interval)
+        except (OSError, AttributeError):  # no inotify in this libc
+            pass
+    return PollingNotifier(interval)
+
+
+def take_snapshot(folders: Sequence[str], skip: Sequence[str] = ()) -> Tuple[SnapshotType, List[str]]:
+    """Returns the modification time and size of every file and all sub folders."""
+    snapshot = {}
+    found_folders = []
+    skip = {os.path.abspath(skip_path) for skip_path in skip}
+    pending = [os.path.abspath(folder) for folder in folders if os.path.isdir(folder)]
+    while pending:
+        folder = pending.pop()
+        found_folders.append(folder)
+        try:
+            dir_entries = list(os.scandir(folder))
+        except FileNotFoundError:  # deleted while scanning
+            continue
+        for dir_entry in dir_entries:
+            if dir_entry.path in skip:
+                continue
+            try:
+                if dir_entry.is_dir():
+                    pending.append(dir_entry.path)
+                elif dir_entry.is_file():
+                    stat_result = dir_entry.stat()
+                    snapshot[dir_entry.path] = stat_result.st_mtime_ns, stat_result.st_size
+            except FileNotFoundError:
+                continue
+    return snapshot, found_folders
+
+
+# packed member or None if it failed, files the member depends on, error
+PackResultType = Tuple[Optional[PackedMember], List[str], Optional[str]]
+
+
+def _pack_file(path: str, name: str) -> PackResultType:
+    try:
+        with open(path, "rb") as file:
+            return pack_member(name, file), [], None
+    except OSError as os_error:  # e.g. deleted in the meantime
+        return None, [], f"{type(os_error).__name__}: {os_error}"
+
+
+def get_scene_dependencies(root: ElementTree.Element, texture_folder: Optional[str]) -> List[str]:
+    dependencies = []
+    for element in root.iter():
+        if filepath := element.get("filepath"):
+            filepath = filepath if os.path.isabs(filepath) or texture_folder is None \
+                else os.path.join(texture_folder, filepath)
+            dependencies.append(os.path.abspath(filepath))
+    return dependencies
+
+
+def _pack_scene(xml_path: str, name: str, texture_folder: Optional[str], endianness: Endianness) -> PackResultType:
+    """Encodes a xml like scene_enc and returns the packed scene, the files it depends on and an error."""
+    dependencies = []
+    try:
+        root = ElementTree.parse(xml_path).getroot()
+        # known before encoding so a missing texture triggers a rebuild once it shows up
+        dependencies = get_scene_dependencies(root, texture_folder)
+        textures = {}
+        for element in root.iter():
+            if filepath := element.get("filepath"):
+                with open(get_sidecar_path(filepath, texture_folder), "rb") as texture_file:
+                    textures[filepath] = texture_file.read()
+        return pack_member(name, encode_scene(root, endianness, textures)), dependencies, None
+    except Exception as exception:
+        return None, dependencies, f"{type(exception).__name__}: {exception}"
+
+
+class ProjectWatcher:
+    """Keeps the packed members of a project in memory and only packs the files that changed again."""
+
+    def __init__(self, src_folder: str, out_file: str, texture_folder: Optional[str] = None,
+                 endianness: Endianness = "little", encrypted: bool = False, workers: Optional[int] = None,
+                 extensions: Sequence[str] = SCENE_EXTENSIONS):
+        self.src_folder = os.path.abspath(src_folder)
+        self.out_file = os.path.abspath(out_file)
+        self.texture_folder = os.path.abspath(texture_folder) if texture_folder is not None else None
+        self.endianness = endianness
+        self.encrypted = encrypted
+        # like scene_dec --batch names them, level.oct.xml
+        self.scene_extensions = tuple(extension.lower() + ".xml" for extension in extensions)
+        self.executor = ProcessPoolExecutor(workers)
+        self.members: Dict[str, PackedMember] = {}
+        # xml path -> files referenced by it
+        self.dependencies: Dict[str, List[str]] = {}
+        self.snapshot: SnapshotType = {}
+        self.folders: Set[str] = set()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def take_snapshot(self, changed_paths: Optional[Set[str]] = None,
+                      base: Optional[SnapshotType] = None) -> SnapshotType:
+        """Scans the whole project or only changed_paths on top of base, which defaults to the current snapshot."""
+        # the texture folder and the archive can be inside of the project
+        skip = [self.out_file, self.out_file + ".tmp"]
+        if changed_paths is None:
+            folders = [self.src_folder] + ([self.texture_folder] if self.texture_folder is not None else [])
+            snapshot, found_folders = take_snapshot(folders, skip)
+            self.folders = set(found_folders)
+            return snapshot
+
+        snapshot = dict(self.snapshot if base is None else base)
+        for path in changed_paths:
+            if path in skip:
+                continue
+            snapshot.pop(path, None)
+            if path in self.folders:
+                # removed, moved or replaced, so everything that was inside of it is scanned again
+                prefix = path + os.sep
+                for old_path in [old_path for old_path in snapshot if old_path.startswith(prefix)]:
+                    del snapshot[old_path]
+                self.folders = {folder for folder in self.folders if folder != path and not folder.startswith(prefix)}
+            try:
+                stat_result = os.stat(path)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if stat.S_ISDIR(stat_result.st_mode):
+                folder_snapshot, found_folders = take_snapshot([path], skip)
+                snapshot.update(folder_snapshot)
+                self.folders.update(found_folders)
+            elif stat.S_ISREG(stat_result.st_mode):
+                snapshot[path] = stat_result.st_mtime_ns, stat_result.st_size
+        return snapshot
+
+    def _is_scene(self, path: str) -> bool:
+        return path.lower().endswith(self.scene_extensions)
+
+    def _get_member_name(self, path: str) -> str:
+        name = os.path.relpath(path, self.src_folder).replace("\\", "/")
+        return name[:-4] if self._is_scene(path) else name
+
+    def _get_scene_texture_folder(self, xml_path: str) -> Optional[str]:
+        # the same layout scene_dec --batch and scene_enc --batch use
+        if self.texture_folder is None:
+            return None
+        return os.path.join(self.texture_folder, os.path.relpath(xml_path, self.src_folder)[:-4])
+
+    def _is_member(self, path: str) -> bool:
+        return path.startswith(self.src_folder + os.sep) and not (
+                self.texture_folder is not None and path.startswith(self.texture_folder + os.sep))
+
+    def update(self, new_snapshot: SnapshotType) -> int:
+        """Packs everything that changed since the last snapshot and writes the archive. Returns the amount of packed
+        members."""
+        changed = {path for path, state in new_snapshot.items() if self.snapshot.get(path) != state}
+        removed = set(self.snapshot) - set(new_snapshot)
+        self.snapshot = new_snapshot
+
+        for path in removed:
+            if self._is_member(path):
+                self.members.pop(self._get_member_name(path), None)
+                self.dependencies.pop(path, None)
+
+        to_pack = {path for path in changed if self._is_member(path)}
+        for xml_path, dependencies in self.dependencies.items():
+            if not changed.isdisjoint(dependencies) or not removed.isdisjoint(dependencies):
+                to_pack.add(xml_path)
+
+        futures = {}
+        for path in sorted(to_pack):
+            name = self._get_member_name(path)
+            if self._is_scene(path):
+                futures[path] = self.executor.submit(_pack_scene, path, name, self._get_scene_texture_folder(path),
+                                                     self.endianness)
+            else:
+                futures[path] = self.executor.submit(_pack_file, path, name)
+
+        failed = 0
+        for path, future in futures.items():
+            packed_member, dependencies, error = future.result()
+            if self._is_scene(path):
+                self.dependencies[path] = dependencies
+            if packed_member is None:
+                # the old version stays in the archive so the game still has something to load
+                print(f"FAILED {os.path.relpath(path, self.src_folder)}: {error}")
+                failed += 1
+            else:
+                self.members[packed_member.name] = packed_member
+
+        if futures or removed:
+            self.write_archive()
+        return len(futures) - failed
+
+    def write_archive(self):
+        if self.encrypted:
+            from .archives.whyjustwhy import write_packed_archive
+        else:
+            from .archives.why import write_packed_archive
+        # replacing the file at once so the game never sees half an archive
+        with open(self.out_file + ".tmp", "wb") as archive_file:
+            write_packed_archive((self.members[name] for name in sorted(self.members)), archive_file)
+        os.replace(self.out_file + ".tmp", self.out_file)
+
+
+def _scan_changes(watcher: ProjectWatcher, notifier: PollingNotifier | InotifyNotifier,
+                  changed_paths: Optional[Set[str]], base: Optional[SnapshotType] = None) -> SnapshotType:
+    snapshot = watcher.take_snapshot(changed_paths, base)
+    # files can be created in a new folder before it is watched, so new folders are scanned once more
+    while added_folders := notifier.add_folders(watcher.folders):
+        snapshot = watcher.take_snapshot(set(added_folders), snapshot)
+    return snapshot
+
+
+def main(src_folder: str, out_file: str, texture_folder: Optional[str] = None, endianness: Endianness = "little",
+         encrypted: bool = False, workers: Optional[int] = None, interval: float = 1.0, debounce: float = 0.2,
+         polling: bool = False, once: bool = False, extensions: Sequence[str] = SCENE_EXTENSIONS):
+    watcher = ProjectWatcher(src_folder, out_file, texture_folder, endianness, encrypted, workers, extensions)
+    notifier = create_notifier(interval, polling)
+    try:
+        start_time = time.perf_counter()
+        packed_count = watcher.update(watcher.take_snapshot())
+        print(f"Packed {packed_count} files into {out_file} in {time.perf_counter() - start_time:.2f}s.")
+        if once:
+            return
+
+        print(f"Watching {src_folder} using {type(notifier).__name__}. Press Ctrl+C to stop.")
+        notifier.add_folders(watcher.folders)
+        while True:
+            # only inotify knows which paths changed, polling scans everything
+            changed_paths = notifier.wait()
+            if changed_paths is not None and not changed_paths:
+                continue
+            snapshot = _scan_changes(watcher, notifier, changed_paths)
+            if snapshot == watcher.snapshot:
+                continue
+            # editors often save in more than one step so waiting until nothing changes anymore
+            while True:
+                time.sleep(debounce)
+                new_snapshot = _scan_changes(watcher, notifier, notifier.wait(0), snapshot)
+                if new_snapshot == snapshot:
+                    break
+                snapshot = new_snapshot
+
+            start_time = time.perf_counter()
+            packed_count = watcher.update(snapshot)
+            print(f"Updated {packed_count} files in {time.perf_counter() - start_time:.2f}s.")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        notifier.close()
+        watcher.close()
+
+
+def run_from_args(args: Sequence[str]):
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        prog="watch(.py) Written by TKFRvision",
+        description="A program to keep an archive up to date while the files in a folder are edited. "
+                    "Scene xml files are converted with scene_enc, everything else is packed as is."
+    )
+
+    arg_parser.add_argument("in_folder", help="The folder to watch and pack.")
+    arg_parser.add_argument("out_file", help="The archive to create.")
+    arg_parser.add_argument("-t", dest="texture_folder",
+                            help="The texture folder to use. Like with scene_enc --batch every xml file has its own "
+                                 "sub folder.")
+    arg_parser.add_argument("-c", dest="endianness", action="store_const", const="big", default="little",
+                            help="Use this flag to create scene files for a console. Uses Big Endian.")
+    arg_parser.add_argument("-e", dest="encrypted", action="store_true",
+                            help="Create an encrypted archive like whyjustwhy for Disney Infinity 3.0.")
+    arg_parser.add_argument("-j", dest="jobs", type=int, help="Amount of processes to use.")
+    arg_parser.add_argument("--ext", dest="extensions", action="append",
+                            help="A scene file extension, level.oct.xml is converted for .oct. Can be used multiple "
+                                 f"times. Defaults to {', '.join(SCENE_EXTENSIONS)}.")
+    arg_parser.add_argument("--interval", type=float, default=1.0,
+                            help="How often to look for changes in seconds when polling.")
+    arg_parser.add_argument("--debounce", type=float, default=0.2,
+                            help="How long nothing has to change in seconds before rebuilding.")
+    arg_parser.add_argument("--poll", dest="polling", action="store_true",
+                            help="Look for changes every interval even if inotify is available.")
+    arg_parser.add_argument("--once", action="store_true", help="Only pack the archive once and exit.")
+    parsed_args = arg_parser.parse_args(args)
+
+    assert os.path.isdir(parsed_args.in_folder), "Input folder not found."
+    assert not os.path.isdir(parsed_args.out_file), "Output file destination is invalid."
+    if parsed_args.texture_folder is not None:
+        assert os.path.isdir(parsed_args.texture_folder), "Texture folder is invalid."
+
+    main(parsed_args.in_folder, parsed_args.out_file, parsed_args.texture_folder, parsed_args.endianness,
+         parsed_args.encrypted, parsed_args.jobs, parsed_args.interval, parsed_args.debounce, parsed_args.polling,
+         parsed_args.once, parsed_args.extensions or SCENE_EXTENSIONS)
@@ -0,0 +1,29 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
+
+from c2ditools.benchmarks.scene_gen import SceneGenParams, generate_scene  # noqa: E402
+
+
+@pytest.fixture
+def scene_bytes() -> bytes:
+    scene_stream = io.BytesIO()
+    generate_scene(scene_stream, SceneGenParams(depth=2, fan_out=3, blob_count=2, blob_size=0x100))
+    return scene_stream.getvalue()
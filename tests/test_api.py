@@ -0,0 +1,63 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import io
+from xml.etree import ElementTree
+
+from c2ditools import api
+from c2ditools.scene import scene_roundtrip
+
+
+def _make_shared_name_scene() -> bytes:
+    root = ElementTree.fromstring(
+        "<root_node>"
+        "<Texture><Name type=\"reference_string\">shared</Name><Data type=\"uint24_uint8_bin\" filepath=\"a.dds\"/>"
+        "</Texture>"
+        "<Texture><Name type=\"reference_string\">shared</Name><Data type=\"uint24_uint8_bin\" filepath=\"b.dds\"/>"
+        "</Texture>"
+        "</root_node>")
+    return api.encode_scene(root, "little", {"a.dds": b"first" * 0x10, "b.dds": b"second" * 0x10})
+
+
+def test_decode_scene_keeps_textures_with_the_same_name():
+    textures = {}
+    root = api.decode_scene(_make_shared_name_scene(), textures)
+    filepaths = [element.get("filepath") for element in root.iter("Data")]
+    assert filepaths == ["shared.dds", "shared_1.dds"]
+    assert textures == {"shared.dds": b"first" * 0x10, "shared_1.dds": b"second" * 0x10}
+
+
+def test_roundtrip_with_textures_with_the_same_name(tmp_path):
+    scene_path = tmp_path / "shared.oct"
+    scene_path.write_bytes(_make_shared_name_scene())
+    result = scene_roundtrip.check_file(str(scene_path), "shared.oct", measure_memory=False)
+    assert result["status"] == scene_roundtrip.STATUS_EXACT, result["detail"]
+
+
+def _get_events(data) -> list:
+    return [(kind, event.level, event.name, event.value, event.offset) for kind, event in api.iter_scene_events(data)]
+
+
+def test_scene_events_of_a_stream_not_at_the_start(tmp_path, scene_bytes):
+    expected_events = _get_events(scene_bytes)
+    assert expected_events
+
+    # a scene embedded in a bigger file, once mapped and once read
+    embedded_path = tmp_path / "embedded.bin"
+    embedded_path.write_bytes(b"prefix" + scene_bytes)
+    with open(embedded_path, "rb") as embedded_file:
+        embedded_file.seek(len(b"prefix"))
+        assert _get_events(embedded_file) == expected_events
+    embedded_stream = io.BytesIO(b"prefix" + scene_bytes)
+    embedded_stream.seek(len(b"prefix"))
+    assert _get_events(embedded_stream) == expected_events
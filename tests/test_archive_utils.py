@@ -0,0 +1,27 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import pytest
+
+from c2ditools.archives.archive_utils import ArchiveMetrics
+
+
+def test_saved_seconds_subtract_finding_duplicates():
+    metrics = ArchiveMetrics()
+    metrics.add("compress", 1.0, 0x100000)
+    metrics.add("find_duplicates", 0.75, 0x100000)
+    metrics.duplicate_size = 0x80000
+    assert metrics.get_saved_compress_seconds() == pytest.approx(0.5)
+    # hashing took longer than compressing the duplicates would have
+    assert metrics.to_dict()["saved_seconds"] == pytest.approx(-0.25)
+    assert "saved about -0.250s net (0.500s compressing - 0.750s finding them)" in metrics.format_report()
@@ -0,0 +1,86 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+from xml.etree import ElementTree
+
+import pytest
+
+from c2ditools import api, build
+from c2ditools.archives import why
+
+
+@pytest.fixture
+def project(tmp_path, scene_bytes):
+    (tmp_path / "scenes").mkdir()
+    (tmp_path / "assets").mkdir()
+    document, sidecar = api.scene_to_json(scene_bytes)
+    (tmp_path / "scenes" / "level.oct.json").write_text(json.dumps(document), encoding="utf-8")
+    (tmp_path / "scenes" / "level.oct.bin").write_bytes(sidecar)
+    (tmp_path / "assets" / "readme.txt").write_bytes(b"asset")
+    manifest_path = tmp_path / "manifest.json"
+    manifest_path.write_text(json.dumps({"output": "build/game.zip", "scenes": [{"src": "scenes"}],
+                                         "assets": [{"src": "assets"}]}), encoding="utf-8")
+    return manifest_path
+
+
+def test_json_without_sidecar_fails(project, capsys):
+    assert build.main(str(project), workers=1)
+    output_path = project.parent / "build" / "game.zip"
+    archive_data = output_path.read_bytes()
+
+    (project.parent / "scenes" / "stray.json").write_text("{}", encoding="utf-8")
+    assert not build.main(str(project), workers=1)
+    assert "FAILED stray" in capsys.readouterr().out
+    assert output_path.read_bytes() == archive_data
+
+
+def test_tmp_file_removed_on_error(project, monkeypatch):
+    def write_packed_archive(*_):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(why, "write_packed_archive", write_packed_archive)
+    with pytest.raises(RuntimeError):
+        build.main(str(project), workers=1)
+    assert not (project.parent / "build" / "game.zip.tmp").exists()
+
+
+def test_unchanged_files_are_reused(project, capsys):
+    assert build.main(str(project), workers=1)
+    capsys.readouterr()
+    (project.parent / "assets" / "readme.txt").write_bytes(b"changed")
+    assert build.main(str(project), workers=1)
+    assert "1 unchanged files reused, 0 scenes encoded, 0 from the cache, 1 assets packed" in capsys.readouterr().out
+
+
+def test_textures_outside_of_the_texture_folder_are_tracked(project, scene_bytes, capsys):
+    shared_folder = project.parent / "shared"
+    shared_folder.mkdir()
+    textures = {}
+    root = api.decode_scene(scene_bytes, textures)
+    for element in root.iter():
+        if filepath := element.get("filepath"):
+            (shared_folder / filepath).write_bytes(textures[filepath])
+            element.set("filepath", str(shared_folder / filepath))
+    (project.parent / "scenes" / "shared.oct.xml").write_text(ElementTree.tostring(root, encoding="unicode"),
+                                                              encoding="utf-8")
+    assert build.main(str(project), workers=1)
+    output_path = project.parent / "build" / "game.zip"
+    archive_data = output_path.read_bytes()
+
+    texture_path = shared_folder / next(iter(textures))
+    texture_path.write_bytes(bytes(byte ^ 0xFF for byte in texture_path.read_bytes()))
+    capsys.readouterr()
+    assert build.main(str(project), workers=1)
+    assert "1 scenes encoded" in capsys.readouterr().out
+    assert output_path.read_bytes() != archive_data
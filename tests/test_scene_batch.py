@@ -0,0 +1,46 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import pytest
+
+from c2ditools.scene import scene_dec, scene_enc, scene_swap
+
+
+@pytest.fixture
+def scene_folder(tmp_path, scene_bytes):
+    in_folder = tmp_path / "in"
+    in_folder.mkdir()
+    (in_folder / "good.oct").write_bytes(scene_bytes)
+    (in_folder / "broken.oct").write_bytes(b"not a scene")
+    return in_folder
+
+
+@pytest.mark.parametrize("tool, extra_args", [
+    (scene_dec, []),
+    (scene_dec, ["--format", "json"]),
+    (scene_swap, []),
+])
+def test_batch_exits_with_error_when_a_file_fails(scene_folder, tmp_path, tool, extra_args):
+    with pytest.raises(SystemExit) as exit_info:
+        tool.run_from_args([str(scene_folder), str(tmp_path / "out"), "--batch", "-j", "1"] + extra_args)
+    assert exit_info.value.code == 1
+
+
+def test_enc_batch_exits_with_error_when_a_file_fails(scene_folder, tmp_path):
+    (scene_folder / "broken.oct").unlink()
+    # no failures, so no exit
+    scene_dec.run_from_args([str(scene_folder), str(tmp_path / "xml"), "--batch", "-j", "1"])
+    (tmp_path / "xml" / "broken.oct.xml").write_text("<root_node><broken", encoding="utf-8")
+    with pytest.raises(SystemExit) as exit_info:
+        scene_enc.run_from_args([str(tmp_path / "xml"), str(tmp_path / "out"), "--batch", "-j", "1"])
+    assert exit_info.value.code == 1
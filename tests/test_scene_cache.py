@@ -0,0 +1,70 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from c2ditools.scene.scene_cache import SceneCache
+
+
+def _write_output(output_path: str, _):
+    with open(output_path, "wb") as output_file:
+        output_file.write(b"output")
+
+
+def _load_many(cache_dir: str, count: int):
+    cache = SceneCache(cache_dir)
+    for _ in range(count):
+        cache.load("key", lambda: b"data")
+
+
+def test_run_counts_hits_and_misses(tmp_path):
+    cache = SceneCache(str(tmp_path / "cache"))
+    out_path = str(tmp_path / "out")
+    assert not cache.run("key", out_path, _write_output)
+    assert cache.run("key", out_path, _write_output)
+    assert cache.run("key", out_path, _write_output)
+    with open(out_path, "rb") as output_file:
+        assert output_file.read() == b"output"
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 2, 1)
+
+
+def test_load_counts_hits_and_misses(tmp_path):
+    cache = SceneCache(str(tmp_path / "cache"))
+    assert cache.load("key", lambda: b"data") == (b"data", False)
+    assert cache.load("key", lambda: b"other") == (b"data", True)
+    assert cache.load("other key", lambda: b"other") == (b"other", False)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+
+def test_counters_dont_grow_and_can_be_reset(tmp_path):
+    cache = SceneCache(str(tmp_path / "cache"))
+    _load_many(cache.cache_dir, 100)
+    assert cache.stats()["hits"] == 99
+    cache_files = [os.path.join(folder_name, filename)
+                   for folder_name, _, filenames in os.walk(tmp_path / "cache") for filename in filenames]
+    # the entry and the counters, nothing grows with every lookup
+    assert sum(os.path.getsize(path) for path in cache_files) < 0x100
+    cache.reset_stats()
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (0, 0)
+
+
+def test_counters_are_shared_between_processes(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    SceneCache(cache_dir).load("key", lambda: b"data")
+    with ProcessPoolExecutor(4) as executor:
+        for future in [executor.submit(_load_many, cache_dir, 50) for _ in range(4)]:
+            future.result()
+    assert SceneCache(cache_dir).stats()["hits"] == 200
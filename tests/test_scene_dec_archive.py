@@ -0,0 +1,47 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import zipfile
+
+import pytest
+
+from c2ditools.archives.archive_reader import get_safe_member_path
+from c2ditools.scene import scene_dec
+
+
+@pytest.mark.parametrize("name", ["../../escaped.oct", "/abs.oct", "a/../../escaped.oct", "..\\escaped.oct"])
+def test_unsafe_member_paths(tmp_path, name):
+    assert get_safe_member_path(name, str(tmp_path)) is None
+
+
+def test_safe_member_path(tmp_path):
+    assert get_safe_member_path("levels/./a.oct", str(tmp_path)) == os.path.join(str(tmp_path), "levels", "a.oct")
+
+
+def test_archive_members_stay_in_output_folder(tmp_path, scene_bytes):
+    archive_path = tmp_path / "mod.zip"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("levels/good.oct", scene_bytes)
+        archive.writestr("../../escaped.oct", scene_bytes)
+        archive.writestr("/abs.oct", scene_bytes)
+    out_folder = tmp_path / "a" / "b" / "out"
+    texture_folder = tmp_path / "a" / "b" / "textures"
+
+    with pytest.raises(SystemExit) as exit_info:
+        scene_dec.run_from_args(["--archive", str(archive_path), "*", str(out_folder), "-t", str(texture_folder),
+                                 "-j", "1"])
+    assert exit_info.value.code == 1
+    assert (out_folder / "levels" / "good.oct.xml").is_file()
+    written = {path.name for path in tmp_path.rglob("*.xml")}
+    assert written == {"good.oct.xml"}
@@ -0,0 +1,39 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import pytest
+
+from c2ditools import api
+
+
+def _get_multi_value_node(document: dict) -> int:
+    return next(node_index for node_index, (_, _, _, value) in enumerate(document["nodes"])
+                if isinstance(value, list) and len(value) > 1)
+
+
+def test_json_roundtrip(scene_bytes):
+    document, sidecar = api.scene_to_json(scene_bytes)
+    assert api.json_to_scene(document, sidecar) == scene_bytes
+
+
+@pytest.mark.parametrize("change", [
+    lambda values: values[:-1],
+    lambda values: values + [values[-1]],
+    lambda values: values[0],
+])
+def test_wrong_amount_of_values_is_rejected(scene_bytes, change):
+    document, sidecar = api.scene_to_json(scene_bytes)
+    node_index = _get_multi_value_node(document)
+    document["nodes"][node_index][3] = change(document["nodes"][node_index][3])
+    with pytest.raises(ValueError, match=f"Node {node_index} needs"):
+        api.json_to_scene(document, sidecar)
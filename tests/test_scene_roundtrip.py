@@ -0,0 +1,33 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from c2ditools import api
+from c2ditools.scene import scene_roundtrip
+from c2ditools.scene.scene_json import JSON_FORMAT, JSON_VERSION
+
+
+def _make_scene(strings: list, nan_bits: str) -> bytes:
+    name_index, value_index = strings.index("Value"), strings.index("text")
+    document = {"format": JSON_FORMAT, "version": JSON_VERSION, "endianness": "little", "strings": strings, "nodes": [
+        [0, None, strings.index(""), None],
+        [1, "float", name_index, nan_bits],
+        [1, "string", name_index, value_index],
+    ]}
+    return api.json_to_scene(document, b"")
+
+
+def test_nan_with_another_string_order_is_structural():
+    original = _make_scene(["", "Value", "text"], "0x7fc00000")
+    assert scene_roundtrip.compare_structure(original, _make_scene(["", "text", "Value"], "0x7fc00000")) is None
+    assert scene_roundtrip.compare_structure(original, _make_scene(["", "text", "Value"], "0x7fc00001")) \
+        is not None
@@ -0,0 +1,70 @@
+#   Copyright 2024 TKFRvision
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import sys
+from xml.etree import ElementTree
+
+import pytest
+
+from c2ditools import api, watch
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    project_watcher = watch.ProjectWatcher(str(tmp_path / "src"), str(tmp_path / "game.zip"), workers=1)
+    yield project_watcher
+    project_watcher.close()
+
+
+def test_only_scene_xml_files_are_encoded(tmp_path, watcher, scene_bytes):
+    (tmp_path / "src").mkdir()
+    xml_string = ElementTree.tostring(api.decode_scene(scene_bytes), encoding="unicode")
+    (tmp_path / "src" / "level.oct.xml").write_text(xml_string, encoding="utf-8")
+    (tmp_path / "src" / "notes.xml").write_text("<notes/>", encoding="utf-8")
+    assert watcher.update(watcher.take_snapshot()) == 2
+    assert sorted(watcher.members) == ["level.oct", "notes.xml"]
+    assert watcher.members["notes.xml"].zip_info.file_size == len("<notes/>")
+
+
+def test_changed_paths_snapshot_matches_full_scan(tmp_path, watcher):
+    src_folder = tmp_path / "src"
+    (src_folder / "old" / "deep").mkdir(parents=True)
+    (src_folder / "old" / "deep" / "a.txt").write_bytes(b"a")
+    (src_folder / "b.txt").write_bytes(b"b")
+    watcher.snapshot = watcher.take_snapshot()
+
+    (src_folder / "old" / "deep" / "a.txt").unlink()
+    (src_folder / "old" / "deep").rmdir()
+    (src_folder / "new" / "deep").mkdir(parents=True)
+    (src_folder / "new" / "deep" / "c.txt").write_bytes(b"c")
+    (src_folder / "b.txt").write_bytes(b"bb")
+    # what inotify reports for the watched folders
+    changed_paths = {str(src_folder / "old" / "deep"), str(src_folder / "new"), str(src_folder / "b.txt")}
+    partial_snapshot = watcher.take_snapshot(changed_paths)
+    partial_folders = set(watcher.folders)
+    assert partial_snapshot == watcher.take_snapshot()
+    assert partial_folders == watcher.folders
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is only available on linux")
+def test_inotify_reports_changed_paths(tmp_path):
+    notifier = watch.InotifyNotifier(1.0)
+    try:
+        notifier.add_folders([str(tmp_path)])
+        assert notifier.wait(0) == set()
+        (tmp_path / "a.txt").write_bytes(b"a")
+        os.mkdir(tmp_path / "sub")
+        assert notifier.wait() == {str(tmp_path / "a.txt"), str(tmp_path / "sub")}
+    finally:
+        notifier.close()